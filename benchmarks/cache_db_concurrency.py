@@ -0,0 +1,105 @@
+"""Concurrent read/write throughput of the cache database.
+
+Runs reader threads (retrieve_by_search) and writer threads (put_to_cache) against
+a synthetic library, once with SQLite defaults (rollback journal, synchronous=FULL)
+and once with the tuned defaults of cache_db_config, and prints the results as JSON.
+
+    python -m benchmarks.cache_db_concurrency [--entries 5000] [--seconds 5]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.cache_db import Cache
+
+LEGACY_CONFIG = {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'mmap_size': 0}
+TUNED_CONFIG = {}
+
+
+class NullExporter(object):
+    """exporter doing nothing, the benchmark measures the database only"""
+
+    def is_loaded(self):
+        return True
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def create_library(cache: Cache, audio_dir: str, entries: int):
+    for i in range(entries):
+        filename = f"file{i}.mp3"
+        open(os.path.join(audio_dir, filename), 'w').close()
+        cache.put_to_cache(f"phrase%20{i}", id=f"id{i}", filename=filename, title=f"title {i}", artist=None)
+
+
+def run(config: dict, entries: int, seconds: float, readers: int, writers: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio_dir = os.path.join(tmpdir, 'audio')
+        os.mkdir(audio_dir)
+        db_config = dict(config, file=os.path.join(tmpdir, 'cache.db'), lookup_cache_size=0)
+        cache = Cache(NullExporter(), AppInfo(), audio_dir, db_config)
+        create_library(cache, audio_dir, entries)
+
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        stop = time.perf_counter() + seconds
+
+        def reader(n):
+            i, done = n, 0
+            while time.perf_counter() < stop:
+                cache.retrieve_by_search(f"phrase%20{i % entries}")
+                i, done = i + 7, done + 1
+            with lock:
+                counts['reads'] += done
+
+        def writer(n):
+            i, done, errors = 0, 0, 0
+            while time.perf_counter() < stop:
+                try:
+                    cache.add_searchphrase_to_id(f"id{i % entries}", f"extra%20{n}%20{i}")
+                    done += 1
+                except Exception:
+                    errors += 1
+                i += 1
+            with lock:
+                counts['writes'] += done
+                counts['errors'] += errors
+
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        cache.engine.dispose()
+
+    return {
+        'reads_per_second': round(counts['reads'] / seconds, 1),
+        'writes_per_second': round(counts['writes'] / seconds, 1),
+        'write_errors': counts['errors']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=5000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    result = {'entries': args.entries, 'seconds': args.seconds, 'readers': args.readers, 'writers': args.writers}
+    for (name, config) in [('legacy', LEGACY_CONFIG), ('tuned', TUNED_CONFIG)]:
+        result[name] = run(config, args.entries, args.seconds, args.readers, args.writers)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
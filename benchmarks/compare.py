@@ -0,0 +1,65 @@
+"""Compare two results of benchmarks.suite.
+
+Prints every measurement present in both with its change, rates (per_second) should grow,
+times (_ms) shrink. Changes beyond --threshold percent in the wrong direction are marked and
+make the exit code 1.
+
+    python -m benchmarks.compare old.json new.json [--threshold 10]
+"""
+import sys
+import json
+import argparse
+
+
+def flatten(result, prefix=''):
+    """the numeric leaves of the result as path -> value"""
+    values = {}
+    for (key, value) in result.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def compare(old: dict, new: dict, threshold: float) -> list:
+    """(path, old, new, change in percent, regressed) of the measurements of both results"""
+    old_values = flatten(old.get('sizes', {}))
+    new_values = flatten(new.get('sizes', {}))
+    rows = []
+    for path in sorted(old_values.keys() & new_values.keys()):
+        (before, after) = (old_values[path], new_values[path])
+        if before == 0:
+            continue
+        change = (after - before) / before * 100
+        if path.endswith('per_second'):
+            regressed = change < -threshold
+        elif path.endswith('_ms'):
+            regressed = change > threshold
+        else:
+            regressed = False
+        rows.append((path, before, after, round(change, 1), regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10, help='percent')
+    args = parser.parse_args(argv)
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    rows = compare(old, new, args.threshold)
+    for (path, before, after, change, regressed) in rows:
+        print(f"{'!' if regressed else ' '} {path:70} {before:>12} {after:>12} {change:+7.1f}%")
+    sys.exit(1 if any(r[-1] for r in rows) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+"""Benchmark suite of cache lookups, writes, exports and /searchv2 cache hits.
+
+Generates synthetic libraries of the given sizes (entries with several phrases each, files on disk)
+and measures retrieve_by_search, retrieve_by_id, fulltext_search, put_to_cache, the full export,
+CacheHTMLExporter.export and the /searchv2 cache hit throughput of every serving mode with concurrent
+clients and a download that never runs. The results are printed as JSON (and written to --output),
+compare two of them with benchmarks.compare.
+
+    python -m benchmarks.suite [--sizes 1000 10000 100000] [--phrases 3] [--seconds 3] [--output result.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from urllib.parse import quote
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.cache_db import Base, Cache, Entry, SearchPhrase
+from youtube_audio_provider.downloader import Downloader
+from youtube_audio_provider.webserver import Webserver
+from youtube_audio_provider.exporter.cache_html_exporter import CacheHTMLExporter
+from benchmarks.cache_db_concurrency import NullExporter
+from benchmarks.webserver_load import free_port, request, wait_until_serving, percentiles
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'da', 'fe', 'gu', 'ho', 'ja', 'be', 'zu', 'pi']
+
+
+class Library(object):
+    """a reproducible synthetic library: entries with title, artist, a file and several search phrases"""
+
+    def __init__(self, entries: int, phrases: int, seed: int):
+        rnd = random.Random(seed)
+        words = sorted({''.join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))) for _ in range(5000)})
+        self.entries = []
+        self.phrases = []  # (quoted phrase, entry index)
+        for i in range(entries):
+            artist = ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 2)))
+            title = ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 4)))
+            self.entries.append({'id': f'v{i:010d}', 'title': title, 'artist': artist, 'filename': f'v{i:010d}.mp3'})
+            variants = [f'{artist} {title}', f'{title} {artist}', title, f'{title} by {artist}']
+            for p in range(phrases):
+                self.phrases.append((quote(f'{variants[p % len(variants)]} {p // len(variants) or ""}'.strip()), i))
+        self.words = words
+
+    def create(self, directory: str, database: str):
+        """write the files and the database directly, much faster than put_to_cache per entry"""
+        for e in self.entries:
+            open(os.path.join(directory, e['filename']), 'w').close()
+        engine = create_engine(f'sqlite:///{database}')
+        Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(insert(Entry), self.entries)
+            connection.execute(insert(SearchPhrase), [{'phrase': p.casefold(), 'entry_id': self.entries[i]['id']}
+                                                      for (p, i) in self.phrases])
+        engine.dispose()
+
+
+def measure(fn, args_list, seconds: float) -> dict:
+    """call fn with the args in turn for about seconds, returns the rate and latency percentiles"""
+    timings = []
+    stop = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < stop or i == 0:
+        args = args_list[i % len(args_list)]
+        start = time.perf_counter()
+        fn(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+        i += 1
+    result = percentiles(timings)
+    result['per_second'] = round(len(timings) / (sum(timings) / 1000), 1)
+    return result
+
+
+def bench_cache(library: Library, tmpdir: str, seconds: float, rnd: random.Random) -> dict:
+    audio_dir = os.path.join(tmpdir, 'audio')
+    os.mkdir(audio_dir)
+    database = os.path.join(tmpdir, 'cache.db')
+    library.create(audio_dir, database)
+
+    results = {}
+    start = time.perf_counter()
+    cache = Cache(NullExporter(), AppInfo(), audio_dir, {'file': database, 'lookup_cache_size': 0})
+    # fills the fulltext index and scans the audio directory
+    results['startup_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    phrases = [(p,) for (p, i) in rnd.sample(library.phrases, min(len(library.phrases), 2000))]
+    ids = [(e['id'],) for e in rnd.sample(library.entries, min(len(library.entries), 2000))]
+    prefixes = [(quote(' '.join(w[:3] for w in rnd.sample(library.words, 2))),) for _ in range(200)]
+    results['retrieve_by_search'] = measure(cache.retrieve_by_search, phrases, seconds)
+    results['retrieve_by_search_missing'] = measure(cache.retrieve_by_search,
+                                                    [(f'unknown%20{n}',) for n in range(200)], seconds)
+    results['retrieve_by_id'] = measure(cache.retrieve_by_id, ids, seconds)
+    results['fulltext_search'] = measure(cache.fulltext_search, prefixes, seconds)
+
+    counter = iter(range(10 ** 9))
+
+    def put():
+        e = rnd.choice(library.entries)
+        cache.put_to_cache(f'new%20phrase%20{next(counter)}', **e)
+    results['put_to_cache'] = measure(put, [()], seconds)
+    with Session(cache.engine) as session:
+        results['full_export'] = measure(cache._export, [(session,)], seconds)
+
+    warm = Cache(NullExporter(), AppInfo(), audio_dir, {'file': database})
+    results['retrieve_by_search_lookup_cache'] = measure(warm.retrieve_by_search, phrases[:200], seconds)
+    warm.engine.dispose()
+    cache.engine.dispose()
+    return results
+
+
+def bench_html_export(library: Library, tmpdir: str, seconds: float) -> dict:
+    data = {p: library.entries[i]['filename'] for (p, i) in library.phrases}
+    titles = {e['filename']: e['title'] for e in library.entries}
+    config = {'cache_export_config': {'file': os.path.join(tmpdir, 'export.html'), 'debounce_seconds': 3600}}
+    exporter = CacheHTMLExporter(config, AppInfo())
+    results = {'export': measure(exporter.export, [(data, titles)], seconds)}
+    filenames = list(titles)
+    results['add_phrase'] = measure(lambda n: exporter.add_phrase(filenames[n % len(filenames)], f'added%20{n}'),
+                                    [(n,) for n in range(1000)], seconds)
+    results['flush'] = measure(exporter.flush, [()], seconds)
+    return results
+
+
+def bench_searchv2(library: Library, tmpdir: str, mode: str, seconds: float, clients: int,
+                   rnd: random.Random) -> dict:
+    audio_dir = os.path.join(tmpdir, 'audio')
+    os.mkdir(audio_dir)
+    database = os.path.join(tmpdir, 'cache.db')
+    library.create(audio_dir, database)
+    port = free_port()
+    config = {
+        'webserver_port': port,
+        'webserver_mode': mode,
+        'audio_path': audio_dir,
+        'cache_export_config': {},
+        'ydl_pool': {'prewarm': False}
+    }
+    info = AppInfo()
+    cache = Cache(NullExporter(), info, audio_dir, {'file': database})
+    ws = Webserver(config, Downloader(config, info), cache, info)
+
+    def no_download(search, quoted_search, job=None):
+        raise RuntimeError(f'benchmark phrase {search} is not cached')
+    ws._search_and_download = no_download
+    ws.start()
+    wait_until_serving(port)
+
+    paths = ['/searchv2/' + p for (p, i) in rnd.sample(library.phrases, min(len(library.phrases), 2000))]
+    lock = threading.Lock()
+    timings = []
+    errors = [0]
+    stop = time.perf_counter() + seconds
+
+    def client(n):
+        mine, failed, i = [], 0, n
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            if request(port, paths[i % len(paths)]) != 200:
+                failed += 1
+            mine.append((time.perf_counter() - start) * 1000)
+            i += 7
+        with lock:
+            timings.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ws.stop()
+    ws.join()
+    cache.engine.dispose()
+
+    result = percentiles(timings)
+    result['per_second'] = round(len(timings) / seconds, 1)
+    result['errors'] = errors[0]
+    return result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def available_modes() -> list:
+    modes = ['threaded']
+    try:
+        import uvicorn  # noqa: F401
+        import a2wsgi  # noqa: F401
+        modes.append('asgi')
+    except ImportError:
+        pass
+    return modes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--phrases', type=int, default=3, help='phrases per entry')
+    parser.add_argument('--seconds', type=float, default=3, help='per measurement')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent /searchv2 clients')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--skip-webserver', action='store_true')
+    parser.add_argument('--output', help='also write the result to this file')
+    args = parser.parse_args(argv)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log per request
+
+    result = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'phrases_per_entry': args.phrases,
+        'seconds': args.seconds,
+        'clients': args.clients,
+        'seed': args.seed,
+        'sizes': {}
+    }
+    for size in args.sizes:
+        library = Library(size, args.phrases, args.seed)
+        rnd = random.Random(args.seed)
+        sized = {}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sized['cache'] = bench_cache(library, tmpdir, args.seconds, rnd)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sized['html_export'] = bench_html_export(library, tmpdir, args.seconds)
+        if not args.skip_webserver:
+            for mode in available_modes():
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    sized[f'searchv2_{mode}'] = bench_searchv2(library, tmpdir, mode, args.seconds, args.clients, rnd)
+        result['sizes'][str(size)] = sized
+
+    json.dump(result, sys.stdout, indent=2)
+    print()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Cache hit latency of the webserver while a stream of cache misses is downloading.
+
+Starts the webserver in every serving mode with a fake download that just sleeps,
+keeps --miss-clients requests for uncached phrases running and measures the latency
+of /searchv2 cache hits and /audio requests meanwhile, printed as JSON.
+
+    python -m benchmarks.webserver_load [--seconds 10] [--miss-clients 64] [--download-seconds 2]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import http.client
+
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.cache_db import Cache
+from youtube_audio_provider.downloader import Downloader
+from youtube_audio_provider.webserver import Webserver
+from benchmarks.cache_db_concurrency import NullExporter
+
+MODES = ['threaded', 'asgi']
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def request(port: int, path: str) -> int:
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def wait_until_serving(port: int):
+    for i in range(100):
+        try:
+            request(port, '/info')
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('webserver did not start')
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    if not timings:
+        return {}
+    return {
+        'count': len(timings),
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p99_ms': round(timings[int(len(timings) * 0.99)], 3),
+        'max_ms': round(timings[-1], 3)
+    }
+
+
+def run(mode: str, seconds: float, miss_clients: int, hit_clients: int, download_seconds: float):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio_dir = os.path.join(tmpdir, 'audio')
+        os.mkdir(audio_dir)
+        with open(os.path.join(audio_dir, 'hit.mp3'), 'wb') as f:
+            f.write(os.urandom(256 * 1024))
+
+        port = free_port()
+        config = {
+            'webserver_port': port,
+            'webserver_mode': mode,
+            'audio_path': audio_dir,
+            'cache_export_config': {},
+            'download_scheduler': {'workers': 4, 'queue_size': 10000},
+            'ydl_pool': {'prewarm': False}
+        }
+        info = AppInfo()
+        cache = Cache(NullExporter(), info, audio_dir, {'file': os.path.join(tmpdir, 'cache.db')})
+        cache.put_to_cache('hit', id='hit', filename='hit.mp3', title='hit', artist=None)
+        ws = Webserver(config, Downloader(config, info), cache, info)
+
+        def fake_download(search, quoted_search, job=None):
+            time.sleep(download_seconds)
+            return {'filename': 'hit.mp3', 'by': 'download'}
+        ws._search_and_download = fake_download
+
+        ws.start()
+        wait_until_serving(port)
+
+        stop = time.perf_counter() + seconds
+        lock = threading.Lock()
+        results = {'searchv2_hit': [], 'audio': [], 'misses_done': 0}
+
+        def miss_client(n):
+            i = 0
+            while time.perf_counter() < stop:
+                request(port, f'/searchv2/miss-{n}-{i}')
+                i += 1
+            with lock:
+                results['misses_done'] += i
+
+        def hit_client(n):
+            timings = {'searchv2_hit': [], 'audio': []}
+            while time.perf_counter() < stop:
+                for (key, path) in [('searchv2_hit', '/searchv2/hit'), ('audio', '/audio/hit.mp3')]:
+                    start = time.perf_counter()
+                    request(port, path)
+                    timings[key].append((time.perf_counter() - start) * 1000)
+            with lock:
+                for (key, values) in timings.items():
+                    results[key] += values
+
+        threads = [threading.Thread(target=miss_client, args=(n,)) for n in range(miss_clients)]
+        threads += [threading.Thread(target=hit_client, args=(n,)) for n in range(hit_clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        ws.stop()
+        ws.join()
+        cache.engine.dispose()
+
+    return {
+        'searchv2_hit': percentiles(results['searchv2_hit']),
+        'audio': percentiles(results['audio']),
+        'misses_done': results['misses_done']
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--miss-clients', type=int, default=64)
+    parser.add_argument('--hit-clients', type=int, default=4)
+    parser.add_argument('--download-seconds', type=float, default=2)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    args = parser.parse_args(argv)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log per request
+
+    result = {'seconds': args.seconds, 'miss_clients': args.miss_clients, 'hit_clients': args.hit_clients,
+              'download_seconds': args.download_seconds}
+    for mode in args.modes:
+        result[mode] = run(mode, args.seconds, args.miss_clients, args.hit_clients, args.download_seconds)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Per request overhead of the YoutubeDL instances used for an id lookup.
+
+The extractor is mocked, so only the construction (or borrowing) of the YoutubeDL
+instance and the call into it is measured: once with a new instance per request
+(as without pools) and once with a pooled instance, printed as JSON.
+
+    python -m benchmarks.ydl_pool_overhead [--requests 200]
+"""
+import sys
+import json
+import time
+import argparse
+from unittest.mock import patch
+
+import yt_dlp
+
+from youtube_audio_provider.downloader import Downloader, create_search_pool
+
+FAKE_RESULT = {'entries': [{'id': 'dQw4w9WgXcQ', 'title': 'title', 'channel': 'channel'}]}
+
+
+def run(search_pool, requests: int):
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        ctx = Downloader.DownloadContext(None, 'audio', f'search {i}', search_pool=search_pool)
+        ctx.get_id()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'p50_ms': round(timings[len(timings) // 2], 3),
+        'p99_ms': round(timings[int(len(timings) * 0.99)], 3)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    result = {'requests': args.requests, 'yt_dlp': yt_dlp.version.__version__}
+    with patch.object(yt_dlp.YoutubeDL, 'extract_info', return_value=FAKE_RESULT):
+        result['per_request_instance'] = run(None, args.requests)
+        result['pooled'] = run(create_search_pool(1, max_uses=args.requests + 1), args.requests)
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
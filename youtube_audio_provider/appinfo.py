@@ -2,12 +2,20 @@ import os
 import json
 import datetime
 
+from youtube_audio_provider.metrics import Metrics
+from youtube_audio_provider.startup import StartupTimer
+
 
 class AppInfo(object):
 
-    def __init__(self):
+    def __init__(self, startup: StartupTimer = None):
         self.info = {}
+        # counters and histograms for /metrics, kept apart from the information of /info
+        self.metrics = Metrics()
+        # phases of the startup, components time their setup with it
+        self.startup = startup or StartupTimer()
         self._collect()
+        self.register('startup', self.startup.stats)
 
     def _collect(self):
         """collect some base information"""
@@ -0,0 +1,219 @@
+import json
+import time
+import asyncio
+import logging
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, parse_qs
+
+from werkzeug.datastructures import Headers
+
+from youtube_audio_provider.file_response import CHUNK_SIZE, FilePlan, iter_file_range
+from youtube_audio_provider.progressive import GrowingFile
+from youtube_audio_provider.output_profiles import UnknownProfileError
+from youtube_audio_provider.scheduler import QueueFullError
+from youtube_audio_provider.job_events import EVENT_STREAM_CONTENT_TYPE, EVENT_STREAM_HEADERS
+
+logger = logging.getLogger(__name__)
+
+SEARCH_PREFIX = '/searchv2/'
+JOBS_PREFIX = '/jobs/'
+SEARCH_JOB_PREFIX = '/jobs/search/'
+EVENTS_SUFFIX = '/events'
+
+
+class AsgiApp(object):
+    """ASGI application of the webserver. Cache hits of /searchv2 and audio files are served on the event loop,
+    lookups and file reads run on a small executor of their own, so they never wait behind downloads.
+    Cache misses wait for their download on a separate executor, event streams on one of their own, at most as many
+    streams as it has threads are open. Every other route is handed to the flask app."""
+
+    def __init__(self, webserver, config):
+        self.webserver = webserver
+        self.poll_interval = config.get('poll_interval', 0.2)
+        self.lookups = ThreadPoolExecutor(config.get('lookup_threads', 8), thread_name_prefix='asgi-lookup')
+        self.download_waiters = ThreadPoolExecutor(config.get('download_waiters', 64),
+                                                   thread_name_prefix='asgi-download')
+        # every open event stream waits on a thread of its own, more are refused
+        self.max_event_streams = config.get('event_streams', 16)
+        self.event_streams = ThreadPoolExecutor(self.max_event_streams, thread_name_prefix='asgi-events')
+        self._open_event_streams = 0
+        # optional dependencies, imported here so the threaded mode runs without them
+        from a2wsgi import WSGIMiddleware
+        self.wsgi = WSGIMiddleware(webserver.app, workers=config.get('wsgi_threads', 16))
+        self._server = None
+
+    def serve(self, host: str, port: int, sock=None):
+        """serve until shutdown, on sock if given (shared by pre-forked workers)"""
+        import uvicorn
+        uvicorn_config = uvicorn.Config(self, host=host, port=port, lifespan='off', log_config=None,
+                                        access_log=False)
+        self._server = uvicorn.Server(uvicorn_config)
+        self._server.run(sockets=[sock] if sock is not None else None)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.should_exit = True
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            path = scope['path']
+            if path.startswith(self.webserver.AUDIO_DIR):
+                return await self._observed(scope, send, '/audio/<path:path>',
+                                            lambda s: self.audio_file(scope, s, path[len(self.webserver.AUDIO_DIR):]))
+            search = path[len(SEARCH_PREFIX):]
+            if path.startswith(SEARCH_PREFIX) and scope['method'] == 'GET' and search and '/' not in search:
+                return await self._observed(scope, send, '/searchv2/<string:search>',
+                                            lambda s: self.searchv2(scope, s, search))
+            if path.startswith(JOBS_PREFIX) and path.endswith(EVENTS_SUFFIX) and scope['method'] == 'GET':
+                # event streams last as long as their download, they must not occupy a thread of the flask app
+                if path.startswith(SEARCH_JOB_PREFIX):
+                    search = path[len(SEARCH_JOB_PREFIX):-len(EVENTS_SUFFIX)]
+                    if search and '/' not in search:
+                        return await self._observed(scope, send, '/jobs/search/<string:search>/events',
+                                                    lambda s: self._limited(s, self.search_events(scope, s, search)))
+                job_id = path[len(JOBS_PREFIX):-len(EVENTS_SUFFIX)]
+                if job_id and '/' not in job_id:
+                    return await self._observed(scope, send, '/jobs/<string:job_id>/events',
+                                                lambda s: self._limited(s, self.job_events(scope, s, job_id)))
+        await self.wsgi(scope, receive, send)
+
+    async def _observed(self, scope, send, route: str, handler):
+        """run the handler of a native route, counted like the routes of the flask app"""
+        start = time.perf_counter()
+
+        async def observing_send(message):
+            if message['type'] == 'http.response.start':
+                self.webserver.observe_request(route, scope['method'], message['status'], time.perf_counter() - start)
+            await send(message)
+
+        return await handler(observing_send)
+
+    async def _limited(self, send, stream):
+        """run the event stream coroutine unless too many are open"""
+        # checked and counted before the first await, concurrent requests can't all pass the check
+        if self._open_event_streams >= self.max_event_streams:
+            stream.close()
+            return await self._send_json(send, 503, {'error': 'too many event streams'})
+        self._open_event_streams += 1
+        try:
+            return await stream
+        finally:
+            self._open_event_streams -= 1
+
+    def _cors_headers(self, always: bool = False):
+        if always or self.webserver.app.config['webserver_cors_allow']:
+            return [(b'access-control-allow-origin', b'*')]
+        return []
+
+    async def _send_json(self, send, status: int, body):
+        content = json.dumps(body).encode('utf-8')
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(content)).encode('latin-1'))]
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers + self._cors_headers()})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def _query_param(self, scope, name: str):
+        values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(name)
+        return values[0] if values else None
+
+    async def searchv2(self, scope, send, search: str):
+        """same as the flask route, only misses occupy a thread while their download runs"""
+        loop = asyncio.get_running_loop()
+        quoted_search = quote(search)
+        result = await loop.run_in_executor(self.lookups, self.webserver._find_in_cache, quoted_search)
+        status = 200
+        if result is None:
+            (status, result) = await loop.run_in_executor(self.download_waiters, self.webserver._search_miss,
+                                                          search, quoted_search)
+        if status == 200:
+            result = self.webserver._add_path(result, self._query_param(scope, 'profile'))
+        await self._send_json(send, status, result)
+
+    async def search_events(self, scope, send, search: str):
+        try:
+            job = self.webserver._submit_search_job(search)
+        except QueueFullError:
+            return await self._send_json(send, 429, {'error': 'too many downloads queued'})
+        await self._send_events(send, self.webserver.job_event_stream(job, 0))
+
+    async def job_events(self, scope, send, job_id: str):
+        job = self.webserver.downloader.scheduler.get(job_id)
+        if job is None:
+            return await self._send_json(send, 404, {'error': 'Not found'})
+        request_headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for (k, v) in scope['headers']])
+        last_event_id = request_headers.get('Last-Event-ID', '0')
+        await self._send_events(send, self.webserver.job_event_stream(
+            job, int(last_event_id) if last_event_id.isdigit() else 0))
+
+    async def _send_events(self, send, events):
+        """stream the encoded server-sent events, waiting for the next one on an event stream thread"""
+        headers = [(b'content-type', EVENT_STREAM_CONTENT_TYPE.encode('latin-1'))] \
+            + [(k.lower().encode('latin-1'), v.encode('latin-1')) for (k, v) in EVENT_STREAM_HEADERS.items()]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers + self._cors_headers(True)})
+        loop = asyncio.get_running_loop()
+        while (event := await loop.run_in_executor(self.event_streams, next, events, None)) is not None:
+            await send({'type': 'http.response.body', 'body': event, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def audio_file(self, scope, send, path: str):
+        if self.webserver.storage.path(path) is None:
+            return await self._send_json(send, 404, {'error': 'Not found'})
+
+        growing = self.webserver.downloader.progressive.get(path)
+        if growing is not None:
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            headers = [(b'content-type', content_type.encode('latin-1')), (b'cache-control', b'no-store')]
+            await send({'type': 'http.response.start', 'status': 200, 'headers': headers + self._cors_headers(True)})
+            if scope['method'] != 'HEAD':
+                await self._send_growing_file(send, growing)
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        request_headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for (k, v) in scope['headers']])
+        try:
+            profile = self.webserver.profiles.select(self._query_param(scope, 'profile'),
+                                                     request_headers.get('User-Agent'))
+        except UnknownProfileError as e:
+            return await self._send_json(send, 400, {'error': str(e)})
+        loop = asyncio.get_running_loop()
+        # a variant may have to be transcoded first, don't let that occupy a lookup thread
+        executor = self.lookups if profile is None else self.download_waiters
+        try:
+            plan = await loop.run_in_executor(executor, self.webserver._plan_audio_file, path, request_headers,
+                                              profile)
+        except FileNotFoundError:
+            return await self._send_json(send, 404, {'error': 'Not found'})
+        except RuntimeError:
+            logger.exception(f"serving {path} in profile {profile.name} failed")
+            return await self._send_json(send, 500, {'error': 'transcoding failed'})
+
+        headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for (k, v) in plan.headers.items()]
+        await send({'type': 'http.response.start', 'status': plan.status, 'headers': headers + self._cors_headers(True)})
+        if scope['method'] != 'HEAD' and plan.ranges:
+            await self._send_plan_body(send, plan)
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _send_plan_body(self, send, plan: FilePlan):
+        loop = asyncio.get_running_loop()
+        with open(plan.path, 'rb') as f:
+            for (i, (start, stop)) in enumerate(plan.ranges):
+                if plan.is_multipart():
+                    await send({'type': 'http.response.body', 'body': plan.part_headers[i], 'more_body': True})
+                chunks = iter_file_range(f, start, stop)
+                while (chunk := await loop.run_in_executor(self.lookups, next, chunks, None)) is not None:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if plan.is_multipart():
+                await send({'type': 'http.response.body', 'body': plan.closing, 'more_body': True})
+
+    async def _send_growing_file(self, send, growing: GrowingFile):
+        loop = asyncio.get_running_loop()
+        with growing.open() as f:
+            while True:
+                complete = growing.complete.is_set()
+                chunk = await loop.run_in_executor(self.lookups, f.read, CHUNK_SIZE)
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                elif complete:
+                    # nothing left after the writer completed the file
+                    return
+                else:
+                    await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import unittest
+from unittest.mock import MagicMock, AsyncMock, ANY
+
+import pytest
+
+from youtube_audio_provider.asgi_app import AsgiApp
+from youtube_audio_provider.storage import FlatStorage
+from youtube_audio_provider.webserver import Webserver
+
+# asgi mode needs the optional dependencies
+pytest.importorskip('uvicorn')
+pytest.importorskip('a2wsgi')
+
+
+def call(app, path, headers=None, method='GET'):
+    """run a request through the app, returns status, headers and body"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'headers': headers or []}
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return (start['status'], dict(start['headers']), body)
+
+
+def call_concurrently(app, paths):
+    """run requests at the same time, each send lets the others run. Returns their statuses"""
+    async def one(path):
+        statuses = []
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+            await asyncio.sleep(0)
+
+        await app({'type': 'http', 'method': 'GET', 'path': path, 'headers': []}, None, send)
+        return statuses[0]
+
+    async def all():
+        return await asyncio.gather(*(one(p) for p in paths))
+    return asyncio.run(all())
+
+
+class TestAsgiApp(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.tmpdir.name, 'song.mp3'), 'wb') as f:
+            f.write(b'0123456789')
+
+        self.webserver = MagicMock()
+        self.webserver.AUDIO_DIR = '/audio/'
+        self.webserver.storage = FlatStorage(self.tmpdir.name)
+        self.webserver.audio_max_age = 60
+        self.webserver.app.config = {'webserver_cors_allow': False}
+        self.webserver.downloader.progressive.get.return_value = None
+        self.webserver._add_path.side_effect = lambda r, profile=None: dict(r, path='/audio/' + r['filename'])
+        self.webserver.profiles.select.return_value = None  # the original
+        self.webserver.profiles.varies_by_user_agent = False
+        self.webserver._plan_audio_file.side_effect = \
+            lambda *args: Webserver._plan_audio_file(self.webserver, *args)
+        self.app = AsgiApp(self.webserver, {})
+        self.app.wsgi = AsyncMock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_audio_file(self):
+        (status, headers, body) = call(self.app, '/audio/song.mp3')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'0123456789')
+        self.assertEqual(headers[b'access-control-allow-origin'], b'*')
+        self.webserver.observe_request.assert_called_once_with('/audio/<path:path>', 'GET', 200, ANY)
+
+    def test_audio_file_range(self):
+        (status, headers, body) = call(self.app, '/audio/song.mp3', [(b'range', b'bytes=2-4')])
+
+        self.assertEqual(status, 206)
+        self.assertEqual(body, b'234')
+        self.assertEqual(headers[b'content-range'], b'bytes 2-4/10')
+
+    def test_audio_file_missing(self):
+        (status, headers, body) = call(self.app, '/audio/missing.mp3')
+
+        self.assertEqual(status, 404)
+
+    def test_searchv2_cache_hit_does_not_download(self):
+        self.webserver._find_in_cache.return_value = {'filename': 'song.mp3', 'by': 'cache'}
+
+        (status, headers, body) = call(self.app, '/searchv2/some song')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['path'], '/audio/song.mp3')
+        self.webserver._find_in_cache.assert_called_once_with('some%20song')
+        self.webserver._search_miss.assert_not_called()
+
+    def test_searchv2_miss_returns_status(self):
+        self.webserver._find_in_cache.return_value = None
+        self.webserver._search_miss.return_value = (429, {'error': 'too many downloads queued'})
+
+        (status, headers, body) = call(self.app, '/searchv2/other')
+
+        self.assertEqual(status, 429)
+        self.webserver._search_miss.assert_called_once_with('other', 'other')
+
+    def test_job_events_are_streamed(self):
+        self.webserver.job_event_stream.return_value = iter([b'event: status\ndata: {}\n\n', b': keepalive\n\n'])
+
+        (status, headers, body) = call(self.app, '/jobs/abc/events', [(b'last-event-id', b'3')])
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'text/event-stream; charset=utf-8')
+        self.assertEqual(body, b'event: status\ndata: {}\n\n: keepalive\n\n')
+        self.webserver.downloader.scheduler.get.assert_called_once_with('abc')
+        self.webserver.job_event_stream.assert_called_once_with(self.webserver.downloader.scheduler.get.return_value, 3)
+
+    def test_job_events_refused_when_too_many_streams_are_open(self):
+        self.app._open_event_streams = self.app.max_event_streams
+
+        (status, headers, body) = call(self.app, '/jobs/abc/events')
+
+        self.assertEqual(status, 503)
+        self.webserver.job_event_stream.assert_not_called()
+
+    def test_concurrent_event_streams_are_limited(self):
+        def slow_events(job, last_event_id):
+            time.sleep(0.1)
+            yield b'event: status\ndata: {}\n\n'
+        self.webserver.job_event_stream.side_effect = slow_events
+        self.app.max_event_streams = 2
+
+        statuses = call_concurrently(self.app, ['/jobs/abc/events'] * 5)
+
+        self.assertEqual(sorted(statuses), [200, 200, 503, 503, 503])
+        self.assertEqual(self.app._open_event_streams, 0)
+
+    def test_job_events_of_unknown_job(self):
+        self.webserver.downloader.scheduler.get.return_value = None
+
+        (status, headers, body) = call(self.app, '/jobs/abc/events')
+
+        self.assertEqual(status, 404)
+
+    def test_other_routes_are_handed_to_flask(self):
+        asyncio.run(self.app({'type': 'http', 'method': 'GET', 'path': '/info', 'headers': []}, None, None))
+
+        self.app.wsgi.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,23 @@
-import os
+import time
 import logging
+import contextlib
+import threading
 from collections import namedtuple
 from typing import List, Optional
 
-from sqlalchemy import ForeignKey, String, func, create_engine, select, or_, and_
+from sqlalchemy import ForeignKey, String, func, create_engine, event, select, delete, or_, and_
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert
 
 from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.lookup_cache import LookupCache
+from youtube_audio_provider.fulltext_index import FulltextIndex
+from youtube_audio_provider.phrase_matcher import PhraseMatcher
+from youtube_audio_provider.shared_state import SharedState
+from youtube_audio_provider.storage import Storage, FlatStorage
+from youtube_audio_provider.eviction import Evictor
+from youtube_audio_provider.reconciler import Reconciler
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +34,7 @@ class Entry(Base):
     id: Mapped[str] = mapped_column(String(20), primary_key=True)
     title: Mapped[Optional[str]]
     artist: Mapped[Optional[str]]
-    filename: Mapped[Optional[str]]
+    filename: Mapped[Optional[str]] = mapped_column(index=True)
 
     phrases: Mapped[List["SearchPhrase"]] = relationship(
         back_populates="entry", cascade="all, delete-orphan"
@@ -35,29 +45,224 @@ class SearchPhrase(Base):
     __tablename__ = "phrase"
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    phrase: Mapped[str]
+    phrase: Mapped[str] = mapped_column(index=True)
 
-    entry_id: Mapped[str] = mapped_column(ForeignKey(Entry.__tablename__ + ".id"))
+    entry_id: Mapped[str] = mapped_column(ForeignKey(Entry.__tablename__ + ".id"), index=True)
     entry: Mapped["Entry"] = relationship(back_populates="phrases")
 
 
+class Resolution(Base):
+    """result of the youtube search for a phrase, video_id is None if the search found nothing or failed"""
+    __tablename__ = "resolution"
+
+    phrase: Mapped[str] = mapped_column(primary_key=True)
+    video_id: Mapped[Optional[str]] = mapped_column(String(20))
+    title: Mapped[Optional[str]]
+    channel: Mapped[Optional[str]]
+    artist: Mapped[Optional[str]]
+    error: Mapped[Optional[str]]
+    resolved_at: Mapped[float] = mapped_column(index=True)
+
+
+class Usage(Base):
+    """when and how often the file of an entry was used, kept apart from entry so it needs no migration"""
+    __tablename__ = "usage"
+
+    filename: Mapped[str] = mapped_column(primary_key=True)
+    last_access: Mapped[float]
+    hits: Mapped[int] = mapped_column(default=0)
+
+
 class Cache(object):
 
-    def __init__(self, exporter, info: AppInfo, audio_file_directory):
+    # phrases per query of retrieve_by_searches
+    BATCH_QUERY_SIZE = 500
+
+    def __init__(self, exporter, info: AppInfo, audio_file_directory, config=None, shared: SharedState = None,
+                 storage: Storage = None, fast_start: bool = False):
+        """with fast_start counting the entries, filling the fulltext index and scanning the audio directory run in
+        the background, lookups work meanwhile (files are checked on disk)"""
+        config = config or {}
+        # other worker processes change the database as well, only the primary one exports
+        self.shared = shared
+        self.export_owner = shared is None or shared.is_primary
+
+        self.query_duration = info.metrics.histogram(
+            'yap_db_query_duration_seconds', 'time of the sql statements of the cache database', ('statement',))
+        self.export_duration = info.metrics.histogram(
+            'yap_export_duration_seconds', 'time to export a change of the cache', ('kind',))
+
         # db setup
-        self.databasefile = "cache.db"
-        db_uri = f"sqlite:///{self.databasefile}"
-        self.engine = create_engine(db_uri, echo=True)
-        Base.metadata.create_all(self.engine)
+        self.databasefile = config.get('file', "cache.db")
+        self.engine = self._create_engine(config)
+        with self._setup_lock():
+            Base.metadata.create_all(self.engine)
+            # create_all skips tables that exist already, add indexes introduced later
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(self.engine, checkfirst=True)
 
         self.appinfo = info
+        self.appinfo.register('cache_db', self.db_info)
         self.audio_file_directory = audio_file_directory
+        self.storage = storage or FlatStorage(audio_file_directory)
 
         self.exporter = exporter
 
+        # simplified phrase -> (entry id, entry dict) of recent hits
+        self.lookup_cache = LookupCache(config.get('lookup_cache_size', 1024), info, 'cache_lookup')
+
+        self.fulltext_index = FulltextIndex(self.engine)
+
+        # spelling variants of known phrases, loaded on first use
+        matching_config = config.get('phrase_matching', {})
+        self.phrase_matching = matching_config.get('enabled', True)
+        self.phrase_matcher = PhraseMatcher(matching_config, info)
+        self._phrase_matcher_lock = threading.Lock()
+        self._phrase_matcher_loaded = False
+
+        # phrase -> youtube search result, spares the search on retries and after deletions
+        resolution_config = config.get('resolution_cache', {})
+        self.resolution_enabled = resolution_config.get('enabled', True)
+        self.resolution_ttl = resolution_config.get('ttl', 7 * 24 * 60 * 60)
+        self.resolution_no_result_ttl = resolution_config.get('no_result_ttl', 60 * 60)
+        self.resolution_error_ttl = resolution_config.get('error_ttl', 60)
+        self.resolution_stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'stored': 0}
+        self.appinfo.register('resolution_cache', self.resolution_stats)
+
+        self._generation_lock = threading.Lock()
+        self._generation = shared.generation() if shared is not None else 0
+
+        # which files exist, only the primary worker indexes orphans
+        self.reconciler = Reconciler(config.get('reconcile', {}), self, self.storage, info, self.export_owner)
+        if (fast_start):
+            threading.Thread(target=self._finish_setup, args=(True,), name='cache-setup', daemon=True).start()
+        else:
+            self._finish_setup(False)
+
+        # size bound of the audio files, only the primary worker evicts
+        self.evictor = Evictor(config.get('quota', {}), self, self.storage, info, self.export_owner)
+
+        if (shared is not None):
+            threading.Thread(target=self._watch_generation, name='cache-generation', daemon=True).start()
+
+    def _finish_setup(self, background: bool):
+        try:
+            with self.appinfo.startup.phase('cache_setup', background):
+                with self._setup_lock(), Session(self.engine) as session:
+                    self._update_cache_size(session)
+                    self._fill_fulltext_index(session)
+                    self._prune_resolutions(session)
+                self.reconciler.start()
+        except Exception:
+            if (not background):
+                raise
+            logger.exception("setting up the cache failed")
+
+    def _setup_lock(self):
+        """serializes creating and filling the tables between the worker processes"""
+        if (self.shared is None):
+            return contextlib.nullcontext()
+        return self.shared.lock('cache-setup')
+
+    def _watch_generation(self):
+        while True:
+            time.sleep(self.shared.poll_interval)
+            try:
+                self.sync_shared()
+            except Exception:
+                logger.exception("syncing with the other workers failed")
+
+    def sync_shared(self):
+        """drop what is held in memory if another worker changed the database, the primary exports again"""
+        generation = self.shared.generation()
+        with self._generation_lock:
+            if (generation == self._generation):
+                return
+            self._generation = generation
+        logger.debug(f"cache changed by another worker, generation {generation}")
+        self._drop_local_state()
         with Session(self.engine) as session:
+            if (self.export_owner):
+                self._export(session)
             self._update_cache_size(session)
 
+    def _publish_change(self) -> bool:
+        """tell the other workers about a change, returns whether they changed something since the last sync"""
+        if (self.shared is None):
+            return False
+        (before, after) = self.shared.bump()
+        with self._generation_lock:
+            stale = before != self._generation
+            self._generation = after
+        return stale
+
+    def _drop_local_state(self):
+        self.lookup_cache.clear()
+        with self._phrase_matcher_lock:
+            self.phrase_matcher.clear()
+            self._phrase_matcher_loaded = False
+
+    def _fill_fulltext_index(self, session: Session):
+        if (not self.fulltext_index.enabled or not self.fulltext_index.is_empty(session)):
+            return
+        stmt = (
+            select(Entry, SearchPhrase)
+            .join(SearchPhrase.entry)
+        )
+        rows = [(p.id, p.phrase, e) for (e, p) in session.execute(stmt).all()]
+        if (rows):
+            logger.info(f"building fulltext index for {len(rows)} phrases")
+            self.fulltext_index.rebuild(session, rows)
+            session.commit()
+
+    def _prune_resolutions(self, session: Session):
+        oldest = time.time() - max(self.resolution_ttl, self.resolution_no_result_ttl, self.resolution_error_ttl)
+        session.execute(delete(Resolution).where(Resolution.resolved_at < oldest))
+        session.commit()
+
+    def _create_engine(self, config):
+        db_uri = f"sqlite:///{self.databasefile}"
+        busy_timeout = config.get('busy_timeout', 5000)  # ms
+        pragmas = {
+            'journal_mode': config.get('journal_mode', 'WAL'),  # readers don't block the writer
+            'synchronous': config.get('synchronous', 'NORMAL'),
+            'mmap_size': config.get('mmap_size', 64 * 1024 * 1024),
+            'busy_timeout': busy_timeout
+        }
+        engine_args = {
+            'echo': config.get('echo', False),
+            'query_cache_size': config.get('query_cache_size', 500),
+            'connect_args': {
+                'check_same_thread': False,  # connections are handed between the server threads by the pool
+                'timeout': busy_timeout / 1000,
+                'cached_statements': config.get('cached_statements', 256)
+            }
+        }
+        if (self.databasefile != ':memory:'):
+            engine_args['pool_size'] = config.get('pool_size', 8)
+            engine_args['max_overflow'] = config.get('max_overflow', 8)
+        engine = create_engine(db_uri, **engine_args)
+
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for (key, value) in pragmas.items():
+                cursor.execute(f"PRAGMA {key}={value}")
+            cursor.close()
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def observe_query(conn, cursor, statement, parameters, context, executemany):
+            start = conn.info['query_start'].pop()
+            self.query_duration.observe(time.perf_counter() - start, statement.split(None, 1)[0].upper())
+
+        self.db_info = {'file': self.databasefile, 'pragmas': pragmas}
+        return engine
+
     def _entry_to_dict(self, e: Entry):
         res = {}
         res['title'] = e.title
@@ -74,12 +279,16 @@ class Cache(object):
     def _simplify_quoted_search(self, quoted_search: str):
         return quoted_search.casefold()
 
+    def simplify_quoted_search(self, quoted_search: str):
+        """the key a search phrase is stored under"""
+        return self._simplify_quoted_search(quoted_search)
+
     def _check_file_exists(self, filename: str):
-        path = os.path.join(self.audio_file_directory, filename)
-        logger.debug(f"looking for file '{path}'")
-        if (os.path.exists(path)):
-            return True
-        return False
+        return self.reconciler.exists(filename)
+
+    def file_missing(self, filename: str):
+        """the file was found missing while serving it"""
+        self.reconciler.file_removed(filename)
 
     def _find_entry_with_searchphrase(self, session: Session, search_phrase: str):
         stmt = (
@@ -95,13 +304,88 @@ class Cache(object):
 
         simplified_string = self._simplify_quoted_search(quoted_search)
 
+        cached = self.lookup_cache.get(simplified_string)
+        if (cached is not None):
+            (id, d) = cached
+            if (self._check_file_exists(d['filename'])):
+                return dict(d)
+            self.lookup_cache.invalidate(simplified_string)
+            return None
+
         with Session(self.engine) as session:
             e = self._find_entry_with_searchphrase(session, simplified_string)
             if (e is not None):
                 if (self._check_file_exists(e.filename)):
                     logger.debug(f"entries file exists {e.filename} for phrase {quoted_search}")
-                    return self._entry_to_dict(e)
+                    d = self._entry_to_dict(e)
+                    self.lookup_cache.put(simplified_string, (e.id, d))
+                    return dict(d)
+
+        return None
 
+    def retrieve_by_searches(self, quoted_searches: List[str]) -> dict:
+        ''' get the values of many phrases at once, quoted search -> dict or None.
+        Phrases not in the lookup cache are found with one query per chunk, not one per phrase '''
+        results = {}
+        pending = {}  # simplified phrase -> quoted searches
+        for quoted_search in quoted_searches:
+            simplified_string = self._simplify_quoted_search(quoted_search)
+            cached = self.lookup_cache.get(simplified_string)
+            if (cached is not None and self._check_file_exists(cached[1]['filename'])):
+                results[quoted_search] = dict(cached[1])
+                continue
+            if (cached is not None):
+                self.lookup_cache.invalidate(simplified_string)
+            results[quoted_search] = None
+            pending.setdefault(simplified_string, []).append(quoted_search)
+
+        phrases = list(pending.keys())
+        with Session(self.engine) as session:
+            # stay well below the limit of sqlite host parameters
+            for i in range(0, len(phrases), Cache.BATCH_QUERY_SIZE):
+                stmt = (
+                         select(SearchPhrase.phrase, Entry)
+                         .join(SearchPhrase.entry)
+                         .where(SearchPhrase.phrase.in_(phrases[i:i + Cache.BATCH_QUERY_SIZE]))
+                    )
+                for (phrase, e) in session.execute(stmt):
+                    if (results[pending[phrase][0]] is not None or not self._check_file_exists(e.filename)):
+                        continue
+                    d = self._entry_to_dict(e)
+                    self.lookup_cache.put(phrase, (e.id, d))
+                    for quoted_search in pending[phrase]:
+                        results[quoted_search] = dict(d)
+        return results
+
+    def _get_phrase_matcher(self) -> PhraseMatcher:
+        with self._phrase_matcher_lock:
+            if (not self._phrase_matcher_loaded):
+                with Session(self.engine) as session:
+                    for (phrase, entry_id) in session.execute(select(SearchPhrase.phrase, SearchPhrase.entry_id)):
+                        self.phrase_matcher.add(phrase, entry_id)
+                self._phrase_matcher_loaded = True
+        return self.phrase_matcher
+
+    def retrieve_by_similar_search(self, quoted_search: str) -> dict | None:
+        ''' get the entry of a phrase equal to quoted_search after normalization (word order, punctuation, accents,
+        stop words) or similar to it, the result contains the 'id' of the entry and whether the normalized phrase
+        is the same ('exact') '''
+        if (not self.phrase_matching):
+            return None
+
+        match = self._get_phrase_matcher().match(quoted_search)
+        if (match is None):
+            return None
+
+        (id, similarity) = match
+        with Session(self.engine) as session:
+            e = session.get(Entry, id)
+            if (e is not None and self._check_file_exists(e.filename)):
+                logger.debug(f"entry {id} matches phrase {quoted_search} with similarity {similarity:.2f}")
+                res = self._entry_to_dict(e)
+                res['id'] = id
+                res['exact'] = similarity == 1.0
+                return res
         return None
 
     def retrieve_by_id(self, id: str) -> dict | None:
@@ -114,15 +398,84 @@ class Cache(object):
             if (e is not None):
                 if (self._check_file_exists(e.filename)):
                     logger.debug(f"entries file exists {e.filename} for id {id}")
-                else:
-                    logger.error(f"entries file does not exist {e.filename} for id {id}")
-                return self._entry_to_dict(e)
+                    return self._entry_to_dict(e)
+                logger.warning(f"entries file does not exist {e.filename} for id {id}")
         return None
 
-    def _cache_updated(self, session):
-        self._export(session)
+    def _resolution_ttl(self, r: Resolution) -> float:
+        if (r.video_id is not None):
+            return self.resolution_ttl
+        if (r.error is None):
+            return self.resolution_no_result_ttl
+        return self.resolution_error_ttl
+
+    def retrieve_resolution(self, quoted_search: str) -> dict | None:
+        """the unexpired youtube search result for the phrase: a dict with 'id', 'title', 'channel' and 'artist',
+        or with an 'id' of None and the 'error' if the search found nothing (error None) or failed"""
+        if (not self.resolution_enabled):
+            return None
+        simplified_string = self._simplify_quoted_search(quoted_search)
+        with Session(self.engine) as session:
+            r = session.get(Resolution, simplified_string)
+            if (r is None or time.time() - r.resolved_at > self._resolution_ttl(r)):
+                self.resolution_stats['misses'] += 1
+                return None
+            self.resolution_stats['hits' if r.video_id is not None else 'negative_hits'] += 1
+            return {'id': r.video_id, 'title': r.title, 'channel': r.channel, 'artist': r.artist, 'error': r.error}
+
+    def put_resolution(self, quoted_search: str, info: dict | None, error: str = None):
+        """remember the search result info of the phrase, an info of None means nothing was found
+        or the search failed with error"""
+        if (not self.resolution_enabled):
+            return
+        info = info or {}
+        r = Resolution(phrase=self._simplify_quoted_search(quoted_search),
+                       video_id=info.get('id'),
+                       title=info.get('title'),
+                       channel=info.get('channel'),
+                       artist=info.get('artist'),
+                       error=error,
+                       resolved_at=time.time())
+        with Session(self.engine) as session:
+            session.merge(r)
+            session.commit()
+        self.resolution_stats['stored'] += 1
+
+    def _cache_updated(self, session, filename: str, phrase: str | None, title: str = None,
+                       renamed_from: str = None):
+        """export the change of filename, where a phrase of None means the entry was removed and renamed_from the
+        previous filename of the entry"""
+        stale = self._publish_change()
+        if (stale):
+            self._drop_local_state()
+        if (self.export_owner and self.exporter.is_loaded() and not stale):
+            with self.export_duration.time('incremental'):
+                if (renamed_from is not None):
+                    self._move_export_row(session, renamed_from, filename, title)
+                elif (phrase is None):
+                    self.exporter.remove_entry(filename)
+                else:
+                    self.exporter.add_phrase(filename, phrase, title)
+        elif (self.export_owner):
+            with self.export_duration.time('full'):
+                self._export(session)
         self._update_cache_size(session)
 
+    def _move_export_row(self, session, old_filename: str, filename: str, title: str):
+        """the row of an entry moves to its new filename with all of its phrases"""
+        self.exporter.remove_entry(old_filename)
+        stmt = (
+            select(SearchPhrase.phrase)
+            .join(SearchPhrase.entry)
+            .where(Entry.filename == filename)
+        )
+        for phrase in session.scalars(stmt).all():
+            self.exporter.add_phrase(filename, phrase, title)
+
+    def flush(self):
+        """write out pending exports"""
+        self.exporter.flush()
+
     def _update_cache_size(self, session):
         statement = select(func.count()).select_from(Entry)
         count: int = session.execute(statement).scalar()
@@ -130,6 +483,7 @@ class Cache(object):
 
     def _export(self, session):
         data = {}
+        titles = {}
         stmt = (
             select(Entry, SearchPhrase)
             .join(SearchPhrase.entry)
@@ -137,7 +491,9 @@ class Cache(object):
         # compact / create a (legacy) dict phrase -> filename
         for (e, p) in session.execute(stmt).all():
             data[p.phrase] = e.filename
-        self.exporter.export(data)
+            if (e.title):
+                titles[e.filename] = e.title
+        self.exporter.export(data, titles)
 
     def put_to_cache(self, quoted_search: str, **kwargs):
         ''' put into cache the quoted_search string together with the filename '''
@@ -148,20 +504,42 @@ class Cache(object):
         with Session(self.engine) as session:
             stmt = (
                  select(Entry)
-                 .where(Entry.filename == kwargs.get('filename'))
+                 .where(Entry.id == kwargs.get('id'))
             )
             e = session.scalars(stmt).first()
             # get or create entry
-            if (e is None):
+            created = e is None
+            renamed_from = None
+            if (created):
                 e = self._dict_to_entry(kwargs)
                 session.add(e)
+            elif (kwargs.get('filename') and e.filename != kwargs['filename']):
+                # downloaded again after the file went missing
+                renamed_from = e.filename
+                e.filename = kwargs['filename']
+                created = True
+                if (self.fulltext_index.enabled):
+                    self.fulltext_index.update_entry(session, e)
+                self.lookup_cache.invalidate_values(lambda v: v[0] == e.id)
+            elif (self._fill_missing_details(session, e, kwargs)):
+                self.lookup_cache.invalidate_values(lambda v: v[0] == e.id)
 
             # create phrase
             phrase = SearchPhrase(phrase=simplified_string, entry=e)
             session.add(phrase)
+            filename = e.filename
+            title = e.title
+            self._add_to_fulltext_index(session, phrase, e)
+
+            entry_id = e.id
 
             session.commit()
-            self._cache_updated(session)
+            self.lookup_cache.invalidate(simplified_string)
+            self.phrase_matcher.add(simplified_string, entry_id)
+            self._cache_updated(session, filename, simplified_string, title, renamed_from)
+        self.reconciler.file_added(filename)
+        if (created):
+            self.evictor.file_added(filename)
 
     def add_searchphrase_to_id(self, id, quoted_search):
         simplified_string = self._simplify_quoted_search(quoted_search)
@@ -177,9 +555,33 @@ class Cache(object):
 
             phrase = SearchPhrase(phrase=simplified_string, entry=e)
             session.add(phrase)
+            filename = e.filename
+            title = e.title
+            self._add_to_fulltext_index(session, phrase, e)
+
+            entry_id = e.id
 
             session.commit()
-            self._cache_updated(session)
+            self.lookup_cache.invalidate(simplified_string)
+            self.phrase_matcher.add(simplified_string, entry_id)
+            self._cache_updated(session, filename, simplified_string, title)
+
+    def _fill_missing_details(self, session: Session, e: Entry, d) -> bool:
+        """set the title and artist of an entry that has none, e.g. indexed from an orphan file before the download
+        registered it, returns whether anything changed"""
+        filled = False
+        for field in ('title', 'artist'):
+            if (getattr(e, field) is None and d.get(field)):
+                setattr(e, field, d[field])
+                filled = True
+        if (filled and self.fulltext_index.enabled):
+            self.fulltext_index.update_entry(session, e)
+        return filled
+
+    def _add_to_fulltext_index(self, session: Session, phrase: SearchPhrase, e: Entry):
+        if (self.fulltext_index.enabled):
+            session.flush()  # assigns the phrase id
+            self.fulltext_index.add(session, phrase.id, phrase.phrase, e)
 
     def remove_from_cache_by_search(self, quoted_search):
         simplified_string = self._simplify_quoted_search(quoted_search)
@@ -187,15 +589,88 @@ class Cache(object):
         with Session(self.engine) as session:
             e = self._find_entry_with_searchphrase(session, simplified_string)
             if (e is not None):
-                filename = e.filename
-                session.delete(e)  # should automagically delete the phrases
-                session.commit()
-                self._cache_updated(session)
-                return filename
+                return self._remove_entry(session, e)
+
+            return False
 
+    def remove_by_id(self, id):
+        """remove the entry with all its phrases, returns its filename or False if there is no such entry"""
+        with Session(self.engine) as session:
+            e = session.get(Entry, id)
+            if (e is not None):
+                return self._remove_entry(session, e)
             return False
 
-    def fulltext_search(self, quoted_search: str):
+    def _remove_entry(self, session: Session, e: Entry) -> str:
+        filename = e.filename
+        id = e.id
+        session.delete(e)  # should automagically delete the phrases
+        if (self.fulltext_index.enabled):
+            self.fulltext_index.remove_entry(session, id)
+        session.execute(delete(Usage).where(Usage.filename == filename))
+        session.commit()
+        self.reconciler.file_removed(filename)
+        # all phrases of the entry are gone
+        self.lookup_cache.invalidate_values(lambda v: v[0] == id)
+        self.phrase_matcher.remove_entry(id)
+        self._cache_updated(session, filename, None)
+        return filename
+
+    def entry_filenames(self) -> set:
+        """the filenames of all entries"""
+        with Session(self.engine) as session:
+            return set(session.scalars(select(Entry.filename).where(Entry.filename.is_not(None))))
+
+    def index_orphans(self, filenames: List[str]) -> int:
+        """add entries for files named '<youtube id>.<ext>' that have none, returns how many were added"""
+        added = []
+        with Session(self.engine) as session:
+            for filename in filenames:
+                id = filename.rsplit('.', 1)[0]
+                if (session.get(Entry, id) is None):
+                    session.add(Entry(id=id, filename=filename))
+                    added.append(filename)
+            session.commit()
+            self._update_cache_size(session)
+        for filename in added:
+            # the file counts towards the quota from now on
+            self.evictor.file_added(filename)
+        return len(added)
+
+    def record_access(self, filename: str):
+        """count a use of the file, for the eviction"""
+        self.evictor.record_access(filename)
+
+    def store_accesses(self, accesses: dict):
+        """add the counted accesses (filename -> (last access, hits)) to the usage of the entries"""
+        with Session(self.engine) as session:
+            stmt = insert(Usage).values([{'filename': filename, 'last_access': last_access, 'hits': hits}
+                                         for (filename, (last_access, hits)) in accesses.items()])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Usage.filename],
+                set_={'last_access': func.max(Usage.last_access, stmt.excluded.last_access),
+                      'hits': Usage.hits + stmt.excluded.hits})
+            session.execute(stmt)
+            session.commit()
+
+    def eviction_candidates(self) -> List[dict]:
+        """id, filename, last access and hits of every entry"""
+        with Session(self.engine) as session:
+            stmt = (
+                select(Entry.id, Entry.filename, Usage.last_access, Usage.hits)
+                .outerjoin(Usage, Usage.filename == Entry.filename)
+            )
+            return [{'id': id, 'filename': filename, 'last_access': last_access, 'hits': hits}
+                    for (id, filename, last_access, hits) in session.execute(stmt)]
+
+    def fulltext_search(self, quoted_search: str, limit: int = 50, offset: int = 0):
+        """entries matching all words of the search as prefixes in phrase, title, artist or filename,
+        best matches first"""
+        if (self.fulltext_index.enabled):
+            with Session(self.engine) as session:
+                rows = self.fulltext_index.search(session, quoted_search, limit, offset)
+            return [Item(*row) for row in rows]
+
         simplified_string = self._simplify_quoted_search(quoted_search)
 
         with Session(self.engine) as session:
@@ -214,7 +689,7 @@ class Cache(object):
         )
 
         result_list: List[Item] = []
-        for (e, p) in results:
+        for (e, p) in results[offset:offset + limit]:
             result_list.append(Item(p.phrase, e.filename, e.title, e.artist))
 
         return result_list
@@ -1,7 +1,10 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 from sqlalchemy.orm import Session
 from youtube_audio_provider.cache_db import Cache, Entry, SearchPhrase
+from youtube_audio_provider.shared_state import SharedState
 
 
 class TestCache(unittest.TestCase):
@@ -180,6 +183,7 @@ class TestCache(unittest.TestCase):
     @patch("youtube_audio_provider.cache_db.Session")
     def test_fulltext_search_returns_matching_results(self, mock_session_class):
         # Arrange
+        self.cache.fulltext_index.enabled = False  # Simulate sqlite without fts5
         mock_session = self._mock_session(mock_session_class)
         mock_session.execute.return_value.unique.return_value.all.return_value = [
             (Entry(id="1", filename="test.mp3", title="Test Title", artist="Test Artist"), 
@@ -196,3 +200,237 @@ class TestCache(unittest.TestCase):
         self.assertEqual(result[0].filename, "test.mp3")
         self.assertEqual(result[0].title, "Test Title")
         self.assertEqual(result[0].artist, "Test Artist")
+
+    @patch("youtube_audio_provider.cache_db.Session")
+    def test_retrieve_by_search_second_hit_skips_database(self, mock_session_class):
+        # Arrange
+        mock_session = self._mock_session(mock_session_class)
+        existing_entry = Entry(id="1", filename="test.mp3", title="Test Title", artist="Test Artist")
+        mock_session.scalars.return_value.first.return_value = existing_entry  # Simulate existing entry
+        self.cache._check_file_exists = MagicMock(return_value=True)  # Simulate file exists
+
+        # Act
+        first = self.cache.retrieve_by_search("Test Phrase")
+        first['by'] = "cache"  # callers modify the result
+        second = self.cache.retrieve_by_search("test phrase")
+
+        # Assert
+        self.assertEqual(mock_session.scalars.call_count, 1)  # Ensure only the first lookup hits the db
+        self.assertEqual(second, {"title": "Test Title", "artist": "Test Artist", "filename": "test.mp3"})
+
+    @patch("youtube_audio_provider.cache_db.Session")
+    def test_remove_from_cache_by_search_invalidates_lookup_cache(self, mock_session_class):
+        # Arrange
+        mock_session = self._mock_session(mock_session_class)
+        existing_entry = Entry(id="1", filename="test.mp3", title="Test Title", artist="Test Artist")
+        mock_session.scalars.return_value.first.return_value = existing_entry  # Simulate existing entry
+        self.cache._check_file_exists = MagicMock(return_value=True)  # Simulate file exists
+        self.cache.retrieve_by_search("Test Phrase")
+
+        # Act
+        self.cache.remove_from_cache_by_search("Test Phrase")
+        mock_session.scalars.return_value.first.return_value = None  # Simulate entry is gone
+        result = self.cache.retrieve_by_search("Test Phrase")
+
+        # Assert
+        self.assertIsNone(result)
+
+
+class TestCacheWithDatabase(unittest.TestCase):
+    def setUp(self):
+        self.cache = Cache(MagicMock(), MagicMock(), "/mock/audio/files", {'file': ':memory:'})
+        self.cache.put_to_cache("queen%20bohemian%20rhapsody", id="1", filename="Queen - Bohemian Rhapsody.mp3",
+                                title="Bohemian Rhapsody", artist="Queen")
+        self.cache.add_searchphrase_to_id("1", "mercury")
+        self.cache.put_to_cache("another%20one", id="2", filename="Another One Bites the Dust.mp3",
+                                title="Another One Bites the Dust", artist="Queen")
+
+    def test_fulltext_search_matches_prefixes_of_all_columns(self):
+        result = self.cache.fulltext_search("bohem%20rhaps")
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0].filename, "Queen - Bohemian Rhapsody.mp3")
+        self.assertEqual(result[0].phrase, "queen%20bohemian%20rhapsody")
+
+    def test_fulltext_search_returns_each_entry_once(self):
+        result = self.cache.fulltext_search("queen")
+
+        self.assertEqual(sorted(r.filename for r in result),
+                         ["Another One Bites the Dust.mp3", "Queen - Bohemian Rhapsody.mp3"])
+
+    def test_fulltext_search_limit_and_offset(self):
+        first = self.cache.fulltext_search("queen", limit=1)
+        second = self.cache.fulltext_search("queen", limit=1, offset=1)
+
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first[0].filename, second[0].filename)
+
+    def test_remove_from_cache_by_search_removes_from_index(self):
+        self.cache.remove_from_cache_by_search("mercury")
+
+        self.assertEqual(len(self.cache.fulltext_search("rhapsody")), 0)
+
+    def test_retrieve_by_similar_search(self):
+        self.cache._check_file_exists = MagicMock(return_value=True)  # Simulate file exists
+
+        result = self.cache.retrieve_by_similar_search("Bohemian%20Rhapsody%20%E2%80%93%20Queen")
+
+        self.assertEqual(result['id'], "1")
+        self.assertEqual(result['filename'], "Queen - Bohemian Rhapsody.mp3")
+        self.assertTrue(result['exact'])
+        self.assertFalse(self.cache.retrieve_by_similar_search("Bohemian%20Rapsody%20Queen")['exact'])
+
+    def test_retrieve_by_similar_search_forgets_removed_entries(self):
+        self.cache._check_file_exists = MagicMock(return_value=True)  # Simulate file exists
+        self.cache.retrieve_by_similar_search("queen%20bohemian%20rhapsody")  # load matcher
+
+        self.cache.remove_from_cache_by_search("mercury")
+
+        self.assertIsNone(self.cache.retrieve_by_similar_search("queen%20bohemian%20rhapsody"))
+
+    def test_retrieve_by_searches_resolves_all_phrases(self):
+        self.cache._check_file_exists = MagicMock(return_value=True)  # Simulate file exists
+        self.cache.retrieve_by_search("another%20one")  # one of them from the lookup cache
+
+        with patch.object(Cache, 'BATCH_QUERY_SIZE', 1):
+            result = self.cache.retrieve_by_searches(["Mercury", "another%20one", "unknown", "mercury"])
+
+        self.assertEqual(result["Mercury"]['filename'], "Queen - Bohemian Rhapsody.mp3")
+        self.assertEqual(result["mercury"]['filename'], "Queen - Bohemian Rhapsody.mp3")
+        self.assertEqual(result["another%20one"]['filename'], "Another One Bites the Dust.mp3")
+        self.assertIsNone(result["unknown"])
+
+    def test_retrieve_by_searches_skips_missing_files(self):
+        self.cache.reconciler.file_removed("Another One Bites the Dust.mp3")
+
+        result = self.cache.retrieve_by_searches(["another%20one"])
+
+        self.assertIsNone(result["another%20one"])
+
+    def test_retrieve_resolution_returns_stored_search_result(self):
+        self.cache.put_resolution("Some%20Song", {'id': "abc", 'title': "Some Song", 'channel': "c", 'artist': None})
+
+        result = self.cache.retrieve_resolution("some%20song")
+
+        self.assertEqual(result['id'], "abc")
+        self.assertEqual(result['title'], "Some Song")
+
+    def test_retrieve_resolution_remembers_missing_results(self):
+        self.cache.put_resolution("nothing", None)
+
+        result = self.cache.retrieve_resolution("nothing")
+
+        self.assertIsNone(result['id'])
+        self.assertIsNone(result['error'])
+
+    def test_retrieve_resolution_expires(self):
+        self.cache.put_resolution("failing", None, "network down")
+        self.assertEqual(self.cache.retrieve_resolution("failing")['error'], "network down")
+
+        self.cache.resolution_error_ttl = -1
+
+        self.assertIsNone(self.cache.retrieve_resolution("failing"))
+
+    def test_retrieve_by_id_returns_none_if_file_not_exists(self):
+        self.cache.reconciler.file_removed("Another One Bites the Dust.mp3")
+
+        self.assertIsNone(self.cache.retrieve_by_id("2"))
+
+    def test_index_orphans_adds_entries_by_id(self):
+        added = self.cache.index_orphans(["dQw4w9WgXcQ.mp3", "1.mp3"])  # there is an entry with id 1
+
+        self.assertEqual(added, 1)
+        self.assertIn("dQw4w9WgXcQ.mp3", self.cache.entry_filenames())
+
+    def test_put_to_cache_fills_in_entry_of_orphan(self):
+        self.cache._check_file_exists = MagicMock(return_value=True)  # Simulate file exists
+        self.cache.index_orphans(["dQw4w9WgXcQ.mp3"])  # the reconciler was faster than the register stage
+
+        self.cache.put_to_cache("never%20gonna", id="dQw4w9WgXcQ", filename="dQw4w9WgXcQ.mp3",
+                                title="Real Title", artist="Rick Astley")
+
+        self.assertEqual(self.cache.retrieve_by_search("never%20gonna")['title'], "Real Title")
+        self.assertEqual([r.filename for r in self.cache.fulltext_search("real")], ["dQw4w9WgXcQ.mp3"])
+        self.assertEqual([r.filename for r in self.cache.fulltext_search("astley")], ["dQw4w9WgXcQ.mp3"])
+
+    def test_put_to_cache_with_new_filename_moves_index_and_export_rows(self):
+        self.cache.exporter.reset_mock()
+
+        self.cache.put_to_cache("queen%20another%20one", id="2", filename="2.mp3", title="Another One Bites the Dust")
+
+        self.assertEqual([r.filename for r in self.cache.fulltext_search("bites")], ["2.mp3"])
+        self.cache.exporter.remove_entry.assert_called_once_with("Another One Bites the Dust.mp3")
+        self.assertEqual(sorted(c.args[1] for c in self.cache.exporter.add_phrase.call_args_list),
+                         ["another%20one", "queen%20another%20one"])
+        self.assertTrue(all(c.args[0] == "2.mp3" for c in self.cache.exporter.add_phrase.call_args_list))
+
+    def test_store_accesses_adds_up_hits(self):
+        self.cache.store_accesses({"Another One Bites the Dust.mp3": (100.0, 2)})
+        self.cache.store_accesses({"Another One Bites the Dust.mp3": (50.0, 3)})
+
+        candidates = {c['id']: c for c in self.cache.eviction_candidates()}
+
+        self.assertEqual(candidates["2"]['hits'], 5)
+        self.assertEqual(candidates["2"]['last_access'], 100.0)
+        self.assertIsNone(candidates["1"]['hits'])  # never played
+
+    def test_remove_by_id(self):
+        self.cache.store_accesses({"Another One Bites the Dust.mp3": (100.0, 1)})
+
+        self.assertEqual(self.cache.remove_by_id("2"), "Another One Bites the Dust.mp3")
+
+        self.assertEqual([c['id'] for c in self.cache.eviction_candidates()], ["1"])
+        self.assertFalse(self.cache.remove_by_id("2"))
+
+
+class TestCacheFastStart(unittest.TestCase):
+
+    def test_setup_runs_in_background(self):
+        with tempfile.TemporaryDirectory() as audio_dir:
+            open(os.path.join(audio_dir, "song.mp3"), 'w').close()
+            with patch.object(Cache, '_finish_setup') as finish_setup:
+                cache = Cache(MagicMock(), MagicMock(), audio_dir, {'file': ':memory:'}, fast_start=True)
+                cache.put_to_cache("song", id="1", filename="song.mp3", title="Song", artist="Artist")
+
+                # before the first scan files are checked on disk
+                self.assertEqual(cache.retrieve_by_search("song")['filename'], "song.mp3")
+                finish_setup.assert_called_once_with(True)
+
+
+class TestCacheSharedBetweenWorkers(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        db_config = {'file': os.path.join(self.tmpdir.name, 'cache.db')}
+        shared_config = {'lock_dir': os.path.join(self.tmpdir.name, 'locks'), 'poll_interval': 3600}
+        self.primary_exporter = MagicMock()
+        self.primary = Cache(self.primary_exporter, MagicMock(), self.tmpdir.name, db_config,
+                             SharedState(shared_config, MagicMock(), 0))
+        self.worker_exporter = MagicMock()
+        self.worker = Cache(self.worker_exporter, MagicMock(), self.tmpdir.name, db_config,
+                            SharedState(shared_config, MagicMock(), 1))
+        open(os.path.join(self.tmpdir.name, "song.mp3"), 'w').close()
+
+    def tearDown(self):
+        self.primary.engine.dispose()
+        self.worker.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_only_primary_exports(self):
+        self.worker.put_to_cache("song", id="1", filename="song.mp3", title="Song", artist=None)
+
+        self.worker_exporter.export.assert_not_called()
+        self.worker_exporter.add_phrase.assert_not_called()
+
+        self.primary.sync_shared()
+
+        self.primary_exporter.export.assert_called_once_with({"song": "song.mp3"}, {"song.mp3": "Song"})
+
+    def test_change_of_other_worker_drops_lookup_cache(self):
+        self.primary.put_to_cache("song", id="1", filename="song.mp3", title="Song", artist=None)
+        self.assertEqual(self.worker.retrieve_by_search("song")['title'], "Song")  # now in the lookup cache
+
+        self.primary.remove_from_cache_by_search("song")
+        self.worker.sync_shared()
+
+        self.assertIsNone(self.worker.retrieve_by_search("song"))
@@ -0,0 +1,95 @@
+import os
+import gzip
+import hashlib
+import logging
+from werkzeug.http import parse_accept_header, parse_etags
+
+from youtube_audio_provider.shared_state import atomic_write
+
+try:
+    # optional dependency, without it only gzip is offered
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# content codings in order of preference, with the suffix of their precompressed files
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def available_encodings() -> list:
+    return [e for e in SUFFIXES if e != 'br' or brotli is not None]
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        # the exports are rewritten often, the highest quality (11) is several times slower for a few percent
+        return brotli.compress(data, quality=9)
+    # no timestamp, the same content compresses to the same bytes
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def negotiate(accept_encoding: str | None, encodings) -> str | None:
+    """the first of encodings the client accepts, None for the uncompressed content"""
+    accepted = parse_accept_header(accept_encoding)
+    for encoding in encodings:
+        if accepted.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def write_compressed(path: str, data: bytes, encodings):
+    """write the precompressed variants of the content of path next to it, after the file itself was written.
+    Variants that would not be smaller are removed"""
+    for encoding in encodings:
+        compressed = compress(data, encoding)
+        if len(compressed) < len(data):
+            atomic_write(path + SUFFIXES[encoding], compressed)
+        elif os.path.exists(path + SUFFIXES[encoding]):
+            os.remove(path + SUFFIXES[encoding])
+
+
+def precompressed(path: str, accept_encoding: str | None, encodings):
+    """the path of the variant to send and its encoding, the file itself (and None) if the client accepts no
+    variant or it is older than the file, e.g. while it is written"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return (path, None)
+    for encoding in encodings:
+        if negotiate(accept_encoding, [encoding]) is None:
+            continue
+        try:
+            if os.stat(path + SUFFIXES[encoding]).st_mtime_ns >= mtime:
+                return (path + SUFFIXES[encoding], encoding)
+        except FileNotFoundError:
+            pass
+    return (path, None)
+
+
+class CompressedPage(object):
+    """A page held in memory with its compressed variants, answered by Accept-Encoding with an ETag per variant
+    and 304 for a matching If-None-Match."""
+
+    def __init__(self, body: bytes, content_type: str, encodings=None):
+        self.content_type = content_type
+        encodings = available_encodings() if encodings is None else encodings
+        digest = hashlib.md5(body).hexdigest()
+        self.variants = {None: (body, f'"{digest}"')}
+        for encoding in encodings:
+            self.variants[encoding] = (compress(body, encoding), f'"{digest}-{encoding}"')
+        self.encodings = list(encodings)
+
+    def respond(self, headers):
+        """status, headers and body of the answer to a request with the headers"""
+        encoding = negotiate(headers.get('Accept-Encoding'), self.encodings)
+        (body, etag) = self.variants[encoding]
+        response_headers = {'ETag': etag, 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+        if_none_match = headers.get('If-None-Match')
+        if if_none_match and parse_etags(if_none_match).contains_weak(etag.strip('"')):
+            return (304, response_headers, b'')
+        response_headers['Content-Type'] = self.content_type
+        if encoding is not None:
+            response_headers['Content-Encoding'] = encoding
+        return (200, response_headers, body)
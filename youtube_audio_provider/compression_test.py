@@ -0,0 +1,55 @@
+import os
+import gzip
+import time
+import tempfile
+import unittest
+from youtube_audio_provider.compression import CompressedPage, negotiate, precompressed, write_compressed
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_negotiate_prefers_the_given_order(self):
+        self.assertEqual(negotiate('gzip, br', ['br', 'gzip']), 'br')
+        self.assertEqual(negotiate('gzip;q=0.5, br;q=0', ['br', 'gzip']), 'gzip')
+        self.assertEqual(negotiate('*', ['gzip']), 'gzip')
+        self.assertIsNone(negotiate('identity', ['br', 'gzip']))
+        self.assertIsNone(negotiate(None, ['gzip']))
+
+    def test_precompressed_variant_is_used_unless_outdated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.html')
+            data = b'<li>phrase</li>' * 100
+            with open(path, 'wb') as f:
+                f.write(data)
+            write_compressed(path, data, ['gzip'])
+
+            self.assertEqual(precompressed(path, 'gzip', ['gzip']), (path + '.gz', 'gzip'))
+            self.assertEqual(precompressed(path, None, ['gzip']), (path, None))
+            with open(path + '.gz', 'rb') as f:
+                self.assertEqual(gzip.decompress(f.read()), data)
+
+            # the file was rewritten, its variant is not yet
+            future = time.time() + 10
+            os.utime(path, (future, future))
+            self.assertEqual(precompressed(path, 'gzip', ['gzip']), (path, None))
+
+    def test_page_answers_by_encoding_and_etag(self):
+        page = CompressedPage(b'<html>' + b'x' * 1000 + b'</html>', 'text/html', ['gzip'])
+
+        (status, headers, body) = page.respond({'Accept-Encoding': 'gzip'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+
+        (status, plain_headers, plain_body) = page.respond({})
+        self.assertNotIn('Content-Encoding', plain_headers)
+        self.assertEqual(gzip.decompress(body), plain_body)
+        self.assertNotEqual(headers['ETag'], plain_headers['ETag'])
+
+        (status, _, body) = page.respond({'Accept-Encoding': 'gzip', 'If-None-Match': headers['ETag']})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
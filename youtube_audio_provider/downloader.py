@@ -1,98 +1,429 @@
+import os
+import time
 import logging
-import yt_dlp
+import threading
+import subprocess
+import contextlib
+
+from youtube_audio_provider.scheduler import DownloadScheduler
+from youtube_audio_provider.progressive import ProgressiveFiles
+from youtube_audio_provider.ydl_pool import YoutubeDLPool, PooledYoutubeDL
+from youtube_audio_provider.shared_state import SharedState
+from youtube_audio_provider.storage import Storage, FlatStorage
+from youtube_audio_provider.output_profiles import OutputProfiles, ffmpeg_binary
+from youtube_audio_provider.pipeline import Pipeline, stage_duration_histogram
 
 logger = logging.getLogger(__name__)
 
+# downloads and transcodes are written below here and moved into the audio directory when complete
+INCOMPLETE_DIR_NAME = '.incomplete'
+
+# codec of a youtube audio stream -> extension and ffmpeg muxer to store it without re-encoding
+PASSTHROUGH_CONTAINERS = {
+    'opus': ('opus', 'ogg'),
+    'vorbis': ('ogg', 'ogg'),
+    'mp4a': ('m4a', 'ipod'),
+    'aac': ('m4a', 'ipod'),
+    'mp3': ('mp3', 'mp3')
+}
+
+
+def _yt_dlp():
+    # imported on first use, by far the slowest import of the application
+    import yt_dlp
+    return yt_dlp
+
+
+class NoSearchResultError(Exception):
+    """the youtube search for a phrase found nothing"""
+    pass
+
+
+def _create_search_opts():
+    return {
+        'format': 'bestaudio/best',
+        'noplaylist': True,
+        'extract_flat': True,  # ← This is key! Only extracts minimal info like id, title, url
+        'quiet': True
+    }
+
+
+def _extract_audio_postprocessor(source: str):
+    if source == 'passthrough':
+        # keep the codec of the source, only the container is changed
+        return {'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}
+    return {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}
+
+
+def _create_download_opts(pooled: PooledYoutubeDL, destination_path: str, ffmpeg_location: str,
+                          source: str = 'mp3', extract_audio: bool = True):
+    def post_processor_hook(d):
+        if pooled.owner is None:
+            return
+        if d['status'] == 'finished':
+            # This is the final file after postprocessing
+            pooled.owner.final_filepath = d['info_dict']['filepath']
+        if d.get('postprocessor') == 'ExtractAudio':
+            pooled.owner.emit('transcode', status=d['status'])
+
+    def progress_hook(d):
+        if pooled.owner is not None:
+            pooled.owner.download_progress(d)
+
+    ydl_opts_download = {
+        'format': 'bestaudio/best',
+        'quiet': True,
+        'js_runtimes': {
+            'node': {}
+        },
+        'concurrent_fragment_downloads': 4,
+        'ffmpeg_location': ffmpeg_location,
+        "outtmpl": destination_path + '/' + INCOMPLETE_DIR_NAME + '/%(id)s/%(id)s.%(ext)s',
+        # 'extractor_args': {'youtube': {'player_client': ['web']}}, -> may not be able to download all formats
+        'extractor_args': {'youtube': {'skip': ['dash', 'hls', 'translated_subs']}},
+        # Extract audio using ffmpeg, unless the pipeline transcodes in a stage of its own
+        'postprocessors': [_extract_audio_postprocessor(source)] if extract_audio else [],
+        "postprocessor_hooks": [post_processor_hook],
+        "progress_hooks": [progress_hook]
+    }
+    # merge options for extract_info and for download:
+    return _create_search_opts() | ydl_opts_download
+
+
+def create_search_pool(size: int, max_uses: int = 100, max_age: float = 3600, info=None) -> YoutubeDLPool:
+    """pool of instances for the cheap id lookups"""
+    return YoutubeDLPool(lambda pooled: _yt_dlp().YoutubeDL(_create_search_opts()),
+                         size, max_uses, max_age, info, 'ydl_pool.search')
+
+
+def create_download_pool(size: int, ffmpeg_location: str, destination_path: str,
+                         max_uses: int = 100, max_age: float = 3600, info=None,
+                         source: str = 'mp3', extract_audio: bool = True) -> YoutubeDLPool:
+    """pool of instances for downloading and transcoding"""
+    def factory(pooled):
+        opts = _create_download_opts(pooled, destination_path, ffmpeg_location, source, extract_audio)
+        return _yt_dlp().YoutubeDL(opts)
+    return YoutubeDLPool(factory, size, max_uses, max_age, info, 'ydl_pool.download')
+
 
 class Downloader(object):
 
-    def __init__(self, config, info):
+    def __init__(self, config, info, shared: SharedState = None, storage: Storage = None):
         self.ffmpeg_location = config.get('ffmpeg_location')
         self.audio_path = config.get('audio_path', 'audio')
+        self.storage = storage or FlatStorage(self.audio_path)
         self.appinfo = info
         self.appinfo.register("downloader.name", "yt-dlp-python")
-        self.appinfo.register("downloader.version", yt_dlp.version.__version__)
+        self.appinfo.register("downloader.version", None)  # known once yt_dlp is loaded
+        # fast start: yt_dlp is loaded in the background, cache hits are served meanwhile
+        self.fast_start = config.get('startup', {}).get('fast', False)
+        # fetching and transcoding on separate pools, None: both in one yt-dlp call
+        pipeline_config = config.get('pipeline', {})
+        self.pipeline = Pipeline(pipeline_config, info) if pipeline_config.get('enabled', True) else None
+        # downloads are run by a bounded pool of workers, in the pipeline they only wait for its stages
+        scheduler_config = config.get('download_scheduler', {})
+        if self.pipeline is not None and 'workers' not in scheduler_config:
+            scheduler_config = dict(scheduler_config, workers=self.pipeline.capacity())
+        self.scheduler = DownloadScheduler(scheduler_config, info)
+        self.stage_duration = stage_duration_histogram(info)
+        # serve audio while it is transcoded
+        progressive_config = config.get('progressive', {})
+        self.progressive_enabled = progressive_config.get('enabled', False)
+        self.progressive_min_bytes = progressive_config.get('min_bytes', 64 * 1024)
+        self.progressive = ProgressiveFiles(info)
+        # formats of the stored files and the ones derived for clients
+        self.profiles = OutputProfiles(config.get('output_profiles', {}), self.storage, self.ffmpeg_location,
+                                       info, shared)
+        # reused YoutubeDL instances, one per concurrent search / download is kept
+        pool_config = config.get('ydl_pool', {})
+        workers = config.get('download_scheduler', {}).get('workers', 2)
+        search_workers = self.pipeline.workers('resolve') if self.pipeline is not None else workers
+        fetch_workers = self.pipeline.workers('fetch') if self.pipeline is not None else workers
+        max_uses = pool_config.get('max_uses', 100)
+        max_age = pool_config.get('max_age', 3600)
+        self.search_pool = create_search_pool(pool_config.get('search_size', search_workers),
+                                              max_uses, max_age, info)
+        self.download_pool = create_download_pool(pool_config.get('download_size', fetch_workers),
+                                                  self.ffmpeg_location, self.audio_path, max_uses, max_age, info,
+                                                  self.profiles.source, self.pipeline is None)
+        prewarm = pool_config.get('prewarm', True)
+        if self.fast_start:
+            threading.Thread(target=self._load_in_background, args=(prewarm,), name='ydl-load', daemon=True).start()
+        else:
+            self.load()
+            if prewarm:
+                threading.Thread(target=self._prewarm_pools, name='ydl-prewarm', daemon=True).start()
+        # other worker processes download to the same directory
+        self.shared = shared
+
+    def lock_id(self, id: str):
+        """held while an id is downloaded, excludes the other worker processes"""
+        if self.shared is None:
+            return contextlib.nullcontext()
+        return self.shared.lock('id-' + id)
+
+    def run_stage(self, stage: str, fn, timings: dict = None):
+        """run fn in the stage of the pipeline, directly without pipeline"""
+        if self.pipeline is not None:
+            return self.pipeline.run(stage, fn, timings)
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            seconds = time.perf_counter() - start
+            self.stage_duration.observe(seconds, stage)
+            if timings is not None:
+                timings[stage] = {'wait_ms': 0.0, 'run_ms': round(seconds * 1000, 3)}
+
+    def download(self, dl_ctx: 'Downloader.DownloadContext'):
+        """download the resolved id of the context, in the fetch and transcode stages of the pipeline if enabled"""
+        if self.pipeline is not None:
+            return dl_ctx.download()
+        return self.run_stage('download', dl_ctx.download, dl_ctx.timings)
+
+    def load(self, background: bool = False):
+        """import yt_dlp, happens on the first search otherwise"""
+        with self.appinfo.startup.phase('yt_dlp', background):
+            self.appinfo.register("downloader.version", _yt_dlp().version.__version__)
+
+    def _load_in_background(self, prewarm: bool):
+        try:
+            self.load(True)
+        except Exception:
+            logger.exception("loading yt_dlp failed")
+            return
+        if prewarm:
+            with self.appinfo.startup.phase('ydl_prewarm', True):
+                self._prewarm_pools()
+
+    def _prewarm_pools(self):
+        try:
+            self.search_pool.prewarm(1)
+            self.download_pool.prewarm(1)
+        except Exception:
+            logger.exception("prewarming YoutubeDL instances failed")
 
     class DownloadContext:
 
-        def _create_ydl_opts(self, destination_path: str, ffmpeg_location: str):
-            def post_processor_hook(d):
-                if d['status'] == 'finished':
-                    # This is the final file after postprocessing
-                    self.final_filepath = d['info_dict']['filepath']
-
-            ydl_opts_extract_info = {
-                'format': 'bestaudio/best',
-                'noplaylist': True,
-                'extract_flat': True,  # ← This is key! Only extracts minimal info like id, title, url
-                'quiet': True
-            }
-            ydl_opts_download = {
-                'format': 'bestaudio/best',
-                'quiet': True,
-                'js_runtimes': {
-                    'node': {}
-                },
-                'concurrent_fragment_downloads': 4,
-                'ffmpeg_location': ffmpeg_location,
-                "outtmpl": destination_path + '/' + '%(title)s.%(ext)s',
-                # 'extractor_args': {'youtube': {'player_client': ['web']}}, -> may not be able to download all formats
-                'extractor_args': {'youtube': {'skip': ['dash', 'hls', 'translated_subs']}},
-                'postprocessors': [{  # Extract audio using ffmpeg
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                "postprocessor_hooks": [post_processor_hook]
-            }
-            # merge options for extract_info and for download:
-            return ydl_opts_extract_info | ydl_opts_download
-
-        def __init__(self, ffmpeg_location: str, destination_path: str, search_string: str):
+        # seconds between two progress events of a download
+        PROGRESS_INTERVAL = 0.5
+
+        def __init__(self, ffmpeg_location: str, destination_path: str, search_string: str,
+                     search_pool: YoutubeDLPool = None, download_pool: YoutubeDLPool = None,
+                     storage: Storage = None, pipeline: Pipeline = None, source: str = 'mp3'):
             logger.info('constructing context')
             # store given parameters
             self.search_string = search_string
             self.destination_path = destination_path
+            self.ffmpeg_location = ffmpeg_location
+            self.storage = storage or FlatStorage(destination_path)
+            self.pipeline = pipeline
+            self.source = source
 
             # prepare data
             self.final_filepath = None
             self.info = {}
+            # stage -> milliseconds waited and run, shared with the job
+            self.timings = {}
+            # on_event(event, **data) is told the progress, e.g. the emit of the job
+            self.on_event = None
+            self._last_progress = 0.0
 
-            # create params
-            ydl_opts = self._create_ydl_opts(self.destination_path, ffmpeg_location)
-            self.ydl = yt_dlp.YoutubeDL(ydl_opts)
+            # YoutubeDL instances are borrowed per call, without pools every call gets its own instance
+            self.search_pool = search_pool or create_search_pool(0)
+            self.download_pool = download_pool or create_download_pool(0, ffmpeg_location, destination_path,
+                                                                       source=source,
+                                                                       extract_audio=pipeline is None)
 
         def __enter__(self):
-            self.ydl.__enter__()
             return self
 
+        def emit(self, event: str, **data):
+            if self.on_event is not None:
+                self.on_event(event, **data)
+
+        def download_progress(self, d):
+            """progress hook of yt-dlp, emits at most one 'download' event per PROGRESS_INTERVAL"""
+            now = time.monotonic()
+            if d['status'] == 'downloading' and now - self._last_progress < self.PROGRESS_INTERVAL:
+                return
+            self._last_progress = now
+            self.emit('download', status=d['status'], downloaded_bytes=d.get('downloaded_bytes'),
+                      total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+                      speed=d.get('speed'), eta=d.get('eta'))
+
         def __exit__(self, *args):
-            self.ydl.__exit__(args)
+            pass
+
+        def _set_info(self, video_info):
+            self.info['id'] = video_info['id']
+            self.info['title'] = video_info.get('title', None)
+            self.info['channel'] = video_info.get('channel', None)
+            self.info['artist'] = video_info.get('artist', None)
 
         def get_id(self) -> str:
             logger.debug(f'retrieving id for {self.search_string}')
-            all_info = self.ydl.extract_info(f"ytsearch:{self.search_string}", download=False)
-            first = all_info['entries'][0]  # first entry (nearly always available)
+            with self.search_pool.lease(self) as ydl:
+                all_info = ydl.extract_info(f"ytsearch:{self.search_string}", download=False)
+            entries = all_info.get('entries') or []
+            if (not entries):
+                raise NoSearchResultError(f'nothing found for {self.search_string}')
+            first = entries[0]
 
-            self.info['id'] = first['id']
-            self.info['title'] = first.get('title', None)
-            self.info['channel'] = first.get('channel', None)
-            self.info['artist'] = first.get('artist', None)
+            self._set_info(first)
+            return self.info['id']
 
+        def set_resolved_info(self, resolved: dict) -> str:
+            """use a search result known from an earlier get_id instead of searching"""
+            self._set_info(resolved)
             return self.info['id']
 
+        def resolve_id(self, id: str) -> str:
+            """use a known id instead of searching, retrieves its title etc."""
+            logger.debug(f'retrieving info for id {id}')
+            with self.search_pool.lease(self) as ydl:
+                video_info = ydl.extract_info(f"https://www.youtube.com/watch?v={id}", download=False, process=False)
+
+            self._set_info(video_info)
+            return self.info['id']
+
+        def get_playlist_ids(self) -> list:
+            """the ids of the videos in the playlist given as search string"""
+            logger.debug(f'retrieving playlist {self.search_string}')
+            with self.search_pool.lease(self) as ydl:
+                playlist_info = ydl.extract_info(self.search_string, download=False)
+            return [e['id'] for e in playlist_info.get('entries') or [] if e and e.get('id')]
+
         def download(self):
+            if self.pipeline is not None:
+                return self.download_staged()
             id = self.info['id']
-            self.ydl.download([f"https://www.youtube.com/watch?v={id}"])
+            with self.download_pool.lease(self) as ydl:
+                # the post processor hook sets final_filepath of the borrowing context
+                ydl.download([f"https://www.youtube.com/watch?v={id}"])
 
-            file_only = self.final_filepath[len(self.destination_path):].strip('\\/')
+            file_only = os.path.basename(self.final_filepath)
+            self.final_filepath = self._move_into_storage(self.final_filepath, file_only)
             self.info['filename'] = file_only
 
             return self.get_info()
 
+        def download_staged(self):
+            """fetch the audio stream and transcode it in separate stages of the pipeline"""
+            (raw_path, acodec) = self.pipeline.run('fetch', self.fetch, self.timings)
+            self.final_filepath = self.pipeline.run('transcode', lambda: self.transcode(raw_path, acodec),
+                                                    self.timings)
+            self.info['filename'] = os.path.basename(self.final_filepath)
+            return self.get_info()
+
+        def fetch(self):
+            """download the audio stream as it is, returns its path and codec"""
+            id = self.info['id']
+            with self.download_pool.lease(self) as ydl:
+                video_info = ydl.extract_info(f"https://www.youtube.com/watch?v={id}", download=True)
+            downloaded = (video_info.get('requested_downloads') or [video_info])[0]
+            return (downloaded['filepath'], (downloaded.get('acodec') or '').split('.')[0])
+
+        def _create_transcode_command(self, raw_path: str, acodec: str, out_path: str, muxer: str):
+            command = [self._ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-y', '-i', raw_path, '-vn']
+            if muxer == 'mp3' and acodec != 'mp3':
+                command += ['-codec:a', 'libmp3lame', '-b:a', '192k']
+            else:
+                command += ['-codec:a', 'copy']
+            # tag the file with what youtube knows about it
+            for key in ('title', 'artist'):
+                if self.info.get(key):
+                    command += ['-metadata', f'{key}={self.info[key]}']
+            return command + ['-f', muxer, out_path]
+
+        def transcode(self, raw_path: str, acodec: str) -> str:
+            """convert the fetched stream to the stored format and move it into the storage, returns its path"""
+            (ext, muxer) = ('mp3', 'mp3')
+            if self.source == 'passthrough':
+                (ext, muxer) = PASSTHROUGH_CONTAINERS.get(acodec, (ext, muxer))
+            out_path = os.path.splitext(raw_path)[0] + '.transcoded.' + ext
+            self.emit('transcode', status='started')
+            try:
+                subprocess.run(self._create_transcode_command(raw_path, acodec, out_path, muxer),
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, check=True)
+            finally:
+                with contextlib.suppress(OSError):
+                    os.remove(raw_path)
+            path = self._move_into_storage(out_path, self.storage.filename_for_id(self.info['id'], ext))
+            self.emit('transcode', status='finished')
+            return path
+
+        def _move_into_storage(self, path: str, filename: str) -> str:
+            """atomically move a completed file from the incomplete directory into the storage"""
+            target = self.storage.put(path, filename)
+            if os.path.basename(os.path.dirname(os.path.dirname(path))) == INCOMPLETE_DIR_NAME:
+                with contextlib.suppress(OSError):
+                    os.rmdir(os.path.dirname(path))
+            return target
+
+        def _ffmpeg_binary(self):
+            return ffmpeg_binary(self.ffmpeg_location)
+
+        def _create_ffmpeg_command(self, format_info, out_path: str):
+            headers = ''.join(f'{k}: {v}\r\n' for (k, v) in format_info.get('http_headers', {}).items())
+            command = [self._ffmpeg_binary(), '-hide_banner', '-loglevel', 'error', '-y']
+            if headers:
+                command += ['-headers', headers]
+            command += ['-i', format_info['url'],
+                        '-vn', '-codec:a', 'libmp3lame', '-b:a', '192k',
+                        # write the stream as it is encoded
+                        '-flush_packets', '1', '-f', 'mp3', out_path]
+            return command
+
+        def download_progressive(self, files: ProgressiveFiles, on_ready, min_bytes: int):
+            """pipe the audio stream through ffmpeg into the destination file,
+            on_ready(info) is called as soon as min_bytes are written (or the file is complete),
+            returns the info when the file is complete"""
+            id = self.info['id']
+            start = time.perf_counter()
+            with self.download_pool.lease(self) as ydl:
+                format_info = ydl.extract_info(f"https://www.youtube.com/watch?v={id}", download=False)
+                out_path = os.path.splitext(ydl.prepare_filename(format_info))[0] + '.mp3'
+            file_only = os.path.basename(out_path)
+            self.info['filename'] = file_only
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+            # served from its incomplete location while growing, completion is signalled after the move
+            growing = files.start(file_only, out_path, self.storage.path(file_only))
+            ok = False
+            try:
+                process = subprocess.Popen(self._create_ffmpeg_command(format_info, out_path),
+                                           stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+                ready = False
+                self.emit('transcode', status='started')
+                while process.poll() is None:
+                    if not ready and os.path.exists(out_path) and os.path.getsize(out_path) >= min_bytes:
+                        ready = True
+                        files.ready((time.perf_counter() - start) * 1000)
+                        on_ready(self.get_info())
+                    time.sleep(0.05)
+                if process.returncode != 0:
+                    raise RuntimeError(f'ffmpeg exited with {process.returncode} for {id}')
+                self._move_into_storage(out_path, file_only)
+                self.emit('transcode', status='finished')
+                ok = True
+            finally:
+                files.finish(file_only, ok)
+                if not ok and os.path.exists(growing.path):
+                    os.remove(growing.path)
+
+            return self.get_info()
+
         def get_info(self):
             return self.info
 
     def create_download_context(self, search_string: str) -> DownloadContext:
-        res = Downloader.DownloadContext(self.ffmpeg_location, self.audio_path, search_string)
+        res = Downloader.DownloadContext(self.ffmpeg_location, self.audio_path, search_string,
+                                         self.search_pool, self.download_pool, self.storage,
+                                         self.pipeline, self.profiles.source)
         return res
+
+    def resolve_playlist(self, url: str) -> list:
+        """the ids of the videos of a playlist"""
+        with self.create_download_context(url) as dl_ctx:
+            return dl_ctx.get_playlist_ids()
@@ -1,6 +1,10 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
-from youtube_audio_provider.downloader import Downloader
+from youtube_audio_provider.downloader import Downloader, NoSearchResultError, _create_download_opts
+from youtube_audio_provider.progressive import ProgressiveFiles
+from youtube_audio_provider.pipeline import Pipeline
 
 
 class TestDownloadContext(unittest.TestCase):
@@ -14,7 +18,7 @@ class TestDownloadContext(unittest.TestCase):
         self.destination_path = "/mock/destination"
         self.search_string = "test search"
 
-    @patch("youtube_audio_provider.downloader.yt_dlp.YoutubeDL", return_value=MagicMock())
+    @patch("yt_dlp.YoutubeDL", return_value=MagicMock())
     def test_get_id(self, mock_ytdl_class):
         mock_ytdl_class.return_value = self.mock_ydl
         context = Downloader.DownloadContext(self.ffmpeg_location, self.destination_path, self.search_string)
@@ -26,7 +30,16 @@ class TestDownloadContext(unittest.TestCase):
         self.assertEqual(context.info['artist'], "Test Artist")
         self.mock_ydl.extract_info.assert_called_once_with(f"ytsearch:{self.search_string}", download=False)
 
-    @patch("youtube_audio_provider.downloader.yt_dlp.YoutubeDL", return_value=MagicMock())
+    @patch("yt_dlp.YoutubeDL", return_value=MagicMock())
+    def test_get_id_raises_without_result(self, mock_ytdl_class):
+        mock_ytdl_class.return_value = self.mock_ydl
+        self.mock_ydl.extract_info.return_value = {'entries': []}
+        context = Downloader.DownloadContext(self.ffmpeg_location, self.destination_path, self.search_string)
+
+        with self.assertRaises(NoSearchResultError):
+            context.get_id()
+
+    @patch("yt_dlp.YoutubeDL", return_value=MagicMock())
     def test_download(self, mock_ytdl_class):
         mock_ytdl_class.return_value = self.mock_ydl
         context = Downloader.DownloadContext(self.ffmpeg_location, self.destination_path, self.search_string)
@@ -38,7 +51,24 @@ class TestDownloadContext(unittest.TestCase):
         self.mock_ydl.download.assert_called_once_with(["https://www.youtube.com/watch?v=test_id"])
         self.assertEqual(result['filename'], "test_file.mp3")
 
-    @patch("youtube_audio_provider.downloader.yt_dlp.YoutubeDL", return_value=MagicMock())
+    @patch("yt_dlp.YoutubeDL", return_value=MagicMock())
+    def test_download_moves_completed_file_into_destination(self, mock_ytdl_class):
+        with tempfile.TemporaryDirectory() as destination_path:
+            mock_ytdl_class.return_value = self.mock_ydl
+            incomplete = os.path.join(destination_path, ".incomplete", "test_id")
+            os.makedirs(incomplete)
+            open(os.path.join(incomplete, "test_file.mp3"), 'w').close()
+            context = Downloader.DownloadContext(self.ffmpeg_location, destination_path, self.search_string)
+            context.info = {'id': 'test_id'}
+            context.final_filepath = os.path.join(incomplete, "test_file.mp3")
+
+            result = context.download()
+
+            self.assertEqual(result['filename'], "test_file.mp3")
+            self.assertTrue(os.path.exists(os.path.join(destination_path, "test_file.mp3")))
+            self.assertFalse(os.path.exists(incomplete))
+
+    @patch("yt_dlp.YoutubeDL", return_value=MagicMock())
     def test_get_info(self, mock_ytdl_class):
         mock_ytdl_class.return_value = self.mock_ydl
         context = Downloader.DownloadContext(self.ffmpeg_location, self.destination_path, self.search_string)
@@ -48,3 +78,107 @@ class TestDownloadContext(unittest.TestCase):
 
         self.assertEqual(info['id'], 'test_id')
         self.assertEqual(info['title'], 'Test Title')
+
+    @patch("youtube_audio_provider.downloader.subprocess.Popen")
+    @patch("yt_dlp.YoutubeDL", return_value=MagicMock())
+    def test_download_progressive(self, mock_ytdl_class, mock_popen):
+        with tempfile.TemporaryDirectory() as destination_path:
+            mock_ytdl_class.return_value = self.mock_ydl
+            self.mock_ydl.extract_info.return_value = {'url': 'http://stream', 'http_headers': {'User-Agent': 'test'}}
+            self.mock_ydl.prepare_filename.return_value = os.path.join(destination_path, "Test Title.webm")
+
+            def fake_ffmpeg(command, **kwargs):
+                # the transcoder writes the output file
+                with open(command[-1], 'wb') as f:
+                    f.write(b'x' * 10)
+                process = MagicMock()
+                process.poll.side_effect = [None, 0]
+                process.returncode = 0
+                return process
+            mock_popen.side_effect = fake_ffmpeg
+
+            files = ProgressiveFiles(MagicMock())
+            on_ready = MagicMock()
+            context = Downloader.DownloadContext(self.ffmpeg_location, destination_path, self.search_string)
+            context.info = {'id': 'test_id'}
+
+            result = context.download_progressive(files, on_ready, 5)
+
+            self.assertEqual(result['filename'], "Test Title.mp3")
+            on_ready.assert_called_once()
+            self.assertIn('http://stream', mock_popen.call_args[0][0])
+            self.assertIsNone(files.get("Test Title.mp3"))  # finished
+            self.assertEqual(files.stats['completed'], 1)
+
+    @patch("youtube_audio_provider.downloader.subprocess.run")
+    @patch("yt_dlp.YoutubeDL", return_value=MagicMock())
+    def test_download_staged(self, mock_ytdl_class, mock_run):
+        with tempfile.TemporaryDirectory() as destination_path:
+            mock_ytdl_class.return_value = self.mock_ydl
+            incomplete = os.path.join(destination_path, ".incomplete", "test_id")
+            os.makedirs(incomplete)
+            raw_path = os.path.join(incomplete, "test_id.webm")
+            open(raw_path, 'w').close()
+            self.mock_ydl.extract_info.return_value = {
+                'requested_downloads': [{'filepath': raw_path, 'acodec': 'opus'}]
+            }
+
+            def fake_ffmpeg(command, **kwargs):
+                open(command[-1], 'w').close()
+            mock_run.side_effect = fake_ffmpeg
+
+            context = Downloader.DownloadContext(self.ffmpeg_location, destination_path, self.search_string,
+                                                 pipeline=Pipeline({}, MagicMock()))
+            context.info = {'id': 'test_id', 'title': 'Test Title'}
+            context.on_event = MagicMock()
+
+            result = context.download()
+
+            self.assertEqual(result['filename'], "test_id.mp3")
+            self.assertEqual([c.kwargs['status'] for c in context.on_event.call_args_list], ['started', 'finished'])
+            self.assertTrue(os.path.exists(os.path.join(destination_path, "test_id.mp3")))
+            self.assertFalse(os.path.exists(incomplete))  # raw stream removed
+            command = mock_run.call_args.args[0]
+            self.assertIn('libmp3lame', command)
+            self.assertIn('title=Test Title', command)
+            self.assertEqual(set(context.timings), {'fetch', 'transcode'})
+
+    @patch("youtube_audio_provider.downloader.subprocess.run")
+    @patch("yt_dlp.YoutubeDL", return_value=MagicMock())
+    def test_download_staged_passthrough_copies_stream(self, mock_ytdl_class, mock_run):
+        with tempfile.TemporaryDirectory() as destination_path:
+            mock_ytdl_class.return_value = self.mock_ydl
+            raw_path = os.path.join(destination_path, "test_id.webm")
+            self.mock_ydl.extract_info.return_value = {'filepath': raw_path, 'acodec': 'opus'}
+            mock_run.side_effect = lambda command, **kwargs: open(command[-1], 'w').close()
+
+            context = Downloader.DownloadContext(self.ffmpeg_location, destination_path, self.search_string,
+                                                 pipeline=Pipeline({}, MagicMock()), source='passthrough')
+            context.info = {'id': 'test_id'}
+
+            result = context.download()
+
+            self.assertEqual(result['filename'], "test_id.opus")
+            command = mock_run.call_args.args[0]
+            self.assertEqual(command[command.index('-codec:a') + 1], 'copy')
+
+    def test_progress_hook_emits_throttled_download_events(self):
+        pooled = MagicMock()
+        pooled.owner = Downloader.DownloadContext(self.ffmpeg_location, self.destination_path, self.search_string)
+        pooled.owner.on_event = MagicMock()
+        hook = _create_download_opts(pooled, self.destination_path, self.ffmpeg_location)['progress_hooks'][0]
+
+        hook({'status': 'downloading', 'downloaded_bytes': 10, 'total_bytes': 100, 'speed': 5.0, 'eta': 18})
+        hook({'status': 'downloading', 'downloaded_bytes': 20, 'total_bytes': 100, 'speed': 5.0, 'eta': 16})
+        hook({'status': 'finished', 'downloaded_bytes': 100, 'total_bytes': 100})
+
+        self.assertEqual([c.kwargs['downloaded_bytes'] for c in pooled.owner.on_event.call_args_list], [10, 100])
+        pooled.owner.on_event.assert_called_with('download', status='finished', downloaded_bytes=100,
+                                                 total_bytes=100, speed=None, eta=None)
+
+    def test_passthrough_keeps_source_codec(self):
+        mp3 = _create_download_opts(MagicMock(), self.destination_path, self.ffmpeg_location)
+        passthrough = _create_download_opts(MagicMock(), self.destination_path, self.ffmpeg_location, 'passthrough')
+
+        self.assertEqual(mp3['postprocessors'][0]['preferredcodec'], 'mp3')
+        self.assertEqual(passthrough['postprocessors'][0]['preferredcodec'], 'best')
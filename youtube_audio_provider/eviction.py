@@ -0,0 +1,170 @@
+import os
+import time
+import logging
+import datetime
+import threading
+
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class Evictor(object):
+    """Keeps the audio files below a byte quota. Accesses are counted in memory and written in batches,
+    when the quota is exceeded the least valuable entries are removed in the background until the usage
+    is below low_watermark * max_bytes. Policy 'lru' removes the least recently used entries first,
+    'lfu' the least often used ones. Entries newer than min_age seconds are kept."""
+
+    def __init__(self, config, cache, storage: Storage, info: AppInfo, run_eviction: bool = True):
+        self.max_bytes = config.get('max_bytes')  # None: no quota, accesses are tracked anyway
+        self.policy = config.get('policy', 'lru')
+        if self.policy not in ('lru', 'lfu'):
+            raise ValueError(f'unknown eviction policy {self.policy}')
+        self.low_watermark = config.get('low_watermark', 0.9)
+        self.min_age = config.get('min_age', 60 * 60)
+        self.interval = config.get('interval', 5 * 60)
+        self.flush_interval = config.get('flush_interval', 30)
+        # cache provides store_accesses(dict) and eviction_candidates() and remove_by_id(id)
+        self.cache = cache
+        self.storage = storage
+
+        self._lock = threading.Lock()
+        self._pending = {}  # filename -> (last access, hits)
+        self._wakeup = threading.Event()
+
+        self.stats = {
+            'max_bytes': self.max_bytes,
+            'policy': self.policy,
+            'used_bytes': None,
+            'files': None,
+            'pending_accesses': 0,
+            'evicted_files': 0,
+            'freed_bytes': 0,
+            'last_run': None,
+            'last_duration_ms': None
+        }
+        info.register('quota', self.stats)
+
+        threading.Thread(target=self._flush_loop, name='usage-flush', daemon=True).start()
+        if self.max_bytes is not None and run_eviction:
+            threading.Thread(target=self._eviction_loop, name='eviction', daemon=True).start()
+
+    def record_access(self, filename: str):
+        """count a use of the file, written with the next batch"""
+        now = time.time()
+        with self._lock:
+            hits = self._pending.get(filename, (now, 0))[1]
+            self._pending[filename] = (now, hits + 1)
+            self.stats['pending_accesses'] = len(self._pending)
+
+    def file_added(self, filename: str):
+        """account for a new file, starts an eviction if it exceeds the quota"""
+        if self.max_bytes is None or self.stats['used_bytes'] is None:
+            return
+        try:
+            size = os.stat(self.storage.path(filename)).st_size
+        except OSError:
+            return
+        with self._lock:
+            self.stats['used_bytes'] += size
+            self.stats['files'] += 1
+            exceeded = self.stats['used_bytes'] > self.max_bytes
+        if exceeded:
+            self._wakeup.set()
+
+    def flush(self):
+        """write the counted accesses"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self.stats['pending_accesses'] = 0
+        if pending:
+            self.cache.store_accesses(pending)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("writing accesses failed")
+
+    def _eviction_loop(self):
+        while True:
+            try:
+                self.evict()
+            except Exception:
+                logger.exception("eviction failed")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def _rank(self, candidate):
+        # lowest first, never accessed entries count as accessed when they were downloaded
+        last_access = candidate['last_access'] or candidate['mtime']
+        hits = candidate['hits'] or 0
+        if self.policy == 'lfu':
+            return (hits, last_access)
+        return (last_access, hits)
+
+    def _measure(self):
+        """the entries with the size and mtime of their file and the bytes used, entries without file are left out"""
+        candidates = []
+        used = 0
+        for c in self.cache.eviction_candidates():
+            path = self.storage.path(c['filename'])
+            try:
+                st = os.stat(path)
+            except (OSError, TypeError):
+                continue
+            used += st.st_size
+            candidates.append(dict(c, size=st.st_size, mtime=st.st_mtime))
+        return (candidates, used)
+
+    def _eviction_order(self, candidates) -> list:
+        """the candidates older than min_age, least valuable first"""
+        too_young = time.time() - self.min_age
+        return [c for c in sorted(candidates, key=self._rank) if c['mtime'] <= too_young]
+
+    def _remove(self, candidate) -> bool:
+        filename = self.cache.remove_by_id(candidate['id'])
+        if not filename:
+            return False
+        try:
+            self.storage.remove(filename)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def _evict_down_to(self, candidates, used: int, target: float):
+        """remove entries until at most target bytes are used, returns the freed bytes and the number of files"""
+        freed = 0
+        evicted = 0
+        for c in self._eviction_order(candidates):
+            if used - freed <= target:
+                break
+            if self._remove(c):
+                freed += c['size']
+                evicted += 1
+        return (freed, evicted)
+
+    def evict(self):
+        """measure the usage and remove entries while it exceeds the quota, returns the freed bytes"""
+        start = time.perf_counter()
+        self.flush()
+        (candidates, used) = self._measure()
+
+        freed = 0
+        evicted = 0
+        if self.max_bytes is not None and used > self.max_bytes:
+            (freed, evicted) = self._evict_down_to(candidates, used, self.max_bytes * self.low_watermark)
+            logger.info(f"evicted {evicted} files, freed {freed} bytes")
+
+        with self._lock:
+            self.stats['used_bytes'] = used - freed
+            self.stats['files'] = len(candidates) - evicted
+            self.stats['evicted_files'] += evicted
+            self.stats['freed_bytes'] += freed
+            self.stats['last_run'] = datetime.datetime.now().isoformat()
+            self.stats['last_duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return freed
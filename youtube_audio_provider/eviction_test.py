@@ -0,0 +1,93 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from youtube_audio_provider.eviction import Evictor
+from youtube_audio_provider.storage import FlatStorage
+
+
+class TestEvictor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.storage = FlatStorage(self.tmpdir.name)
+        self.cache = MagicMock()
+        self.cache.remove_by_id.side_effect = lambda id: id + '.mp3'
+        self.candidates = []
+        self.cache.eviction_candidates.side_effect = lambda: self.candidates
+        old = time.time() - 2 * 60 * 60
+        # a: played long ago but often, b: played recently once, c: never played
+        self._add('a', old, old + 10, 5)
+        self._add('b', old, old + 20, 1)
+        self._add('c', old, None, None)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _add(self, id, mtime, last_access, hits, size=100):
+        path = os.path.join(self.tmpdir.name, id + '.mp3')
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        os.utime(path, (mtime, mtime))
+        self.candidates.append({'id': id, 'filename': id + '.mp3', 'last_access': last_access, 'hits': hits})
+
+    def _evictor(self, **config):
+        config.setdefault('interval', 3600)
+        config.setdefault('flush_interval', 3600)
+        return Evictor(config, self.cache, self.storage, MagicMock(), run_eviction=False)
+
+    def _evicted(self):
+        return [c.args[0] for c in self.cache.remove_by_id.call_args_list]
+
+    def test_lru_removes_least_recently_used_first(self):
+        # never played files count as played when they were downloaded, which is longest ago
+        freed = self._evictor(max_bytes=250, policy='lru').evict()
+
+        self.assertEqual(self._evicted(), ['c'])
+        self.assertEqual(freed, 100)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'c.mp3')))
+
+    def test_lfu_removes_least_often_used_first(self):
+        self._evictor(max_bytes=150, policy='lfu').evict()
+
+        self.assertEqual(self._evicted(), ['c', 'b'])
+
+    def test_keeps_young_files(self):
+        self._add('d', time.time(), None, None)
+
+        evictor = self._evictor(max_bytes=100, low_watermark=0.5)
+        evictor.evict()
+
+        self.assertNotIn('d', self._evicted())
+        self.assertEqual(evictor.stats['files'], 1)
+
+    def test_nothing_evicted_below_quota(self):
+        evictor = self._evictor(max_bytes=1000)
+
+        self.assertEqual(evictor.evict(), 0)
+        self.assertEqual(evictor.stats['used_bytes'], 300)
+        self.cache.remove_by_id.assert_not_called()
+
+    def test_accesses_are_written_in_one_batch(self):
+        evictor = self._evictor()
+        evictor.record_access('a.mp3')
+        evictor.record_access('a.mp3')
+        evictor.record_access('b.mp3')
+
+        evictor.flush()
+        evictor.flush()
+
+        self.cache.store_accesses.assert_called_once()
+        pending = self.cache.store_accesses.call_args.args[0]
+        self.assertEqual(pending['a.mp3'][1], 2)
+        self.assertEqual(pending['b.mp3'][1], 1)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            self._evictor(policy='random')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,24 +1,66 @@
 import os
+import html
+import json
+import time
+import bisect
+import logging
 import datetime
-import codecs
+import threading
 from urllib.parse import unquote
 from string import Template
 
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.shared_state import atomic_write
+from youtube_audio_provider.compression import available_encodings, write_compressed
+
+logger = logging.getLogger(__name__)
+
 
 class CacheHTMLExporter(object):
 
-    def __init__(self, config):
+    def __init__(self, config, info: AppInfo):
         cache_export_config = config['cache_export_config']
         self.template = cache_export_config.get("template", os.path.join(os.path.dirname(__file__), "sample.html"))
         self.filename = cache_export_config.get("file", "voice_cache.html")
         self.callurl = cache_export_config.get("callurl", "http://localhost:80")
         self.prefix = cache_export_config.get("prefix", "")
+        # incremental: keep the rendered rows, only re-render changed ones and write debounced in the background
+        self.incremental = cache_export_config.get("incremental", True)
+        self.debounce_seconds = cache_export_config.get("debounce_seconds", 2.0)
+        # gzip (and brotli if installed) variants are written next to the files, for serving them precompressed
+        self.encodings = available_encodings() if cache_export_config.get("compress", True) else []
+        # optional compact json of the phrases per file
+        self.json_filename = cache_export_config.get("json_file", None)
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._parsed_template = None
+        self._template_mtime = None
+        self._loaded = False
+        self._phrases = {}  # filename -> list of (unquoted) phrases
+        self._rows = {}  # filename -> rendered row
+        self._heads = {}  # filename -> displayed head
+        self._order = []  # sorted list of (head, filename)
+        self._timer = None
+
+        self.stats = {
+            'mode': 'incremental' if self.incremental else 'full',
+            'exports': 0,
+            'rows': 0,
+            'pending': False,
+            'last_export': None,
+            'last_duration_ms': None,
+            'max_duration_ms': 0.0,
+            'total_duration_ms': 0.0
+        }
+        info.register('export', self.stats)
 
     def _one_row_with_several_items(self, head, texts):
-        text = "\n".join(map(lambda t: '<div class="lower">' + t + "</div>", texts))
+        # titles and phrases come from youtube and the clients
+        text = "\n".join(map(lambda t: '<div class="lower">' + html.escape(t) + "</div>", texts))
         return f'''
         <li onclick='post_voicecommand(this)'>
-            <h3>{head}</h3>
+            <h3>{html.escape(head)}</h3>
             {text}
         </li>
         '''
@@ -28,29 +70,109 @@ class CacheHTMLExporter(object):
             data = template_file.read()
             return data
 
-    def export(self, data):
-        content_lines = []
+    def _get_template(self) -> Template:
+        """the parsed template, only re-read if the file changed"""
+        mtime = os.stat(self.template).st_mtime_ns
+        if self._parsed_template is None or mtime != self._template_mtime:
+            self._parsed_template = Template(self._load_template())
+            self._template_mtime = mtime
+        return self._parsed_template
+
+    def is_loaded(self) -> bool:
+        """whether incremental updates can be applied, otherwise a full export is needed"""
+        return self.incremental and self._loaded
 
+    def export(self, data, titles=None):
+        """export the full dict phrase -> filename, titles (filename -> title) are shown instead of filenames"""
+        titles = titles or {}
         inv_map = {}
         if data and data.items():
             for key, val in data.items():
-                quoted_key = unquote(key)
-                inv_map[val] = inv_map.get(val, []) + [quoted_key]
+                inv_map.setdefault(val, []).append(unquote(key))
 
-        content_lines = []
+        with self._lock:
+            self._phrases = {}
+            self._rows = {}
+            self._heads = {}
+            self._order = []
+            for filename, phrases in inv_map.items():
+                self._set_entry(filename, phrases, titles.get(filename))
+            self._loaded = True
+        self._changed()
 
-        for a in inv_map:
-            quoted_a = unquote(a)
-            content_lines.append(self._one_row_with_several_items(quoted_a, inv_map[a]))
+    def add_phrase(self, filename, phrase, title=None):
+        """add a single (quoted) phrase for filename"""
+        with self._lock:
+            self._set_entry(filename, self._phrases.get(filename, []) + [unquote(phrase)], title)
+        self._changed()
 
-        content_text = "\n".join(sorted(content_lines))
-        self.write_template_outfile(content_text)
+    def remove_entry(self, filename):
+        with self._lock:
+            if filename in self._rows:
+                head = self._heads.pop(filename)
+                del self._phrases[filename]
+                del self._rows[filename]
+                del self._order[bisect.bisect_left(self._order, (head, filename))]
+        self._changed()
+
+    def _set_entry(self, filename, phrases, title=None):
+        head = self._heads.get(filename) or title or unquote(filename)
+        if filename not in self._rows:
+            self._heads[filename] = head
+            bisect.insort(self._order, (head, filename))
+        self._phrases[filename] = phrases
+        self._rows[filename] = self._one_row_with_several_items(head, phrases)
+
+    def _changed(self):
+        if not self.incremental:
+            self.flush()
+            return
+        with self._lock:
+            if self._timer is not None:
+                return  # a write is already scheduled and will contain this change
+            self._timer = threading.Timer(self.debounce_seconds, self.flush)
+            self._timer.daemon = True
+            self.stats['pending'] = True
+            self._timer.start()
+
+    def flush(self):
+        """write pending changes now"""
+        if not self._loaded:
+            return  # nothing known yet, don't overwrite an existing export
+        with self._write_lock:
+            start = time.perf_counter()
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                content_text = "\n".join(self._rows[filename] for (head, filename) in self._order)
+                if self.json_filename:
+                    phrase_map = {filename: {'title': head, 'phrases': self._phrases[filename]}
+                                  for (head, filename) in self._order}
+                self.stats['rows'] = len(self._rows)
+                self.stats['pending'] = False
+            self.write_template_outfile(content_text)
+            if self.json_filename:
+                self._write(self.json_filename, json.dumps(phrase_map, ensure_ascii=False, separators=(',', ':')))
+
+            duration_ms = (time.perf_counter() - start) * 1000
+            self.stats['exports'] += 1
+            self.stats['last_export'] = datetime.datetime.now().isoformat()
+            self.stats['last_duration_ms'] = round(duration_ms, 3)
+            self.stats['max_duration_ms'] = round(max(self.stats['max_duration_ms'], duration_ms), 3)
+            self.stats['total_duration_ms'] = round(self.stats['total_duration_ms'] + duration_ms, 3)
+        logger.debug(f"exported {self.stats['rows']} entries in {duration_ms:.1f}ms")
 
     def write_template_outfile(self, content_text):
         now = datetime.datetime.now()
         current_time = now.strftime("%d.%m.%Y %H:%M")
 
-        templ = Template(self._load_template())
+        templ = self._get_template()
         file_text = templ.safe_substitute(content=content_text, updated=current_time, callurl=self.callurl, prefix=self.prefix)
-        with codecs.open(self.filename, 'w', "utf-8") as outfile:
-            outfile.write(file_text)
+        self._write(self.filename, file_text)
+
+    def _write(self, filename, text):
+        data = text.encode('utf-8')
+        # readers (and other processes) never see a partially written file
+        atomic_write(filename, data)
+        write_compressed(filename, data, self.encodings)
@@ -0,0 +1,113 @@
+import os
+import gzip
+import json
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from youtube_audio_provider.exporter.cache_html_exporter import CacheHTMLExporter
+
+
+class TestCacheHTMLExporter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.outfile = os.path.join(self.tmpdir.name, "voice_cache.html")
+        template = os.path.join(self.tmpdir.name, "template.html")
+        with open(template, 'w') as f:
+            f.write("<ul>$content</ul>")
+        self.config = {'cache_export_config': {'file': self.outfile, 'template': template, 'debounce_seconds': 60}}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _create_testee(self, **export_config) -> CacheHTMLExporter:
+        self.config['cache_export_config'].update(export_config)
+        return CacheHTMLExporter(self.config, MagicMock())
+
+    def _read_outfile(self):
+        with open(self.outfile) as f:
+            return f.read()
+
+    def test_export_groups_phrases_by_file_sorted(self):
+        testee = self._create_testee(incremental=False)
+
+        testee.export({'b%20phrase': 'b.mp3', 'a%20phrase': 'a.mp3', 'other': 'b.mp3'})
+
+        content = self._read_outfile()
+        self.assertLess(content.index('<h3>a.mp3</h3>'), content.index('<h3>b.mp3</h3>'))
+        self.assertIn('<div class="lower">b phrase</div>\n<div class="lower">other</div>', content)
+        self.assertEqual(testee.stats['exports'], 1)
+        self.assertEqual(testee.stats['rows'], 2)
+
+    def test_incremental_changes_are_written_on_flush(self):
+        testee = self._create_testee()
+        testee.export({'a': 'a.mp3', 'b': 'b.mp3'})
+        self.assertTrue(testee.is_loaded())
+        self.assertTrue(testee.stats['pending'])
+
+        testee.add_phrase('c.mp3', 'c%20phrase')
+        testee.add_phrase('a.mp3', 'second')
+        testee.remove_entry('b.mp3')
+        testee.flush()
+
+        content = self._read_outfile()
+        self.assertIn('<div class="lower">a</div>\n<div class="lower">second</div>', content)
+        self.assertIn('<div class="lower">c phrase</div>', content)
+        self.assertNotIn('b.mp3', content)
+        self.assertEqual(testee.stats['exports'], 1)  # all changes in one write
+        self.assertFalse(testee.stats['pending'])
+
+    def test_titles_are_shown_instead_of_filenames(self):
+        testee = self._create_testee()
+        testee.export({'a': 'id1.mp3'}, {'id1.mp3': 'Zebra'})
+
+        testee.add_phrase('id2.mp3', 'b', 'Aardvark')
+        testee.remove_entry('id1.mp3')
+        testee.flush()
+
+        content = self._read_outfile()
+        self.assertIn('<h3>Aardvark</h3>', content)
+        self.assertNotIn('Zebra', content)
+
+    def test_titles_and_phrases_are_escaped(self):
+        testee = self._create_testee(incremental=False)
+
+        testee.export({'%3Cscript%3Ex%3C%2Fscript%3E': 'id1.mp3'}, {'id1.mp3': '<b>A</b>'})
+
+        content = self._read_outfile()
+        self.assertIn('<h3>&lt;b&gt;A&lt;/b&gt;</h3>', content)
+        self.assertIn('<div class="lower">&lt;script&gt;x&lt;/script&gt;</div>', content)
+        self.assertNotIn('<b>', content)
+
+    def test_flush_without_data_keeps_existing_export(self):
+        testee = self._create_testee()
+
+        testee.flush()
+
+        self.assertFalse(os.path.exists(self.outfile))
+
+    def test_compressed_variants_and_json_are_written(self):
+        json_file = os.path.join(self.tmpdir.name, "voice_cache.json")
+        testee = self._create_testee(incremental=False, json_file=json_file)
+
+        testee.export({'a%20phrase': 'a.mp3'}, {'a.mp3': 'Title'})
+
+        with gzip.open(self.outfile + '.gz', 'rt') as f:
+            self.assertEqual(f.read(), self._read_outfile())
+        with open(json_file) as f:
+            self.assertEqual(json.load(f), {'a.mp3': {'title': 'Title', 'phrases': ['a phrase']}})
+        self.assertFalse(os.path.exists(json_file + '.gz'))  # too small to gain anything
+
+    def test_compression_can_be_disabled(self):
+        testee = self._create_testee(incremental=False, compress=False)
+
+        testee.export({'a': 'a.mp3'})
+
+        self.assertFalse(os.path.exists(self.outfile + '.gz'))
+
+    def test_template_is_parsed_once(self):
+        testee = self._create_testee(incremental=False)
+        with patch.object(testee, '_load_template', wraps=testee._load_template) as load_template:
+            testee.export({'a': 'a.mp3'})
+            testee.export({'b': 'b.mp3'})
+
+        load_template.assert_called_once()
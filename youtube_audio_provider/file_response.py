@@ -0,0 +1,170 @@
+import os
+import stat
+import uuid
+import logging
+from werkzeug.http import http_date, parse_date, parse_range_header, parse_etags
+from werkzeug.wrappers import Response
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FilePlan(object):
+    """What to answer for a file request: status, headers and the byte ranges to send.
+    Kept independent of the web framework so every serving mode shares the same semantics."""
+
+    def __init__(self, path: str, size: int, status: int, headers: dict, ranges: list, content_type: str):
+        self.path = path
+        self.size = size
+        self.status = status
+        self.headers = headers
+        self.ranges = ranges  # list of (start, stop) with exclusive stop, empty for responses without body
+        self.content_type = content_type
+        self.boundary = None
+        self.part_headers = []
+        self.closing = b''
+
+    def is_multipart(self) -> bool:
+        return self.boundary is not None
+
+
+def make_etag(st: os.stat_result) -> str:
+    """strong ETag derived from size and modification time"""
+    return '"%x-%x"' % (st.st_size, st.st_mtime_ns)
+
+
+def _satisfiable_ranges(range_header, size: int) -> list:
+    ranges = []
+    for (start, stop) in range_header.ranges:
+        if start < 0:
+            # suffix range, the last n bytes
+            start = max(size + start, 0)
+            stop = size
+        elif stop is None or stop > size:
+            stop = size
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _not_modified(headers, etag: str, mtime: float) -> bool:
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        # If-None-Match takes precedence, weak comparison
+        etags = parse_etags(if_none_match)
+        return etags.star_tag or etags.contains_weak(etag.strip('"'))
+    if_modified_since = parse_date(headers.get('If-Modified-Since'))
+    if if_modified_since is not None:
+        return int(mtime) <= int(if_modified_since.timestamp())
+    return False
+
+
+def _range_applies(headers, etag: str, mtime: float) -> bool:
+    if_range = headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # strong comparison only
+        return if_range == etag
+    date = parse_date(if_range)
+    return date is not None and int(mtime) == int(date.timestamp())
+
+
+def plan_file_response(path: str, headers, content_type: str, max_age: int, cache_control: str = None) -> FilePlan:
+    """evaluate conditional and range headers for the file at path, cache_control replaces the one of immutable
+    files. Raises FileNotFoundError if there is no such file"""
+    st = os.stat(path)
+    if not stat.S_ISREG(st.st_mode):
+        raise FileNotFoundError(path)
+    size = st.st_size
+    etag = make_etag(st)
+
+    base_headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(st.st_mtime),
+        'Cache-Control': cache_control or f'public, max-age={max_age}, immutable',
+        'Accept-Ranges': 'bytes'
+    }
+
+    if _not_modified(headers, etag, st.st_mtime):
+        return FilePlan(path, size, 304, base_headers, [], content_type)
+
+    range_header = parse_range_header(headers.get('Range'))
+    if range_header is None or range_header.units != 'bytes' or not _range_applies(headers, etag, st.st_mtime):
+        plan = FilePlan(path, size, 200, base_headers, [(0, size)] if size else [], content_type)
+        plan.headers['Content-Type'] = content_type
+        plan.headers['Content-Length'] = str(size)
+        return plan
+
+    ranges = _satisfiable_ranges(range_header, size)
+    if not ranges:
+        plan = FilePlan(path, size, 416, base_headers, [], content_type)
+        plan.headers['Content-Range'] = f'bytes */{size}'
+        return plan
+
+    plan = FilePlan(path, size, 206, base_headers, ranges, content_type)
+    if len(ranges) == 1:
+        (start, stop) = ranges[0]
+        plan.headers['Content-Type'] = content_type
+        plan.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{size}'
+        plan.headers['Content-Length'] = str(stop - start)
+        return plan
+
+    # several ranges are sent as multipart/byteranges
+    plan.boundary = uuid.uuid4().hex
+    length = 0
+    for (start, stop) in ranges:
+        part_header = (f'\r\n--{plan.boundary}\r\n'
+                       f'Content-Type: {content_type}\r\n'
+                       f'Content-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n').encode('latin-1')
+        plan.part_headers.append(part_header)
+        length += len(part_header) + stop - start
+    plan.closing = f'\r\n--{plan.boundary}--\r\n'.encode('latin-1')
+    length += len(plan.closing)
+    plan.headers['Content-Type'] = f'multipart/byteranges; boundary={plan.boundary}'
+    plan.headers['Content-Length'] = str(length)
+    return plan
+
+
+def iter_file_range(f, start: int, stop: int):
+    f.seek(start)
+    remaining = stop - start
+    while remaining > 0:
+        chunk = f.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def iter_plan_body(plan: FilePlan):
+    """the body of the plan as chunks of bytes"""
+    with open(plan.path, 'rb') as f:
+        if not plan.is_multipart():
+            for (start, stop) in plan.ranges:
+                yield from iter_file_range(f, start, stop)
+            return
+        for (part_header, (start, stop)) in zip(plan.part_headers, plan.ranges):
+            yield part_header
+            yield from iter_file_range(f, start, stop)
+        yield plan.closing
+
+
+def make_wsgi_file_response(plan: FilePlan, environ, head: bool = False) -> Response:
+    """create the response for a plan, using the servers wsgi.file_wrapper (e.g. sendfile) where possible"""
+    if head or not plan.ranges:
+        body = []
+    elif not plan.is_multipart() and 'wsgi.file_wrapper' in environ:
+        # a single contiguous range: let the server send the file, bounded by Content-Length
+        f = open(plan.path, 'rb')
+        f.seek(plan.ranges[0][0])
+        body = environ['wsgi.file_wrapper'](f, CHUNK_SIZE)
+    else:
+        body = iter_plan_body(plan)
+
+    response = Response(body, status=plan.status, headers=plan.headers, direct_passthrough=True)
+    if 'Content-Type' not in plan.headers:
+        # werkzeug adds a default content type otherwise
+        del response.headers['Content-Type']
+    return response
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from werkzeug.datastructures import Headers
+from werkzeug.http import http_date
+from youtube_audio_provider.file_response import plan_file_response, iter_plan_body, make_etag
+
+
+class TestFileResponse(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "test.mp3")
+        with open(self.path, 'wb') as f:
+            f.write(bytes(range(100)))
+        self.etag = make_etag(os.stat(self.path))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _plan(self, **headers):
+        return plan_file_response(self.path, Headers(headers), 'audio/mpeg', 3600)
+
+    def _body(self, plan):
+        return b''.join(iter_plan_body(plan))
+
+    def test_full_file(self):
+        plan = self._plan()
+
+        self.assertEqual(plan.status, 200)
+        self.assertEqual(plan.headers['Content-Length'], '100')
+        self.assertEqual(plan.headers['ETag'], self.etag)
+        self.assertIn('max-age=3600', plan.headers['Cache-Control'])
+        self.assertEqual(self._body(plan), bytes(range(100)))
+
+    def test_missing_file_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            plan_file_response(os.path.join(self.tmpdir.name, "missing.mp3"), Headers(), 'audio/mpeg', 0)
+
+    def test_if_none_match(self):
+        self.assertEqual(self._plan(**{'If-None-Match': self.etag}).status, 304)
+        self.assertEqual(self._plan(**{'If-None-Match': '"other"'}).status, 200)
+
+    def test_if_modified_since(self):
+        mtime = os.stat(self.path).st_mtime
+        self.assertEqual(self._plan(**{'If-Modified-Since': http_date(mtime + 10)}).status, 304)
+        self.assertEqual(self._plan(**{'If-Modified-Since': http_date(mtime - 10)}).status, 200)
+
+    def test_single_range(self):
+        plan = self._plan(Range='bytes=10-19')
+
+        self.assertEqual(plan.status, 206)
+        self.assertEqual(plan.headers['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(plan.headers['Content-Length'], '10')
+        self.assertEqual(self._body(plan), bytes(range(10, 20)))
+
+    def test_suffix_range(self):
+        plan = self._plan(Range='bytes=-5')
+
+        self.assertEqual(plan.headers['Content-Range'], 'bytes 95-99/100')
+        self.assertEqual(self._body(plan), bytes(range(95, 100)))
+
+    def test_multi_range(self):
+        plan = self._plan(Range='bytes=0-1,50-51')
+
+        self.assertEqual(plan.status, 206)
+        self.assertTrue(plan.headers['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = self._body(plan)
+        self.assertEqual(len(body), int(plan.headers['Content-Length']))
+        self.assertIn(b'Content-Range: bytes 0-1/100\r\n\r\n' + bytes([0, 1]), body)
+        self.assertIn(b'Content-Range: bytes 50-51/100\r\n\r\n' + bytes([50, 51]), body)
+
+    def test_unsatisfiable_range(self):
+        plan = self._plan(Range='bytes=200-300')
+
+        self.assertEqual(plan.status, 416)
+        self.assertEqual(plan.headers['Content-Range'], 'bytes */100')
+
+    def test_if_range_mismatch_sends_full_file(self):
+        plan = self._plan(Range='bytes=10-19', **{'If-Range': '"other"'})
+
+        self.assertEqual(plan.status, 200)
@@ -0,0 +1,92 @@
+import re
+import logging
+from urllib.parse import unquote_plus
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+class FulltextIndex(object):
+    """SQLite FTS5 table over phrase, title, artist and filename of every search phrase,
+    the rowid is the id of the phrase. It is kept in sync by the Cache write methods."""
+
+    TABLE = 'phrase_fts'
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.enabled = self._create()
+
+    def _create(self) -> bool:
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.TABLE} USING fts5("
+                    "phrase, title, artist, filename, entry_id UNINDEXED, quoted_phrase UNINDEXED, "
+                    "tokenize = 'unicode61 remove_diacritics 2')"
+                ))
+            return True
+        except OperationalError:
+            logger.warning("sqlite has no fts5 support, falling back to plain fulltext search")
+            return False
+
+    def is_empty(self, session: Session) -> bool:
+        return session.execute(text(f"SELECT 1 FROM {self.TABLE} LIMIT 1")).first() is None
+
+    def rebuild(self, session: Session, rows):
+        """fill the index from (phrase id, quoted phrase, entry) rows"""
+        session.execute(text(f"DELETE FROM {self.TABLE}"))
+        for (phrase_id, quoted_phrase, e) in rows:
+            self.add(session, phrase_id, quoted_phrase, e)
+
+    def add(self, session: Session, phrase_id: int, quoted_phrase: str, e):
+        session.execute(
+            text(f"INSERT INTO {self.TABLE} (rowid, phrase, title, artist, filename, entry_id, quoted_phrase) "
+                 "VALUES (:rowid, :phrase, :title, :artist, :filename, :entry_id, :quoted_phrase)"),
+            {
+                'rowid': phrase_id,
+                'phrase': unquote_plus(quoted_phrase),
+                'title': e.title,
+                'artist': e.artist,
+                'filename': e.filename,
+                'entry_id': e.id,
+                'quoted_phrase': quoted_phrase
+            })
+
+    def update_entry(self, session: Session, e):
+        """take over the changed title, artist and filename of the entry in the rows of its phrases"""
+        session.execute(
+            text(f"UPDATE {self.TABLE} SET title = :title, artist = :artist, filename = :filename "
+                 "WHERE entry_id = :entry_id"),
+            {'title': e.title, 'artist': e.artist, 'filename': e.filename, 'entry_id': e.id})
+
+    def remove_entry(self, session: Session, entry_id: str):
+        session.execute(text(f"DELETE FROM {self.TABLE} WHERE entry_id = :entry_id"), {'entry_id': entry_id})
+
+    def _match_expression(self, search: str) -> str | None:
+        # every token has to match as prefix of a word
+        tokens = TOKEN_PATTERN.findall(search)
+        if not tokens:
+            return None
+        return " ".join('"' + t.replace('"', '""') + '"*' for t in tokens)
+
+    def search(self, session: Session, quoted_search: str, limit: int, offset: int):
+        """best matching entries by bm25, one (quoted phrase, filename, title, artist) tuple per entry"""
+        match = self._match_expression(unquote_plus(quoted_search))
+        if match is None:
+            return []
+        # the matches are materialized, bm25() can't be used in a flattened aggregate query.
+        # sqlite returns the other columns of the row holding the MIN() for bare columns
+        stmt = text(
+            "WITH matches AS MATERIALIZED ("
+            f"  SELECT quoted_phrase, filename, title, artist, entry_id, bm25({self.TABLE}, 2.0, 1.5, 1.5, 1.0) AS score"
+            f"  FROM {self.TABLE} WHERE {self.TABLE} MATCH :match"
+            ") SELECT quoted_phrase, filename, title, artist, MIN(score) AS best FROM matches"
+            " GROUP BY entry_id ORDER BY best LIMIT :limit OFFSET :offset"
+        )
+        rows = session.execute(stmt, {'match': match, 'limit': limit, 'offset': offset}).all()
+        return [(r[0], r[1], r[2], r[3]) for r in rows]
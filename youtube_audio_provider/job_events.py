@@ -0,0 +1,52 @@
+import json
+import logging
+
+from youtube_audio_provider.scheduler import Job
+
+logger = logging.getLogger(__name__)
+
+EVENT_STREAM_CONTENT_TYPE = 'text/event-stream; charset=utf-8'
+# headers of an event stream: never cached, not buffered by a reverse proxy
+EVENT_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+
+def format_event(event: str, data, id: int = None) -> str:
+    """a server-sent event"""
+    lines = [] if id is None else [f'id: {id}']
+    lines.append(f'event: {event}')
+    lines.extend('data: ' + line for line in json.dumps(data).splitlines())
+    return '\n'.join(lines) + '\n\n'
+
+
+def _is_last_event(job: Job, seq: int) -> bool:
+    # the job emits its final status when it is done
+    if seq < 1 or seq > len(job.events):
+        return False
+    (_, event, data) = job.events[seq - 1]
+    return event == 'status' and data.get('status') in (Job.FINISHED, Job.FAILED)
+
+
+def iter_job_events(job: Job, result_of, last_event_id: int = 0, keepalive: float = 15.0):
+    """Server-sent events of a job until it is done: its progress events after last_event_id (the Last-Event-ID of a
+    reconnecting client) and, as soon as the job is ready, a 'result' event with the data of result_of(job) or an
+    'error' event if that returns a status other than 200. A comment is sent after keepalive seconds without event,
+    so proxies keep the connection open. The events are encoded, ready to be written to the client."""
+    # an id from before a restart or made up must not skip the final status, the stream would never end
+    seq = min(last_event_id, len(job.events))
+    result_sent = False
+    while True:
+        # a finished job emits nothing more, don't wait for it
+        events = job.events_after(seq, 0 if job.is_done() else keepalive)
+        for (seq, event, data) in events:
+            yield format_event(event, data, seq).encode('utf-8')
+        if not result_sent and job.is_ready():
+            (status, body) = result_of(job)
+            if status == 200:
+                yield format_event('result', body).encode('utf-8')
+            else:
+                yield format_event('error', dict(body, status=status)).encode('utf-8')
+            result_sent = True
+        if _is_last_event(job, seq):
+            return
+        if not events:
+            yield b': keepalive\n\n'
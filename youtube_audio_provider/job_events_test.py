@@ -0,0 +1,70 @@
+import threading
+import unittest
+from youtube_audio_provider.scheduler import Job
+from youtube_audio_provider.job_events import format_event, iter_job_events
+
+
+def parse(chunks):
+    """(id, event, data) of the events, comments are skipped"""
+    events = []
+    for chunk in chunks:
+        chunk = chunk.decode('utf-8')
+        if chunk.startswith(':'):
+            continue
+        fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n'))
+        events.append((fields.get('id'), fields['event'], fields['data']))
+    return events
+
+
+class TestJobEvents(unittest.TestCase):
+
+    def _result_of(self, job):
+        return (200, {'filename': job.result['filename']})
+
+    def test_format_event(self):
+        self.assertEqual(format_event('download', {'bytes': 1}, 3), 'id: 3\nevent: download\ndata: {"bytes": 1}\n\n')
+
+    def test_streams_progress_and_result_until_done(self):
+        def fn(job):
+            job.emit('resolved', id='abc')
+            return {'filename': 'abc.mp3'}
+        job = Job(fn, 'test')
+        threading.Thread(target=job._run).start()
+
+        events = parse(iter_job_events(job, self._result_of, keepalive=5))
+
+        self.assertEqual([e[1] for e in events], ['status', 'status', 'resolved', 'status', 'result'])
+        self.assertEqual(events[-1][2], '{"filename": "abc.mp3"}')
+        self.assertEqual(events[-2], ('4', 'status', '{"status": "finished"}'))
+
+    def test_resumes_after_last_event_id(self):
+        job = Job(lambda job: {'filename': 'abc.mp3'}, 'test')
+        job._run()
+
+        events = parse(iter_job_events(job, self._result_of, last_event_id=2, keepalive=5))
+
+        self.assertEqual([e[0] for e in events], ['3', None])
+
+    def test_last_event_id_beyond_the_events_ends_the_stream(self):
+        job = Job(lambda job: {'filename': 'abc.mp3'}, 'test')
+        job._run()
+
+        events = parse(iter_job_events(job, self._result_of, last_event_id=99, keepalive=5))
+
+        self.assertEqual([e[1] for e in events], ['result'])
+
+    def test_keepalive_while_waiting(self):
+        release = threading.Event()
+        job = Job(lambda job: release.wait(5) and {'filename': 'abc.mp3'}, 'test')
+        threading.Thread(target=job._run).start()
+        stream = iter_job_events(job, self._result_of, keepalive=0.01)
+
+        chunks = [next(stream), next(stream), next(stream)]
+        release.set()
+
+        self.assertEqual(chunks[2], b': keepalive\n\n')
+        self.assertEqual(parse(stream)[-1][1], 'result')
+
+
+if __name__ == '__main__':
+    unittest.main()
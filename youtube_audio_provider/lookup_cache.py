@@ -0,0 +1,62 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from youtube_audio_provider.appinfo import AppInfo
+
+logger = logging.getLogger(__name__)
+
+
+class LookupCache(object):
+    """A bounded, thread safe LRU mapping, reporting its statistics via AppInfo."""
+
+    def __init__(self, max_size: int, info: AppInfo, name: str):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+        self.stats = {'size': 0, 'max_size': max_size, 'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        info.register(name, self.stats)
+
+    def get(self, key):
+        """the value for key or None, marks the key as recently used"""
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.stats['evictions'] += 1
+            self.stats['size'] = len(self._data)
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.stats['invalidations'] += 1
+            self.stats['size'] = len(self._data)
+
+    def invalidate_values(self, predicate):
+        """remove all keys whose value matches the predicate"""
+        with self._lock:
+            keys = [k for (k, v) in self._data.items() if predicate(v)]
+            for k in keys:
+                del self._data[k]
+            self.stats['invalidations'] += len(keys)
+            self.stats['size'] = len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self.stats['invalidations'] += len(self._data)
+            self._data.clear()
+            self.stats['size'] = 0
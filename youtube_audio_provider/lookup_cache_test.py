@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import MagicMock
+from youtube_audio_provider.lookup_cache import LookupCache
+
+
+class TestLookupCache(unittest.TestCase):
+
+    def _create_testee(self, max_size=2) -> LookupCache:
+        return LookupCache(max_size, MagicMock(), 'test')
+
+    def test_get_counts_hits_and_misses(self):
+        testee = self._create_testee()
+        testee.put('a', 1)
+
+        self.assertEqual(testee.get('a'), 1)
+        self.assertIsNone(testee.get('b'))
+        self.assertEqual(testee.stats['hits'], 1)
+        self.assertEqual(testee.stats['misses'], 1)
+
+    def test_put_evicts_least_recently_used(self):
+        testee = self._create_testee()
+        testee.put('a', 1)
+        testee.put('b', 2)
+        testee.get('a')
+        testee.put('c', 3)
+
+        self.assertIsNone(testee.get('b'))
+        self.assertEqual(testee.get('a'), 1)
+        self.assertEqual(testee.get('c'), 3)
+        self.assertEqual(testee.stats['evictions'], 1)
+        self.assertEqual(testee.stats['size'], 2)
+
+    def test_invalidate_values(self):
+        testee = self._create_testee(max_size=3)
+        testee.put('a', ('1', {}))
+        testee.put('b', ('1', {}))
+        testee.put('c', ('2', {}))
+
+        testee.invalidate_values(lambda v: v[0] == '1')
+
+        self.assertIsNone(testee.get('a'))
+        self.assertIsNone(testee.get('b'))
+        self.assertIsNotNone(testee.get('c'))
+        self.assertEqual(testee.stats['invalidations'], 2)
@@ -1,13 +1,12 @@
 import sys
 import json
 import os
+import signal
+import socket
 import logging
 
-from youtube_audio_provider.webserver import Webserver
-from youtube_audio_provider.downloader import Downloader
-from youtube_audio_provider.exporter.cache_html_exporter import CacheHTMLExporter
 from youtube_audio_provider.appinfo import AppInfo
-from youtube_audio_provider.cache_db import Cache as CacheDB
+from youtube_audio_provider.startup import StartupTimer
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +33,97 @@ def store_pid_file(pidfilename):
     f.close()
 
 
+def create_listen_socket(config):
+    listen_socket = socket.create_server(('0.0.0.0', config['webserver_port']), backlog=128)
+    listen_socket.set_inheritable(True)
+    return listen_socket
+
+
+def create_webserver(config, listen_socket=None, worker_index=None, startup: StartupTimer = None):
+    """the webserver with all its components, worker_index is given in a pre-forked worker process"""
+    startup = startup or StartupTimer()
+    fast_start = config.get('startup', {}).get('fast', False)
+    with startup.phase('imports'):
+        # flask and sqlalchemy take a while, imported here so the timing covers them
+        from youtube_audio_provider.webserver import Webserver
+        from youtube_audio_provider.downloader import Downloader
+        from youtube_audio_provider.exporter.cache_html_exporter import CacheHTMLExporter
+        from youtube_audio_provider.cache_db import Cache as CacheDB
+        from youtube_audio_provider.shared_state import SharedState
+        from youtube_audio_provider.storage import create_storage
+
+    info = AppInfo(startup)
+    info.register('config', config)  # put full config into info
+
+    shared = None
+    if (worker_index is not None):
+        shared = SharedState(config.get('multiprocess', {}), info, worker_index)
+
+    storage = create_storage(config)
+    with startup.phase('exporter'):
+        exporter = CacheHTMLExporter(config, info)
+    with startup.phase('cache'):
+        cache_db = CacheDB(exporter, info, config.get('audio_path', 'audio'), config.get('cache_db_config', {}),
+                           shared, storage, fast_start)
+    with startup.phase('downloader'):
+        dl = Downloader(config, info, shared, storage)
+
+    with startup.phase('webserver'):
+        return Webserver(config, dl, cache_db, info, listen_socket)
+
+
+def run_worker(config, listen_socket, worker_index):
+    """body of a forked worker process, does not return"""
+    code = 1
+    try:
+        # the parents handlers don't apply here
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        startup = StartupTimer()
+        ws = create_webserver(config, listen_socket, worker_index, startup)
+        ws.start()
+        startup.ready()
+        ws.join()
+        code = 0
+    except Exception:
+        logger.exception(f"worker {worker_index} failed")
+    finally:
+        os._exit(code)
+
+
+def run_workers(config, workers: int):
+    """pre-fork workers accepting on one shared socket. A worker that exits cleanly (/exit) shuts all down,
+    a crashed one is replaced"""
+    listen_socket = create_listen_socket(config)
+    children = {}  # pid -> worker index
+
+    def spawn(worker_index):
+        pid = os.fork()
+        if (pid == 0):
+            run_worker(config, listen_socket, worker_index)
+        children[pid] = worker_index
+        logger.info(f"started worker {worker_index} with PID {pid}")
+
+    def terminate(signum=None, frame=None):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, terminate)
+    for worker_index in range(workers):
+        spawn(worker_index)
+
+    while children:
+        (pid, status) = os.wait()
+        worker_index = children.pop(pid)
+        if (os.waitstatus_to_exitcode(status) == 0):
+            logger.info(f"worker {worker_index} exited, shutting down")
+            terminate()
+        logger.warning(f"worker {worker_index} died, restarting it")
+        spawn(worker_index)
+
+
 def main():
     store_pid_file("pidfile.pid")
     setup_logging()
@@ -41,20 +131,25 @@ def main():
     config = load_config()
     logging.getLogger().setLevel(config.get('loglevel', 'INFO'))
 
-    info = AppInfo()
-    info.register('config', config)  # put full config into info
-
-    exporter = CacheHTMLExporter(config)
-    cache_db = CacheDB(exporter, info, config.get('audio_path', 'audio'))
-    dl = Downloader(config, info)
+    workers = config.get('multiprocess', {}).get('workers', 1)
+    if (workers > 1):
+        run_workers(config, workers)
+        return
 
-    ws = Webserver(config, dl, cache_db, info)
+    startup = StartupTimer()
+    listen_socket = None
+    if (config.get('startup', {}).get('fast', False)):
+        # requests arriving while starting up wait in the backlog instead of being refused
+        with startup.phase('bind'):
+            listen_socket = create_listen_socket(config)
+    ws = create_webserver(config, listen_socket, startup=startup)
 
     # incase this is run as deamon
     # ws.setDaemon(True)
 
     try:
         ws.start()
+        startup.ready()
     except KeyboardInterrupt:
         print("Exiting\n")
         sys.exit(0)
@@ -0,0 +1,210 @@
+import math
+import time
+import threading
+import contextlib
+
+# seconds, from a cache hit to a long download
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _Shards(object):
+    """Values per thread. Every thread writes to a dict of its own without locking, scraping adds them up.
+    The dicts of finished threads are folded into one, so short lived request threads don't accumulate,
+    also when nothing scrapes: registering a thread folds them once there are fold_at shards."""
+
+    def __init__(self, add, fold_at: int = 64):
+        # add(total, value) merges a value into the total
+        self._add = add
+        self._min_fold_at = fold_at
+        self._fold_at = fold_at
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (thread, values)
+        self._retired = {}
+
+    def mine(self) -> dict:
+        values = getattr(self._local, 'values', None)
+        if values is None:
+            values = {}
+            self._local.values = values
+            with self._lock:
+                if len(self._shards) >= self._fold_at:
+                    self._fold_dead()
+                    # many threads alive: fold again when their number doubled, not on every new thread
+                    self._fold_at = max(self._min_fold_at, 2 * len(self._shards))
+                self._shards.append((threading.current_thread(), values))
+        return values
+
+    def _fold_dead(self):
+        """merge the values of finished threads into the retired ones, called with the lock held"""
+        alive = []
+        for (thread, values) in self._shards:
+            if thread.is_alive():
+                alive.append((thread, values))
+            else:
+                # a finished thread does not write anymore
+                for (key, value) in values.items():
+                    self._retired[key] = self._add(self._retired.get(key), value)
+        self._shards = alive
+
+    def collect(self) -> dict:
+        """the values of all threads"""
+        with self._lock:
+            self._fold_dead()
+            result = {}
+            for (key, value) in self._retired.items():
+                result[key] = self._add(None, value)
+            for (thread, values) in self._shards:
+                for (key, value) in values.copy().items():
+                    result[key] = self._add(result.get(key), value)
+        return result
+
+
+def _format_labels(names, values, extra=()) -> str:
+    pairs = [(n, v) for (n, v) in zip(names, values)] + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for (n, v) in pairs)
+    return '{' + ','.join(f'{n}="{v}"' for ((n, _), v) in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """a monotonically increasing count per label values"""
+
+    TYPE = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards(lambda total, v: (total or 0) + v)
+
+    def inc(self, *labelvalues, amount: float = 1):
+        values = self._shards.mine()
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def collect(self) -> dict:
+        return self._shards.collect()
+
+    def render(self) -> list:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}'
+                for (key, v) in sorted(self.collect().items())]
+
+
+class Histogram(object):
+    """observations counted into cumulative buckets per label values, with their sum"""
+
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _Shards(lambda total, v: [a + b for (a, b) in zip(total, v)] if total else list(v))
+
+    def observe(self, value: float, *labelvalues):
+        values = self._shards.mine()
+        counts = values.get(labelvalues)
+        if counts is None:
+            # one count per bucket, the +Inf count and the sum
+            counts = [0] * (len(self.buckets) + 2)
+            values[labelvalues] = counts
+        for (i, bound) in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-2] += 1
+        counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *labelvalues):
+        """observe the seconds the block took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def collect(self) -> dict:
+        return self._shards.collect()
+
+    def render(self) -> list:
+        lines = []
+        for (key, counts) in sorted(self.collect().items()):
+            cumulative = 0
+            for (bound, count) in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge(object):
+    """a current value read when scraped, fn returns a number or a dict label values -> number"""
+
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, help: str, fn, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def render(self) -> list:
+        value = self.fn()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}'
+                for (key, v) in sorted(value.items()) if v is not None]
+
+
+class Metrics(object):
+    """Registry of the metrics, rendered in the Prometheus text format. Getting a metric that exists already
+    returns it, so components can share one."""
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get_or_create(self, name: str, create):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = create()
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn, labelnames=()) -> Gauge:
+        """fn replaces the one of an existing gauge, the latest component reports"""
+        gauge = self._get_or_create(name, lambda: Gauge(name, help, fn, labelnames))
+        gauge.fn = fn
+        return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.TYPE}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,81 @@
+import threading
+import unittest
+
+from youtube_audio_provider.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_counter_adds_up_all_threads(self):
+        counter = self.metrics.counter('requests_total', 'requests', ('route',))
+
+        def count():
+            for _ in range(1000):
+                counter.inc('/a')
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        counter.inc('/b', amount=2)
+
+        self.assertEqual(counter.collect(), {('/a',): 4000, ('/b',): 2})
+        # the finished threads are folded, nothing is lost or counted twice
+        self.assertEqual(counter.collect(), {('/a',): 4000, ('/b',): 2})
+
+    def test_shards_of_finished_threads_are_folded_without_scraping(self):
+        counter = self.metrics.counter('requests_total', 'requests', ('route',))
+
+        for _ in range(200):
+            t = threading.Thread(target=counter.inc, args=('/a',))
+            t.start()
+            t.join()
+
+        self.assertLessEqual(len(counter._shards._shards), 64)
+        self.assertEqual(counter.collect(), {('/a',): 200})
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = self.metrics.histogram('duration_seconds', 'duration', ('stage',), buckets=(0.1, 1.0))
+        histogram.observe(0.05, 'fetch')
+        histogram.observe(0.5, 'fetch')
+        histogram.observe(5, 'fetch')
+
+        lines = self.metrics.render().splitlines()
+
+        self.assertIn('# TYPE duration_seconds histogram', lines)
+        self.assertIn('duration_seconds_bucket{stage="fetch",le="0.1"} 1', lines)
+        self.assertIn('duration_seconds_bucket{stage="fetch",le="1.0"} 2', lines)
+        self.assertIn('duration_seconds_bucket{stage="fetch",le="+Inf"} 3', lines)
+        self.assertIn('duration_seconds_sum{stage="fetch"} 5.55', lines)
+        self.assertIn('duration_seconds_count{stage="fetch"} 3', lines)
+
+    def test_histogram_time(self):
+        histogram = self.metrics.histogram('query_seconds', 'queries', ('statement',))
+
+        with histogram.time('SELECT'):
+            pass
+
+        self.assertEqual(histogram.collect()[('SELECT',)][-1] >= 0, True)
+        self.assertIn('query_seconds_count{statement="SELECT"} 1', self.metrics.render())
+
+    def test_gauge_reads_current_value(self):
+        queued = [3]
+        self.metrics.gauge('queue_depth', 'jobs waiting', lambda: queued[0])
+        queued[0] = 5
+
+        self.assertIn('queue_depth 5', self.metrics.render().splitlines())
+
+    def test_same_name_returns_same_metric(self):
+        self.assertIs(self.metrics.counter('a_total', 'a'), self.metrics.counter('a_total', 'a'))
+
+    def test_label_values_are_escaped(self):
+        self.metrics.counter('results_total', 'results', ('by',)).inc('say "hi"')
+
+        self.assertIn('results_total{by="say \\"hi\\""} 1', self.metrics.render())
+
+
+if __name__ == '__main__':
+    unittest.main()
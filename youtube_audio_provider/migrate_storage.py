@@ -0,0 +1,52 @@
+"""Move the audio files of a flat audio directory into the sharded layout.
+
+The logical filenames (and with them the /audio/ URLs and the cache database) stay the same.
+Set "storage_layout": "sharded" in config.json afterwards. Stop the server while migrating.
+
+    python -m youtube_audio_provider.migrate_storage [--config config.json] [--dry-run]
+"""
+import os
+import sys
+import json
+import argparse
+import logging
+
+from youtube_audio_provider.storage import ShardedStorage
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(directory: str, dry_run: bool = False):
+    """move every file directly in directory to its sharded path, returns the counts"""
+    storage = ShardedStorage(directory)
+    result = {'moved': 0, 'skipped': 0}
+    with os.scandir(storage.directory) as entries:
+        files = [e for e in entries if e.is_file(follow_symlinks=False) and not e.name.startswith('.')]
+    for e in files:
+        target = storage.path(e.name)
+        if os.path.exists(target):
+            logger.warning(f"not moving {e.name}, {target} exists already")
+            result['skipped'] += 1
+            continue
+        if not dry_run:
+            storage.put(e.path, e.name)
+        result['moved'] += 1
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    with open(args.config) as data_file:
+        config = json.load(data_file)
+    result = migrate(config.get('audio_path', 'audio'), args.dry_run)
+    json.dump(result, sys.stdout)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import mimetypes
+import threading
+import contextlib
+import subprocess
+
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.singleflight import SingleFlight
+from youtube_audio_provider.shared_state import SharedState
+from youtube_audio_provider.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# the stored file as downloaded
+ORIGINAL = 'original'
+# derived files are kept apart from the originals, hidden from the reconciliation
+VARIANTS_DIR_NAME = '.variants'
+
+
+class UnknownProfileError(ValueError):
+    """a profile was requested that is not configured"""
+    pass
+
+
+def ffmpeg_binary(ffmpeg_location: str) -> str:
+    """the ffmpeg executable of the configured ffmpeg_location (the binary or its directory)"""
+    if not ffmpeg_location:
+        return 'ffmpeg'
+    if os.path.isdir(ffmpeg_location):
+        return os.path.join(ffmpeg_location, 'ffmpeg')
+    return ffmpeg_location
+
+
+class Profile(object):
+    """an audio format files are transcoded to for clients that need it"""
+
+    def __init__(self, name: str, config):
+        self.name = name
+        self.codec = config['codec']  # ffmpeg encoder, e.g. libmp3lame, libopus, aac
+        self.bitrate = config.get('bitrate')
+        self.ext = config['ext']
+        self.format = config.get('format', self.ext)  # ffmpeg muxer
+        self.mimetype = config.get('mimetype') or mimetypes.guess_type('x.' + self.ext)[0] \
+            or 'application/octet-stream'
+
+    def ffmpeg_args(self) -> list:
+        args = ['-vn', '-codec:a', self.codec]
+        if self.bitrate:
+            args += ['-b:a', self.bitrate]
+        return args + ['-f', self.format]
+
+
+class OutputProfiles(object):
+    """Selects the output profile of a request, by the profile query parameter or else by the first configured
+    user agent substring, and provides the file in that profile. Only the original is downloaded, variants are
+    transcoded from it on first request and kept until their original is removed."""
+
+    def __init__(self, config, storage: Storage, ffmpeg_location: str, info: AppInfo, shared: SharedState = None):
+        # how downloads are stored: 'mp3' (transcoded) or 'passthrough' (the source codec, no re-encode)
+        self.source = config.get('source', 'mp3')
+        if self.source not in ('mp3', 'passthrough'):
+            raise ValueError(f'unknown source format {self.source}')
+        self.profiles = {name: Profile(name, c) for (name, c) in config.get('profiles', {}).items()}
+        self.default = config.get('default', ORIGINAL)
+        self.user_agents = config.get('user_agents', {})  # user agent substring -> profile name
+        for name in [self.default] + list(self.user_agents.values()):
+            if name != ORIGINAL and name not in self.profiles:
+                raise ValueError(f'unknown output profile {name}')
+        self.varies_by_user_agent = bool(self.user_agents)
+
+        self.storage = storage
+        self.variants = type(storage)(os.path.join(storage.directory, VARIANTS_DIR_NAME))
+        self.ffmpeg = ffmpeg_binary(ffmpeg_location)
+        self.shared = shared
+        self._transcodes = threading.BoundedSemaphore(config.get('max_concurrent_transcodes', 2))
+        self.flight = SingleFlight(info, 'singleflight.transcode')
+
+        self.stats = {
+            'source': self.source,
+            'requests': {name: 0 for name in [ORIGINAL] + list(self.profiles)},
+            'variant_hits': 0,
+            'transcodes': 0,
+            'failed_transcodes': 0,
+            'pruned_variants': 0,
+            'last_transcode_ms': None
+        }
+        info.register('output_profiles', self.stats)
+        self.transcode_duration = info.metrics.histogram(
+            'yap_variant_transcode_duration_seconds', 'ffmpeg time to transcode a variant', ('profile',))
+
+        prune_interval = config.get('prune_interval', 60 * 60)
+        if self.profiles and prune_interval:
+            threading.Thread(target=self._prune_loop, args=(prune_interval,), name='variant-prune',
+                             daemon=True).start()
+
+    def select(self, requested: str | None, user_agent: str | None) -> Profile | None:
+        """the profile to serve, None for the original"""
+        name = requested
+        if not name:
+            name = next((p for (agent, p) in self.user_agents.items() if agent in (user_agent or '')), self.default)
+        if name != ORIGINAL and name not in self.profiles:
+            raise UnknownProfileError(f'unknown output profile {name}')
+        self.stats['requests'][name] += 1
+        return self.profiles.get(name)
+
+    def variant_filename(self, filename: str, profile: Profile) -> str:
+        return f'{filename}.{profile.name}.{profile.ext}'
+
+    def variant(self, filename: str, profile: Profile) -> str:
+        """the path of the file in the profile, transcoded if it does not exist yet.
+        Raises FileNotFoundError if the original does not exist"""
+        name = self.variant_filename(filename, profile)
+        path = self.variants.path(name)
+        if path is None:
+            raise FileNotFoundError(filename)
+        if os.path.exists(path):
+            self.stats['variant_hits'] += 1
+            return path
+        return self.flight.do(name, lambda: self._transcode_locked(filename, profile, name))[0]
+
+    def _lock(self, name: str):
+        if self.shared is None:
+            return contextlib.nullcontext()
+        return self.shared.lock('variant-' + name)
+
+    def _transcode_locked(self, filename: str, profile: Profile, name: str) -> str:
+        with self._lock(name):
+            # another worker process may have transcoded it while waiting for the lock
+            path = self.variants.path(name)
+            if os.path.exists(path):
+                return path
+            with self._transcodes:
+                return self.transcode(filename, profile, name)
+
+    def transcode(self, filename: str, profile: Profile, name: str) -> str:
+        """transcode the original into the variant name, returns its path"""
+        source = self.storage.path(filename)
+        if source is None or not os.path.exists(source):
+            raise FileNotFoundError(filename)
+        incomplete = os.path.join(self.variants.directory, '.incomplete')
+        os.makedirs(incomplete, exist_ok=True)
+        out_path = os.path.join(incomplete, name)
+        command = [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-y', '-i', source] \
+            + profile.ffmpeg_args() + [out_path]
+
+        start = time.perf_counter()
+        try:
+            subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                           check=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            self.stats['failed_transcodes'] += 1
+            with contextlib.suppress(OSError):
+                os.remove(out_path)
+            raise RuntimeError(f'transcoding {filename} to {profile.name} failed: {e}') from e
+        path = self.variants.put(out_path, name)
+        seconds = time.perf_counter() - start
+        self.transcode_duration.observe(seconds, profile.name)
+        self.stats['transcodes'] += 1
+        self.stats['last_transcode_ms'] = round(seconds * 1000, 3)
+        logger.info(f"transcoded {filename} to {profile.name}")
+        return path
+
+    def remove_variants(self, filename: str):
+        """remove the derived files of an original"""
+        for profile in self.profiles.values():
+            with contextlib.suppress(FileNotFoundError):
+                self.variants.remove(self.variant_filename(filename, profile))
+
+    def prune(self) -> int:
+        """remove variants whose original is gone, e.g. evicted, returns how many"""
+        pruned = 0
+        pending = [self.variants.directory]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as entries:
+                    for e in entries:
+                        if e.name.startswith('.'):
+                            continue
+                        if e.is_dir(follow_symlinks=False):
+                            pending.append(e.path)
+                            continue
+                        # <original filename>.<profile>.<ext>
+                        original = e.name.rsplit('.', 2)[0]
+                        if not self.storage.exists(original):
+                            with contextlib.suppress(FileNotFoundError):
+                                self.variants.remove(e.name)
+                            pruned += 1
+            except FileNotFoundError:
+                pass
+        self.stats['pruned_variants'] += pruned
+        return pruned
+
+    def _prune_loop(self, interval: float):
+        while True:
+            try:
+                self.prune()
+            except Exception:
+                logger.exception("pruning variants failed")
+            time.sleep(interval)
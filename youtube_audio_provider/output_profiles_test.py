@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from youtube_audio_provider.output_profiles import OutputProfiles, UnknownProfileError
+from youtube_audio_provider.storage import FlatStorage, ShardedStorage
+
+CONFIG = {
+    'profiles': {
+        'opus': {'codec': 'libopus', 'bitrate': '96k', 'ext': 'opus', 'format': 'ogg'},
+        'mp3_128': {'codec': 'libmp3lame', 'bitrate': '128k', 'ext': 'mp3'}
+    },
+    'user_agents': {'Sonos': 'mp3_128', 'Firefox': 'opus'},
+    'prune_interval': 0
+}
+
+
+def fake_ffmpeg(command, **kwargs):
+    # the output path is the last argument
+    with open(command[-1], 'wb') as f:
+        f.write(b'transcoded')
+
+
+class TestOutputProfiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.storage = ShardedStorage(self.tmpdir.name)
+        source = os.path.join(self.tmpdir.name, 'tmp')
+        with open(source, 'wb') as f:
+            f.write(b'original')
+        self.storage.put(source, 'song.mp3')
+        self.profiles = OutputProfiles(CONFIG, self.storage, None, MagicMock())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_select_by_parameter_before_user_agent(self):
+        self.assertEqual(self.profiles.select('opus', 'Sonos/80.1').name, 'opus')
+        self.assertEqual(self.profiles.select(None, 'Linux UPnP/1.0 Sonos/80.1').name, 'mp3_128')
+        self.assertIsNone(self.profiles.select(None, 'curl/8.0'))
+        self.assertIsNone(self.profiles.select('original', 'Sonos/80.1'))
+
+    def test_select_unknown_profile(self):
+        with self.assertRaises(UnknownProfileError):
+            self.profiles.select('flac', None)
+
+    def test_unknown_profile_in_config(self):
+        with self.assertRaises(ValueError):
+            OutputProfiles({'default': 'opus'}, self.storage, None, MagicMock())
+
+    @patch('youtube_audio_provider.output_profiles.subprocess.run', side_effect=fake_ffmpeg)
+    def test_variant_is_transcoded_once(self, mock_run):
+        opus = self.profiles.profiles['opus']
+
+        path = self.profiles.variant('song.mp3', opus)
+        again = self.profiles.variant('song.mp3', opus)
+
+        self.assertEqual(path, again)
+        self.assertEqual(os.path.basename(path), 'song.mp3.opus.opus')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'transcoded')
+        mock_run.assert_called_once()
+        command = mock_run.call_args.args[0]
+        self.assertEqual(command[command.index('-i') + 1], self.storage.path('song.mp3'))
+        self.assertIn('libopus', command)
+        self.assertEqual(self.profiles.stats['transcodes'], 1)
+        self.assertEqual(self.profiles.stats['variant_hits'], 1)
+        self.assertEqual(self.profiles.profiles['opus'].mimetype, 'audio/ogg')
+
+    @patch('youtube_audio_provider.output_profiles.subprocess.run', side_effect=OSError('no ffmpeg'))
+    def test_failed_transcode_leaves_no_variant(self, mock_run):
+        with self.assertRaises(RuntimeError):
+            self.profiles.variant('song.mp3', self.profiles.profiles['opus'])
+
+        self.assertEqual(self.profiles.stats['failed_transcodes'], 1)
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, '.variants', '.incomplete')), [])
+
+    def test_variant_of_missing_original(self):
+        with self.assertRaises(FileNotFoundError):
+            self.profiles.variant('other.mp3', self.profiles.profiles['opus'])
+
+    @patch('youtube_audio_provider.output_profiles.subprocess.run', side_effect=fake_ffmpeg)
+    def test_prune_removes_variants_of_removed_originals(self, mock_run):
+        path = self.profiles.variant('song.mp3', self.profiles.profiles['opus'])
+        self.assertEqual(self.profiles.prune(), 0)
+
+        self.storage.remove('song.mp3')
+
+        self.assertEqual(self.profiles.prune(), 1)
+        self.assertFalse(os.path.exists(path))
+
+    @patch('youtube_audio_provider.output_profiles.subprocess.run', side_effect=fake_ffmpeg)
+    def test_remove_variants(self, mock_run):
+        storage = FlatStorage(self.tmpdir.name)
+        profiles = OutputProfiles(CONFIG, storage, None, MagicMock())
+        open(os.path.join(self.tmpdir.name, 'flat.mp3'), 'w').close()
+        path = profiles.variant('flat.mp3', profiles.profiles['mp3_128'])
+
+        profiles.remove_variants('flat.mp3')
+
+        self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import re
+import logging
+import threading
+import unicodedata
+from collections import defaultdict
+from urllib.parse import unquote_plus
+
+from youtube_audio_provider.appinfo import AppInfo
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# words that don't tell songs apart, the voice prefix is usually german
+DEFAULT_STOP_WORDS = [
+    'a', 'an', 'the', 'and', 'of', 'by', 'feat', 'ft', 'featuring', 'official', 'video', 'audio', 'lyrics', 'hd',
+    'der', 'die', 'das', 'und', 'von', 'mit', 'ein', 'eine', 'lied', 'song'
+]
+
+
+def normalize_phrase(quoted_search: str, stop_words=frozenset()) -> str:
+    """a key equal for spelling variants: unicode normalized, without accents, punctuation and stop words,
+    the words sorted"""
+    decomposed = unicodedata.normalize('NFKD', unquote_plus(quoted_search))
+    without_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    tokens = TOKEN_PATTERN.findall(without_accents.casefold())
+    words = [t for t in tokens if t not in stop_words]
+    return ' '.join(sorted(words or tokens))
+
+
+def numbers(key: str) -> set:
+    """the words of a normalized phrase containing a digit, e.g. the number of a symphony or a part"""
+    return {w for w in key.split(' ') if any(c.isdigit() for c in w)}
+
+
+def trigrams(key: str) -> set:
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class PhraseMatcher(object):
+    """Finds the entry of a known phrase that is equal or similar to a search phrase.
+    Similarity is the jaccard index of the trigrams of the normalized phrases, phrases with different numbers
+    (no 21 and no 23 of a composer) are never similar."""
+
+    def __init__(self, config, info: AppInfo):
+        self.threshold = config.get('threshold', 0.8)
+        self.stop_words = frozenset(config.get('stop_words', DEFAULT_STOP_WORDS))
+
+        self._lock = threading.Lock()
+        self._entries = {}  # normalized phrase -> entry id
+        self._trigrams = defaultdict(set)  # trigram -> normalized phrases containing it
+        self._sizes = {}  # normalized phrase -> number of its trigrams
+
+        self.stats = {'phrases': 0, 'exact_hits': 0, 'similar_hits': 0, 'misses': 0}
+        info.register('phrase_matcher', self.stats)
+
+    def normalize(self, quoted_search: str) -> str:
+        return normalize_phrase(quoted_search, self.stop_words)
+
+    def add(self, quoted_phrase: str, entry_id: str):
+        key = self.normalize(quoted_phrase)
+        if not key:
+            return
+        key_trigrams = trigrams(key)
+        with self._lock:
+            self._entries[key] = entry_id
+            self._sizes[key] = len(key_trigrams)
+            for t in key_trigrams:
+                self._trigrams[t].add(key)
+            self.stats['phrases'] = len(self._entries)
+
+    def remove_entry(self, entry_id: str):
+        with self._lock:
+            keys = [k for (k, v) in self._entries.items() if v == entry_id]
+            for key in keys:
+                del self._entries[key]
+                del self._sizes[key]
+                for t in trigrams(key):
+                    self._trigrams[t].discard(key)
+                    if not self._trigrams[t]:
+                        del self._trigrams[t]
+            self.stats['phrases'] = len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._trigrams.clear()
+            self._sizes.clear()
+            self.stats['phrases'] = 0
+
+    def match(self, quoted_search: str):
+        """the id of the entry with the same or the most similar phrase above the threshold and the similarity,
+        or None. The similarity is 1.0 for the same normalized phrase only"""
+        key = self.normalize(quoted_search)
+        if not key:
+            return None
+        with self._lock:
+            entry_id = self._entries.get(key)
+            if entry_id is not None:
+                self.stats['exact_hits'] += 1
+                return (entry_id, 1.0)
+
+            search_trigrams = trigrams(key)
+            shared = defaultdict(int)
+            for t in search_trigrams:
+                for candidate in self._trigrams.get(t, ()):
+                    shared[candidate] += 1
+
+            best = None
+            search_numbers = numbers(key)
+            for (candidate, count) in shared.items():
+                similarity = count / (len(search_trigrams) + self._sizes[candidate] - count)
+                if similarity < self.threshold or (best is not None and similarity <= best[1]):
+                    continue
+                if numbers(candidate) != search_numbers:
+                    continue
+                # different phrases with the same trigrams (repeated letters) are still not the same phrase
+                best = (self._entries[candidate], min(similarity, 0.999))
+
+            self.stats['similar_hits' if best else 'misses'] += 1
+            return best
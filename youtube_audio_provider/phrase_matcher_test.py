@@ -0,0 +1,48 @@
+import unittest
+from unittest.mock import MagicMock
+from youtube_audio_provider.phrase_matcher import PhraseMatcher, normalize_phrase
+
+
+class TestPhraseMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = PhraseMatcher({'threshold': 0.7}, MagicMock())
+        self.matcher.add("queen%20bohemian%20rhapsody", "1")
+        self.matcher.add("another%20one%20bites%20the%20dust", "2")
+
+    def test_normalize_phrase(self):
+        stop_words = frozenset(['the'])
+        self.assertEqual(normalize_phrase("Queen%20%E2%80%93%20Bohemian%20Rhapsody"), "bohemian queen rhapsody")
+        self.assertEqual(normalize_phrase("Bj%C3%B6rk+-+Army+of+Me"), "army bjork me of")
+        self.assertEqual(normalize_phrase("the%20the", stop_words), "the the")  # only stop words are kept
+
+    def test_match_variants_exactly(self):
+        self.assertEqual(self.matcher.match("Queen%20%E2%80%93%20Bohemian%20Rhapsody"), ("1", 1.0))
+        self.assertEqual(self.matcher.match("bohemian%20rhapsody%20queen"), ("1", 1.0))
+        self.assertEqual(self.matcher.stats['exact_hits'], 2)
+
+    def test_match_similar(self):
+        (entry_id, similarity) = self.matcher.match("queen%20bohemian%20rapsody")
+
+        self.assertEqual(entry_id, "1")
+        self.assertLess(similarity, 1.0)
+        self.assertEqual(self.matcher.stats['similar_hits'], 1)
+
+    def test_no_match_below_threshold(self):
+        self.assertIsNone(self.matcher.match("queen%20we%20will%20rock%20you"))
+        self.assertEqual(self.matcher.stats['misses'], 1)
+
+    def test_numbers_must_be_equal(self):
+        matcher = PhraseMatcher({}, MagicMock())
+        matcher.add("Mozart%20piano%20concerto%20no%2021", "21")
+        matcher.add("Tschaikowsky%20Klavierkonzert%20Nr%201", "1")
+
+        self.assertIsNone(matcher.match("Mozart%20piano%20concerto%20no%2023"))
+        self.assertIsNone(matcher.match("Tschaikowsky%20Klavierkonzert%20Nr%202"))
+        self.assertEqual(matcher.match("Mozart%20piano%20concerto%20no.%2021")[0], "21")
+        self.assertEqual(matcher.match("Tschaikowsky%20Klavierkonzrt%20Nr%201")[0], "1")
+
+    def test_remove_entry(self):
+        self.matcher.remove_entry("1")
+
+        self.assertIsNone(self.matcher.match("queen%20bohemian%20rhapsody"))
+        self.assertEqual(self.matcher.stats['phrases'], 1)
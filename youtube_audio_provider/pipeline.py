@@ -0,0 +1,95 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from youtube_audio_provider.appinfo import AppInfo
+
+logger = logging.getLogger(__name__)
+
+
+def stage_duration_histogram(info: AppInfo):
+    return info.metrics.histogram(
+        'yap_stage_duration_seconds',
+        'time a download stage ran: resolve is the youtube search, fetch the download, transcode ffmpeg, '
+        'register the cache database, download fetch and transcode without pipeline', ('stage',))
+
+
+class Stage(object):
+    """a step of the pipeline with a worker pool of its own"""
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix=f'stage-{name}')
+        self._lock = threading.Lock()
+        self.stats = {'workers': workers, 'queued': 0, 'running': 0, 'completed': 0, 'failed': 0,
+                      'total_ms': 0.0, 'max_ms': 0.0}
+
+    def _count(self, before: str, after: str):
+        with self._lock:
+            self.stats[before] -= 1
+            self.stats[after] += 1
+
+
+class Pipeline(object):
+    """Runs the steps of a download on pools sized for their work: resolving and fetching wait for the network,
+    transcoding needs a core per ffmpeg process, registering writes the database. A job waiting for a busy stage
+    does not hold a worker of another stage, so a slow transcode does not delay the next fetch.
+    The time every stage took (waiting for a worker and running) is recorded per job."""
+
+    STAGES = ('resolve', 'fetch', 'transcode', 'register')
+
+    def __init__(self, config, info: AppInfo):
+        cores = os.cpu_count() or 1
+        default_workers = {'resolve': 2, 'fetch': 2, 'transcode': cores, 'register': 1}
+        self.stages = {name: Stage(name, config.get(f'{name}_workers', default_workers[name]))
+                       for name in Pipeline.STAGES}
+        info.register('pipeline', {name: stage.stats for (name, stage) in self.stages.items()})
+        self.duration = stage_duration_histogram(info)
+        self.wait_duration = info.metrics.histogram(
+            'yap_stage_wait_duration_seconds', 'time a download waited for a worker of the stage', ('stage',))
+        info.metrics.gauge('yap_stage_queued', 'downloads waiting for a worker of the stage',
+                           lambda: {(name,): stage.stats['queued'] for (name, stage) in self.stages.items()},
+                           ('stage',))
+
+    def workers(self, stage: str) -> int:
+        return self.stages[stage].stats['workers']
+
+    def capacity(self) -> int:
+        """how many jobs can be in the pipeline without any stage running idle"""
+        return sum(self.workers(name) for name in Pipeline.STAGES)
+
+    def run(self, stage_name: str, fn, timings: dict = None):
+        """run fn on the pool of the stage and wait for its result,
+        timings[stage_name] is set to the milliseconds waited for a worker and running"""
+        stage = self.stages[stage_name]
+        submitted = time.perf_counter()
+        started = []
+
+        def call():
+            started.append(time.perf_counter())
+            stage._count('queued', 'running')
+            try:
+                result = fn()
+            except BaseException:
+                stage._count('running', 'failed')
+                raise
+            stage._count('running', 'completed')
+            return result
+
+        with stage._lock:
+            stage.stats['queued'] += 1
+        try:
+            return stage.executor.submit(call).result()
+        finally:
+            end = time.perf_counter()
+            run_ms = (end - started[0]) * 1000 if started else 0.0
+            self.duration.observe(run_ms / 1000, stage_name)
+            self.wait_duration.observe((started[0] if started else end) - submitted, stage_name)
+            with stage._lock:
+                stage.stats['total_ms'] = round(stage.stats['total_ms'] + run_ms, 3)
+                stage.stats['max_ms'] = round(max(stage.stats['max_ms'], run_ms), 3)
+            if timings is not None:
+                timings[stage_name] = {'wait_ms': round(((started[0] if started else end) - submitted) * 1000, 3),
+                                       'run_ms': round(run_ms, 3)}
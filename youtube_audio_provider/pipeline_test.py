@@ -0,0 +1,49 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from youtube_audio_provider.pipeline import Pipeline
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.pipeline = Pipeline({'fetch_workers': 1, 'transcode_workers': 1}, MagicMock())
+
+    def test_run_returns_result_and_records_timings(self):
+        timings = {}
+
+        result = self.pipeline.run('fetch', lambda: 42, timings)
+
+        self.assertEqual(result, 42)
+        self.assertEqual(set(timings['fetch']), {'wait_ms', 'run_ms'})
+        self.assertEqual(self.pipeline.stages['fetch'].stats['completed'], 1)
+        self.assertEqual(self.pipeline.stages['fetch'].stats['queued'], 0)
+
+    def test_run_raises_error_of_stage(self):
+        def fail():
+            raise RuntimeError('ffmpeg failed')
+
+        with self.assertRaises(RuntimeError):
+            self.pipeline.run('transcode', fail)
+
+        self.assertEqual(self.pipeline.stages['transcode'].stats['failed'], 1)
+        self.assertEqual(self.pipeline.stages['transcode'].stats['running'], 0)
+
+    def test_busy_transcode_does_not_block_fetch(self):
+        release = threading.Event()
+        transcoding = threading.Thread(target=self.pipeline.run, args=('transcode', release.wait))
+        transcoding.start()
+
+        try:
+            self.assertEqual(self.pipeline.run('fetch', lambda: 'fetched'), 'fetched')
+        finally:
+            release.set()
+            transcoding.join()
+
+    def test_capacity(self):
+        self.assertEqual(self.pipeline.capacity(), 2 + 1 + 1 + 1)  # resolve, fetch, transcode, register
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+import uuid
+import time
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.scheduler import DownloadScheduler, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+
+class Batch(object):
+
+    PENDING = 'pending'
+    QUEUED = 'queued'
+    RESOLVED = 'resolved'
+    CACHED = 'cached'
+    DOWNLOADED = 'downloaded'
+    FAILED = 'failed'
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.created = datetime.datetime.now().isoformat()
+        self.finished = None
+        self.items = []
+        self._lock = threading.Lock()
+
+    def add_item(self, kind: str, value: str):
+        item = {'kind': kind, 'value': value, 'status': Batch.PENDING}
+        with self._lock:
+            self.items.append(item)
+        return item
+
+    def update_item(self, item, status: str = None, **kwargs):
+        with self._lock:
+            if status is not None:
+                item['status'] = status
+            item.update(kwargs)
+
+    def is_done(self) -> bool:
+        return self.finished is not None
+
+    def to_dict(self):
+        with self._lock:
+            items = [dict(i) for i in self.items]
+        counts = {}
+        for i in items:
+            counts[i['status']] = counts.get(i['status'], 0) + 1
+        res = {}
+        res['id'] = self.id
+        res['created'] = self.created
+        res['finished'] = self.finished
+        res['done'] = self.is_done()
+        res['total'] = len(items)
+        res['counts'] = counts
+        res['items'] = items
+        return res
+
+
+class Prefetcher(object):
+    """Warms the cache from lists of phrases, youtube ids and playlists in the background.
+    Cached items are skipped, the rest is downloaded on the scheduler with a limited number of jobs per batch."""
+
+    def __init__(self, config, scheduler: DownloadScheduler, cache, info: AppInfo,
+                 fetch_phrase, fetch_id, resolve_playlist):
+        self.concurrency = config.get('concurrency', 2)
+        self.keep_batches = config.get('keep_batches', 20)
+        self.scheduler = scheduler
+        self.cache = cache
+        # callables doing the actual work: fetch_phrase(search, job), fetch_id(id, job), resolve_playlist(url)
+        self.fetch_phrase = fetch_phrase
+        self.fetch_id = fetch_id
+        self.resolve_playlist = resolve_playlist
+
+        self._lock = threading.Lock()
+        self._batches = OrderedDict()
+
+        self.stats = {'batches': 0, 'items': 0, 'cached': 0, 'downloaded': 0, 'failed': 0}
+        info.register('prefetch', self.stats)
+
+    def submit(self, phrases=None, ids=None, playlists=None) -> Batch:
+        batch = Batch()
+        for p in phrases or []:
+            batch.add_item('phrase', p)
+        for i in ids or []:
+            batch.add_item('id', i)
+        for url in playlists or []:
+            batch.add_item('playlist', url)
+
+        with self._lock:
+            self._batches[batch.id] = batch
+            while len(self._batches) > self.keep_batches:
+                self._batches.popitem(last=False)
+            self.stats['batches'] += 1
+
+        thread = threading.Thread(target=self._run, args=(batch,), name=f'prefetch-{batch.id}', daemon=True)
+        thread.start()
+        return batch
+
+    def get(self, batch_id: str) -> Batch | None:
+        with self._lock:
+            return self._batches.get(batch_id)
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _expand_playlists(self, batch: Batch):
+        for item in [i for i in batch.items if i['kind'] == 'playlist']:
+            try:
+                ids = self.resolve_playlist(item['value'])
+                batch.update_item(item, Batch.RESOLVED, count=len(ids))
+                for id in ids:
+                    batch.add_item('id', id)
+            except Exception as e:
+                logger.exception(f"could not resolve playlist {item['value']}")
+                batch.update_item(item, Batch.FAILED, error=str(e))
+
+    def _is_cached(self, item) -> bool:
+        if item['kind'] == 'phrase':
+            return self.cache.retrieve_by_search(quote(item['value'])) is not None
+        return self.cache.retrieve_by_id(item['value']) is not None
+
+    def _run(self, batch: Batch):
+        slots = threading.BoundedSemaphore(self.concurrency)
+        try:
+            self._expand_playlists(batch)
+            for item in [i for i in batch.items if i['kind'] != 'playlist']:
+                try:
+                    self._prefetch_item(batch, item, slots)
+                except Exception as e:
+                    # one broken item must not stop the batch
+                    logger.exception(f"could not prefetch {item['value']}")
+                    batch.update_item(item, Batch.FAILED, error=str(e))
+                    self._count('failed')
+
+            # every slot is released once its item is completely done
+            for i in range(self.concurrency):
+                slots.acquire()
+        finally:
+            batch.finished = datetime.datetime.now().isoformat()
+        logger.info(f"prefetch batch {batch.id} done: {batch.to_dict()['counts']}")
+
+    def _prefetch_item(self, batch: Batch, item, slots):
+        self._count('items')
+        if self._is_cached(item):
+            batch.update_item(item, Batch.CACHED)
+            self._count('cached')
+            return
+        slots.acquire()
+        try:
+            self._submit_item(batch, item, slots)
+        except Exception:
+            # no job took the slot
+            slots.release()
+            raise
+
+    def _submit_item(self, batch: Batch, item, slots):
+        def fetch(job):
+            try:
+                if item['kind'] == 'phrase':
+                    result = self.fetch_phrase(item['value'], job)
+                else:
+                    result = self.fetch_id(item['value'], job)
+                if result is None:
+                    raise RuntimeError('nothing downloaded')
+                status = Batch.DOWNLOADED if result.get('by') == 'download' else Batch.CACHED
+                batch.update_item(item, status, filename=result.get('filename'))
+                self._count(status)
+                return result
+            except Exception as e:
+                batch.update_item(item, Batch.FAILED, error=str(e))
+                self._count('failed')
+                raise
+            finally:
+                slots.release()
+
+        batch.update_item(item, Batch.QUEUED)
+        while True:
+            try:
+                job = self.scheduler.submit(fetch, f"prefetch {item['value']}")
+                batch.update_item(item, job=job.id)
+                return
+            except QueueFullError:
+                # background work gives way to interactive requests
+                time.sleep(1)
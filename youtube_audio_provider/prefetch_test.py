@@ -0,0 +1,51 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+from youtube_audio_provider.prefetch import Prefetcher, Batch
+from youtube_audio_provider.scheduler import DownloadScheduler
+
+
+class TestPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.mock_cache = MagicMock()
+        self.mock_cache.retrieve_by_search.return_value = None
+        self.mock_cache.retrieve_by_id.side_effect = lambda id: {'filename': 'cached.mp3'} if id == 'cached_id' else None
+        self.fetch_phrase = MagicMock(return_value={'filename': 'phrase.mp3', 'by': 'download'})
+        self.fetch_id = MagicMock(side_effect=lambda id, job: {'filename': f'{id}.mp3', 'by': 'download'})
+        self.resolve_playlist = MagicMock(return_value=['list_id1', 'cached_id'])
+        scheduler = DownloadScheduler({'workers': 2, 'queue_size': 4}, MagicMock())
+        self.prefetcher = Prefetcher({'concurrency': 2}, scheduler, self.mock_cache, MagicMock(),
+                                     self.fetch_phrase, self.fetch_id, self.resolve_playlist)
+
+    def _wait_done(self, batch: Batch):
+        for i in range(500):
+            if batch.is_done():
+                return batch.to_dict()
+            time.sleep(0.01)
+        self.fail('batch did not finish')
+
+    def test_submit_downloads_uncached_items(self):
+        batch = self.prefetcher.submit(phrases=['a phrase'], ids=['id1', 'cached_id'], playlists=['http://list'])
+
+        result = self._wait_done(batch)
+
+        self.assertEqual(result['counts'], {'downloaded': 3, 'cached': 2, 'resolved': 1})
+        self.fetch_phrase.assert_called_once()
+        self.assertEqual(sorted(c[0][0] for c in self.fetch_id.call_args_list), ['id1', 'list_id1'])
+        self.assertIs(self.prefetcher.get(batch.id), batch)
+
+    def test_failed_item_is_reported(self):
+        self.fetch_phrase.return_value = None
+
+        result = self._wait_done(self.prefetcher.submit(phrases=['a phrase']))
+
+        self.assertEqual(result['counts'], {'failed': 1})
+        self.assertEqual(self.prefetcher.stats['failed'], 1)
+
+    def test_item_failing_before_download_does_not_stop_the_batch(self):
+        self.mock_cache.retrieve_by_search.side_effect = RuntimeError('database is locked')
+
+        result = self._wait_done(self.prefetcher.submit(phrases=['a phrase'], ids=['id1']))
+
+        self.assertEqual(result['counts'], {'failed': 1, 'downloaded': 1})
+        self.assertEqual(result['items'][0]['error'], 'database is locked')
@@ -0,0 +1,81 @@
+import logging
+import threading
+
+from youtube_audio_provider.appinfo import AppInfo
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class GrowingFile(object):
+    """An audio file that is still being written by a transcoder. Once complete it is moved from path to final_path,
+    a reader opening it just after the move finds it there."""
+
+    def __init__(self, path: str, final_path: str = None):
+        self.path = path
+        self.final_path = final_path
+        self.complete = threading.Event()
+        self.failed = False
+
+    def open(self):
+        try:
+            return open(self.path, 'rb')
+        except FileNotFoundError:
+            if self.final_path is None:
+                raise
+            return open(self.final_path, 'rb')
+
+
+class ProgressiveFiles(object):
+    """Registry of the files currently written progressively, keyed by filename relative to the audio directory."""
+
+    def __init__(self, info: AppInfo):
+        self._lock = threading.Lock()
+        self._files = {}
+
+        self.stats = {'active': 0, 'started': 0, 'completed': 0, 'failed': 0, 'last_time_to_ready_ms': None}
+        info.register('progressive', self.stats)
+
+    def start(self, filename: str, path: str, final_path: str = None) -> GrowingFile:
+        growing = GrowingFile(path, final_path)
+        with self._lock:
+            self._files[filename] = growing
+            self.stats['started'] += 1
+            self.stats['active'] = len(self._files)
+        return growing
+
+    def ready(self, time_to_ready_ms: float):
+        """record the time until the first audio could be served"""
+        self.stats['last_time_to_ready_ms'] = round(time_to_ready_ms, 3)
+
+    def finish(self, filename: str, ok: bool):
+        with self._lock:
+            growing = self._files.pop(filename, None)
+            self.stats['completed' if ok else 'failed'] += 1
+            self.stats['active'] = len(self._files)
+        if growing is not None:
+            growing.failed = not ok
+            growing.complete.set()
+
+    def get(self, filename: str) -> GrowingFile | None:
+        with self._lock:
+            return self._files.get(filename)
+
+
+def iter_growing_file(growing: GrowingFile, poll_interval: float = 0.2):
+    """yield the content of the file while it grows, until the writer completed it"""
+    with growing.open() as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if chunk:
+                yield chunk
+            elif growing.complete.is_set():
+                # drain what was written between the last read and completion
+                chunk = f.read(CHUNK_SIZE)
+                while chunk:
+                    yield chunk
+                    chunk = f.read(CHUNK_SIZE)
+                return
+            else:
+                growing.complete.wait(poll_interval)
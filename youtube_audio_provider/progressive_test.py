@@ -0,0 +1,56 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from youtube_audio_provider.progressive import ProgressiveFiles, iter_growing_file
+
+
+class TestProgressiveFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "test.mp3")
+        self.files = ProgressiveFiles(MagicMock())
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_start_and_finish(self):
+        growing = self.files.start("test.mp3", self.path)
+        self.assertIs(self.files.get("test.mp3"), growing)
+
+        self.files.finish("test.mp3", False)
+
+        self.assertIsNone(self.files.get("test.mp3"))
+        self.assertTrue(growing.complete.is_set())
+        self.assertTrue(growing.failed)
+        self.assertEqual(self.files.stats['failed'], 1)
+
+    def test_iter_growing_file_follows_writer(self):
+        growing = self.files.start("test.mp3", self.path)
+        f = open(self.path, 'wb')
+        f.write(b'first')
+        f.flush()
+
+        def writer():
+            f.write(b'second')
+            f.close()
+            self.files.finish("test.mp3", True)
+
+        timer = threading.Timer(0.1, writer)
+        timer.start()
+        content = b''.join(iter_growing_file(growing, poll_interval=0.01))
+        timer.join()
+
+        self.assertEqual(content, b'firstsecond')
+
+    def test_iter_growing_file_moved_before_completion(self):
+        final_path = os.path.join(self.tmpdir.name, "final.mp3")
+        growing = self.files.start("test.mp3", self.path, final_path)
+        with open(final_path, 'wb') as f:
+            f.write(b'complete')
+        threading.Timer(0.1, self.files.finish, ("test.mp3", True)).start()
+
+        content = b''.join(iter_growing_file(growing, poll_interval=0.01))
+
+        self.assertEqual(content, b'complete')
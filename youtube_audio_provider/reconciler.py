@@ -0,0 +1,160 @@
+import os
+import re
+import time
+import logging
+import datetime
+import threading
+
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# files named after a youtube id can be indexed without knowing their search phrase
+YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+
+class Reconciler(object):
+    """Knows which audio files exist without a syscall per lookup. The storage is scanned once at startup
+    and every interval seconds, in between the set of files is kept up to date by the writes of the cache.
+    Each scan compares the files with the entries: entries without file are reported as missing,
+    files without entry (orphans) are indexed when their name is a youtube id and they were moved into the storage
+    at least orphan_min_age seconds ago, a younger file may be a download that is about to be registered."""
+
+    def __init__(self, config, cache, storage: Storage, info: AppInfo, index_orphans: bool = True):
+        self.interval = config.get('interval', 60 * 60)
+        self.index_orphans = config.get('index_orphans', True) and index_orphans
+        self.orphan_min_age = config.get('orphan_min_age', 5 * 60)
+        # cache provides entry_filenames() and index_orphans(filenames)
+        self.cache = cache
+        self.storage = storage
+
+        self._lock = threading.Lock()
+        self._files = None  # logical filenames, None until the first scan
+        self._changes = None  # (filename, exists) noted while a scan runs
+
+        self.stats = {
+            'files': None,
+            'entries': None,
+            'missing_entries': None,
+            'orphan_files': None,
+            'indexed_orphans': 0,
+            'misplaced_files': None,
+            'unknown_checks': 0,
+            'scans': 0,
+            'last_scan': None,
+            'scan_duration_ms': None
+        }
+        info.register('reconciliation', self.stats)
+
+    def start(self):
+        """scan now and then periodically in the background"""
+        self.reconcile()
+        if self.interval:
+            threading.Thread(target=self._loop, name='reconcile', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reconcile()
+            except Exception:
+                logger.exception("reconciliation failed")
+
+    def exists(self, filename: str) -> bool:
+        with self._lock:
+            if self._files is not None and filename in self._files:
+                return True
+        # unknown, e.g. written by another worker process since the last scan
+        self.stats['unknown_checks'] += 1
+        if self.storage.exists(filename):
+            self.file_added(filename)
+            return True
+        return False
+
+    def file_added(self, filename: str):
+        self._note(filename, True)
+
+    def file_removed(self, filename: str):
+        self._note(filename, False)
+
+    def _note(self, filename: str, exists: bool):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((filename, exists))
+            if self._files is None:
+                return
+            if exists:
+                self._files.add(filename)
+            else:
+                self._files.discard(filename)
+
+    def scan(self):
+        """the logical filenames in the storage and the number of files at paths the storage does not map to"""
+        files = set()
+        misplaced = 0
+        pending = [self.storage.directory]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as entries:
+                    for e in entries:
+                        # hidden ones are incomplete downloads, locks and the like
+                        if e.name.startswith('.'):
+                            continue
+                        if e.is_dir(follow_symlinks=False):
+                            pending.append(e.path)
+                        elif e.is_file() and self.storage.path(e.name) == e.path:
+                            files.add(e.name)
+                        else:
+                            misplaced += 1
+            except FileNotFoundError:
+                pass
+        return (files, misplaced)
+
+    def _is_settled(self, filename: str, before: float) -> bool:
+        # the ctime is set by the move into the storage, the mtime may be the upload date of the video
+        try:
+            return os.stat(self.storage.path(filename)).st_ctime <= before
+        except OSError:
+            return False
+
+    def reconcile(self):
+        """scan the storage, compare it with the entries and index orphans"""
+        start = time.perf_counter()
+        with self._lock:
+            self._changes = []
+        (files, misplaced) = self.scan()
+        with self._lock:
+            # apply what was written or removed during the scan
+            for (filename, exists) in self._changes:
+                if exists:
+                    files.add(filename)
+                else:
+                    files.discard(filename)
+            self._changes = None
+            self._files = files
+
+        entries = self.cache.entry_filenames()
+        missing = [f for f in entries if f not in files]
+        orphans = sorted(files - entries)
+        for filename in missing:
+            logger.warning(f"file of entry does not exist: {filename}")
+
+        indexed = 0
+        if self.index_orphans:
+            before = time.time() - self.orphan_min_age
+            indexable = [f for f in orphans
+                         if YOUTUBE_ID.match(os.path.splitext(f)[0]) and self._is_settled(f, before)]
+            if indexable:
+                indexed = self.cache.index_orphans(indexable)
+                logger.info(f"indexed {indexed} orphan files")
+
+        self.stats['files'] = len(files)
+        self.stats['entries'] = len(entries)
+        self.stats['missing_entries'] = len(missing)
+        self.stats['orphan_files'] = len(orphans) - indexed
+        self.stats['indexed_orphans'] += indexed
+        self.stats['misplaced_files'] = misplaced
+        self.stats['scans'] += 1
+        self.stats['last_scan'] = datetime.datetime.now().isoformat()
+        self.stats['scan_duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from youtube_audio_provider.reconciler import Reconciler
+from youtube_audio_provider.storage import FlatStorage, ShardedStorage
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = MagicMock()
+        self.cache.entry_filenames.return_value = set()
+        self.cache.index_orphans.side_effect = lambda filenames: len(filenames)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _put(self, storage, filename):
+        path = os.path.join(self.tmpdir.name, 'tmp')
+        open(path, 'w').close()
+        storage.put(path, filename)
+
+    def _reconciler(self, storage, index_orphans=True):
+        reconciler = Reconciler({'interval': 0, 'orphan_min_age': 0}, self.cache, storage, MagicMock(), index_orphans)
+        reconciler.start()
+        return reconciler
+
+    def test_scan_finds_sharded_files_and_skips_hidden_ones(self):
+        storage = ShardedStorage(self.tmpdir.name)
+        self._put(storage, 'dQw4w9WgXcQ.mp3')
+        os.makedirs(os.path.join(self.tmpdir.name, '.incomplete', 'x'))
+        open(os.path.join(self.tmpdir.name, '.incomplete', 'x', 'x.mp3'), 'w').close()
+        open(os.path.join(self.tmpdir.name, 'stray.mp3'), 'w').close()  # not where the storage puts it
+
+        (files, misplaced) = Reconciler({}, self.cache, storage, MagicMock()).scan()
+
+        self.assertEqual(files, {'dQw4w9WgXcQ.mp3'})
+        self.assertEqual(misplaced, 1)
+
+    def test_exists_needs_no_syscall_for_known_files(self):
+        storage = FlatStorage(self.tmpdir.name)
+        self._put(storage, 'song.mp3')
+        reconciler = self._reconciler(storage)
+        storage.exists = MagicMock(return_value=False)
+
+        self.assertTrue(reconciler.exists('song.mp3'))
+        storage.exists.assert_not_called()
+
+    def test_exists_checks_unknown_files(self):
+        storage = FlatStorage(self.tmpdir.name)
+        reconciler = self._reconciler(storage)
+        self._put(storage, 'new.mp3')  # e.g. by another worker
+
+        self.assertTrue(reconciler.exists('new.mp3'))
+        self.assertFalse(reconciler.exists('other.mp3'))
+        self.assertEqual(reconciler.stats['unknown_checks'], 2)
+
+    def test_removed_files_are_forgotten(self):
+        storage = FlatStorage(self.tmpdir.name)
+        self._put(storage, 'song.mp3')
+        reconciler = self._reconciler(storage)
+
+        storage.remove('song.mp3')
+        reconciler.file_removed('song.mp3')
+
+        self.assertFalse(reconciler.exists('song.mp3'))
+
+    def test_reports_missing_entries_and_indexes_orphans(self):
+        storage = FlatStorage(self.tmpdir.name)
+        self._put(storage, 'dQw4w9WgXcQ.mp3')
+        self._put(storage, 'Some Title.mp3')
+        self.cache.entry_filenames.return_value = {'gone.mp3'}
+
+        reconciler = self._reconciler(storage)
+
+        self.cache.index_orphans.assert_called_once_with(['dQw4w9WgXcQ.mp3'])
+        self.assertEqual(reconciler.stats['missing_entries'], 1)
+        self.assertEqual(reconciler.stats['orphan_files'], 1)
+        self.assertEqual(reconciler.stats['indexed_orphans'], 1)
+        self.assertEqual(reconciler.stats['files'], 2)
+
+    def test_recently_added_orphans_are_not_indexed(self):
+        storage = FlatStorage(self.tmpdir.name)
+        self._put(storage, 'dQw4w9WgXcQ.mp3')  # e.g. a download not registered yet
+
+        reconciler = Reconciler({'interval': 0}, self.cache, storage, MagicMock())
+        reconciler.start()
+
+        self.cache.index_orphans.assert_not_called()
+        self.assertEqual(reconciler.stats['orphan_files'], 1)
+
+    def test_only_indexing_worker_indexes_orphans(self):
+        storage = FlatStorage(self.tmpdir.name)
+        self._put(storage, 'dQw4w9WgXcQ.mp3')
+
+        self._reconciler(storage, index_orphans=False)
+
+        self.cache.index_orphans.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+import uuid
+import queue
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+
+from youtube_audio_provider.appinfo import AppInfo
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """raised when a job is submitted while the queue is at its limit"""
+    pass
+
+
+class Job(object):
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+
+    def __init__(self, fn, description: str):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.status = Job.QUEUED
+        self.result = None
+        self.error = None
+        self.created = datetime.datetime.now().isoformat()
+        self.started = None
+        self.finished = None
+        # stage of the download -> milliseconds waited and run
+        self.timings = {}
+        # (sequence number, event, data) of the progress, numbered from 1
+        self.events = []
+        self._events_changed = threading.Condition()
+
+        self._fn = fn
+        self._ready = threading.Event()
+        self.emit('status', status=self.status)
+
+    def _run(self):
+        self.status = Job.RUNNING
+        self.started = datetime.datetime.now().isoformat()
+        self.emit('status', status=self.status)
+        try:
+            result = self._fn(self)
+            if not self._ready.is_set():
+                self.result = result
+            self.status = Job.FINISHED
+        except Exception as e:
+            logger.exception(f"job {self.id} ({self.description}) failed")
+            self.error = e
+            self.status = Job.FAILED
+        finally:
+            self.finished = datetime.datetime.now().isoformat()
+            self._ready.set()
+            self.emit('status', status=self.status)
+
+    def resolve(self, result):
+        """publish the result before the job is done, waiters are released immediately"""
+        self.result = result
+        self._ready.set()
+        self.emit('ready')
+
+    def emit(self, event: str, **data):
+        """record a progress event of the job, wakes up the subscribers"""
+        with self._events_changed:
+            self.events.append((len(self.events) + 1, event, data))
+            self._events_changed.notify_all()
+
+    def events_after(self, seq: int, timeout=None) -> list:
+        """the events after sequence number seq, waits up to timeout for one if there is none yet"""
+        with self._events_changed:
+            self._events_changed.wait_for(lambda: len(self.events) > seq, timeout)
+            return self.events[seq:]
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def is_done(self) -> bool:
+        return self.status in (Job.FINISHED, Job.FAILED)
+
+    def wait(self, timeout=None) -> bool:
+        """wait until the result is available, returns False on timeout"""
+        return self._ready.wait(timeout)
+
+    def get_result(self):
+        """the result of the job, raises the error of a failed job"""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def to_dict(self):
+        res = {}
+        res['id'] = self.id
+        res['description'] = self.description
+        res['status'] = self.status
+        res['ready'] = self.is_ready()
+        res['created'] = self.created
+        res['started'] = self.started
+        res['finished'] = self.finished
+        if self.timings:
+            res['timings'] = self.timings
+        if self.error is not None:
+            res['error'] = str(self.error)
+        return res
+
+
+class DownloadScheduler(object):
+    """Runs download jobs on a fixed number of worker threads fed by a bounded queue."""
+
+    def __init__(self, config, info: AppInfo):
+        self.workers = config.get('workers', 2)
+        self.queue_size = config.get('queue_size', 16)
+        self.keep_jobs = config.get('keep_jobs', 100)
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+        self.stats = {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'queued': 0,
+            'running': 0,
+            'submitted': 0,
+            'rejected': 0,
+            'finished': 0,
+            'failed': 0
+        }
+        info.register('scheduler', self.stats)
+        info.metrics.gauge('yap_downloads_active', 'download jobs running', lambda: self.stats['running'])
+        info.metrics.gauge('yap_download_queue_depth', 'download jobs waiting for a worker',
+                           lambda: self.stats['queued'])
+
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f'download-worker-{i}', daemon=True)
+            t.start()
+
+    def submit(self, fn, description: str) -> Job:
+        """queue fn(job) for execution, raises QueueFullError if no more jobs are accepted"""
+        job = Job(fn, description)
+        with self._lock:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.stats['rejected'] += 1
+                raise QueueFullError(f'download queue is full ({self.queue_size} jobs)')
+            self.stats['submitted'] += 1
+            self.stats['queued'] += 1
+            self._jobs[job.id] = job
+            self._forget_old_jobs()
+        logger.debug(f"submitted job {job.id} ({description})")
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _forget_old_jobs(self):
+        # drop the oldest finished jobs, jobs still waiting or running are always kept
+        excess = len(self._jobs) - self.keep_jobs
+        for job_id in list(self._jobs.keys()):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].is_done():
+                del self._jobs[job_id]
+                excess -= 1
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self.stats['queued'] -= 1
+                self.stats['running'] += 1
+            job._run()
+            with self._lock:
+                self.stats['running'] -= 1
+                self.stats['finished' if job.status == Job.FINISHED else 'failed'] += 1
+            self._queue.task_done()
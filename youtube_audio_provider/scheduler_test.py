@@ -0,0 +1,68 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+from youtube_audio_provider.scheduler import DownloadScheduler, Job, QueueFullError
+
+
+class TestDownloadScheduler(unittest.TestCase):
+    def setUp(self):
+        self.mock_appinfo = MagicMock()
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()  # let blocked workers finish
+
+    def _create_testee(self, workers=1, queue_size=2) -> DownloadScheduler:
+        return DownloadScheduler({'workers': workers, 'queue_size': queue_size}, self.mock_appinfo)
+
+    def _blocking(self, job):
+        self.release.wait(5)
+        return 'blocked'
+
+    def test_submit_runs_job(self):
+        scheduler = self._create_testee()
+
+        job = scheduler.submit(lambda job: {'filename': 'test.mp3'}, 'test')
+
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.get_result(), {'filename': 'test.mp3'})
+        self.assertIs(scheduler.get(job.id), job)
+        self.mock_appinfo.register.assert_called_once_with('scheduler', scheduler.stats)
+
+    def test_failed_job_raises_on_get_result(self):
+        scheduler = self._create_testee()
+
+        def failing(job):
+            raise ValueError('download failed')
+
+        job = scheduler.submit(failing, 'test')
+        job.wait(5)
+
+        with self.assertRaises(ValueError):
+            job.get_result()
+        self.assertEqual(job.to_dict()['error'], 'download failed')
+
+    def test_submit_raises_when_queue_is_full(self):
+        scheduler = self._create_testee(workers=1, queue_size=1)
+        running = scheduler.submit(self._blocking, 'running')
+        while running.status == Job.QUEUED:
+            threading.Event().wait(0.01)
+        scheduler.submit(self._blocking, 'queued')
+
+        with self.assertRaises(QueueFullError):
+            scheduler.submit(self._blocking, 'rejected')
+        self.assertEqual(scheduler.stats['rejected'], 1)
+
+    def test_resolve_releases_waiters_before_job_is_done(self):
+        scheduler = self._create_testee()
+
+        def early(job):
+            job.resolve('early')
+            self.release.wait(5)
+            return 'late'
+
+        job = scheduler.submit(early, 'test')
+
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.get_result(), 'early')
+        self.assertFalse(job.is_done())
@@ -0,0 +1,87 @@
+import os
+import re
+import fcntl
+import logging
+import tempfile
+import threading
+
+from youtube_audio_provider.appinfo import AppInfo
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write(path: str, data: str | bytes, encoding: str = 'utf-8'):
+    """write the file under a temporary name and rename it, readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    (fd, tmp_path) = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        binary = isinstance(data, bytes)
+        with os.fdopen(fd, 'wb' if binary else 'w', encoding=None if binary else encoding) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class FileLock(object):
+    """Exclusive lock on a file, held across processes (and threads, every lock opens its own descriptor)."""
+
+    def __init__(self, path: str, stats: dict = None):
+        self.path = path
+        self.stats = stats
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if self.stats is not None:
+                self.stats['lock_waits'] += 1
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+
+class SharedState(object):
+    """State of the worker processes sharing one cache database and audio directory: named locks and a
+    generation counter that is bumped on every change of the cache, so the others can drop what they hold
+    in memory. The worker with index 0 is the primary, it writes the export."""
+
+    def __init__(self, config, info: AppInfo, worker_index: int = 0):
+        self.directory = config.get('lock_dir', '.locks')
+        self.poll_interval = config.get('poll_interval', 0.5)
+        self.worker_index = worker_index
+        self.is_primary = worker_index == 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._generation_file = os.path.join(self.directory, 'generation')
+
+        self._stats_lock = threading.Lock()
+        self.stats = {'worker': worker_index, 'generation': self.generation(), 'bumps': 0, 'lock_waits': 0}
+        info.register('shared_state', self.stats)
+
+    def lock(self, name: str) -> FileLock:
+        """a lock on name, e.g. the id of a download"""
+        return FileLock(os.path.join(self.directory, re.sub(r'[^\w.-]', '_', name) + '.lock'), self.stats)
+
+    def generation(self) -> int:
+        try:
+            with open(self._generation_file) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def bump(self):
+        """increment the generation, returns the generation before and after"""
+        with self.lock('generation'):
+            before = self.generation()
+            atomic_write(self._generation_file, str(before + 1))
+        with self._stats_lock:
+            self.stats['bumps'] += 1
+            self.stats['generation'] = before + 1
+        return (before, before + 1)
@@ -0,0 +1,59 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from youtube_audio_provider.shared_state import SharedState, atomic_write
+
+
+class TestSharedState(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.shared = SharedState({'lock_dir': self.tmpdir.name}, MagicMock(), 0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_bump_generation(self):
+        other = SharedState({'lock_dir': self.tmpdir.name}, MagicMock(), 1)
+
+        self.assertEqual(self.shared.bump(), (0, 1))
+        self.assertEqual(other.bump(), (1, 2))
+        self.assertEqual(self.shared.generation(), 2)
+        self.assertTrue(self.shared.is_primary)
+        self.assertFalse(other.is_primary)
+
+    def test_lock_is_exclusive(self):
+        inside = []
+
+        def hold(n):
+            with self.shared.lock('id-abc'):
+                inside.append(n)
+                self.assertEqual(len(inside), 1)
+                time.sleep(0.05)
+                inside.remove(n)
+
+        threads = [threading.Thread(target=hold, args=(n,)) for n in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(inside, [])
+        self.assertGreater(self.shared.stats['lock_waits'], 0)
+
+    def test_atomic_write_replaces_file(self):
+        path = os.path.join(self.tmpdir.name, 'out.html')
+        atomic_write(path, 'old')
+        atomic_write(path, 'new')
+
+        with open(path) as f:
+            self.assertEqual(f.read(), 'new')
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ['out.html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
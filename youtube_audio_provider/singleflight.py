@@ -0,0 +1,60 @@
+import copy
+import logging
+import threading
+
+from youtube_audio_provider.appinfo import AppInfo
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls for the same key into one execution.
+    The first caller (leader) runs the function, callers arriving while it is
+    running (followers) block and receive a copy of the leader's result."""
+
+    class _Call(object):
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self, info: AppInfo, name: str):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+        # registered once, AppInfo serializes the current values on get()
+        self.stats = {'leaders': 0, 'coalesced': 0}
+        info.register(name, self.stats)
+
+    def do(self, key, fn):
+        """run fn once for all concurrent callers of key,
+        returns a tuple (result, coalesced) where coalesced is True for followers"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = SingleFlight._Call()
+                self._calls[key] = call
+                self.stats['leaders'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            logger.debug(f"waiting for running call of {key}")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+
+        # every caller gets its own copy, callers tend to modify the result
+        return copy.copy(call.result), not leader
@@ -0,0 +1,65 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+from youtube_audio_provider.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.mock_appinfo = MagicMock()
+        self.flight = SingleFlight(self.mock_appinfo, 'singleflight.test')
+
+    def test_registers_stats(self):
+        self.mock_appinfo.register.assert_called_once_with('singleflight.test', self.flight.stats)
+
+    def test_do_returns_result_for_leader(self):
+        result, coalesced = self.flight.do('key', lambda: {'filename': 'test.mp3'})
+
+        self.assertEqual(result, {'filename': 'test.mp3'})
+        self.assertFalse(coalesced)
+        self.assertEqual(self.flight.stats, {'leaders': 1, 'coalesced': 0})
+
+    def test_do_coalesces_concurrent_calls(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {'filename': 'test.mp3'}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(self.flight.do('key', slow)))
+        leader.start()
+        started.wait(5)
+
+        followers = [threading.Thread(target=lambda: results.append(self.flight.do('key', slow))) for i in range(3)]
+        for f in followers:
+            f.start()
+        # wait until all followers are registered before releasing the leader
+        while self.flight.stats['coalesced'] < 3:
+            threading.Event().wait(0.01)
+        release.set()
+        for t in [leader] + followers:
+            t.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(sum(1 for (r, coalesced) in results if coalesced), 3)
+        for (r, coalesced) in results:
+            self.assertEqual(r, {'filename': 'test.mp3'})
+        # every caller has its own copy
+        self.assertEqual(len(set(id(r) for (r, coalesced) in results)), 4)
+
+    def test_do_propagates_error_and_forgets_key(self):
+        def failing():
+            raise ValueError('download failed')
+
+        with self.assertRaises(ValueError):
+            self.flight.do('key', failing)
+
+        result, coalesced = self.flight.do('key', lambda: 'second')
+        self.assertEqual(result, 'second')
+        self.assertFalse(coalesced)
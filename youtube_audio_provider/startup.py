@@ -0,0 +1,32 @@
+import time
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer(object):
+    """Milliseconds each phase of the startup took. Phases run until the server accepts requests, background phases
+    (e.g. loading yt_dlp in fast start) may finish later. ready_ms is the time from creation until serving."""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stats = {'phases_ms': {}, 'background_ms': {}, 'ready_ms': None}
+
+    @contextlib.contextmanager
+    def phase(self, name: str, background: bool = False):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = round((time.perf_counter() - start) * 1000, 3)
+            with self._lock:
+                self.stats['background_ms' if background else 'phases_ms'][name] = ms
+            logger.debug(f"startup phase {name} took {ms} ms")
+
+    def ready(self):
+        """the server accepts requests now"""
+        self.stats['ready_ms'] = round((time.perf_counter() - self._start) * 1000, 3)
+        logger.info(f"ready after {self.stats['ready_ms']} ms: {self.stats['phases_ms']}")
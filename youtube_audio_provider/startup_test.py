@@ -0,0 +1,31 @@
+import unittest
+from youtube_audio_provider.startup import StartupTimer
+
+
+class TestStartupTimer(unittest.TestCase):
+
+    def test_phases_are_recorded(self):
+        timer = StartupTimer()
+
+        with timer.phase('cache'):
+            pass
+        with timer.phase('yt_dlp', background=True):
+            pass
+        timer.ready()
+
+        self.assertEqual(list(timer.stats['phases_ms']), ['cache'])
+        self.assertEqual(list(timer.stats['background_ms']), ['yt_dlp'])
+        self.assertGreaterEqual(timer.stats['ready_ms'], timer.stats['phases_ms']['cache'])
+
+    def test_failed_phase_is_recorded(self):
+        timer = StartupTimer()
+
+        with self.assertRaises(ValueError):
+            with timer.phase('cache'):
+                raise ValueError('broken database')
+
+        self.assertIn('cache', timer.stats['phases_ms'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import abc
+import hashlib
+import logging
+import contextlib
+
+from werkzeug.security import safe_join
+
+logger = logging.getLogger(__name__)
+
+
+class Storage(abc.ABC):
+    """Where the audio files are kept. Files are known by their logical filename, which is also their URL below
+    /audio/, the storage maps it to the path on disk."""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+
+    def filename_for_id(self, id: str, ext: str = 'mp3') -> str:
+        """the logical filename of a new download, unique per id"""
+        return f'{id}.{ext}'
+
+    @abc.abstractmethod
+    def path(self, filename: str) -> str | None:
+        """the path of the file on disk, None if filename is not a valid name"""
+
+    def exists(self, filename: str) -> bool:
+        path = self.path(filename)
+        return path is not None and os.path.exists(path)
+
+    def put(self, source_path: str, filename: str) -> str:
+        """atomically move a completed file into the storage, returns its path"""
+        target = self.path(filename)
+        if os.path.abspath(source_path) == target:
+            return target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source_path, target)
+        return target
+
+    def remove(self, filename: str):
+        path = self.path(filename)
+        if path is not None:
+            os.remove(path)
+
+
+class FlatStorage(Storage):
+    """all files directly in the directory, named by their logical filename"""
+
+    def path(self, filename: str) -> str | None:
+        return safe_join(self.directory, filename)
+
+
+class ShardedStorage(Storage):
+    """files in two levels of subdirectories derived from the md5 of the name without extension,
+    e.g. 'ab/cd/<id>.mp3', so no directory grows beyond a few entries"""
+
+    def shard(self, filename: str) -> str:
+        digest = hashlib.md5(os.path.splitext(filename)[0].encode('utf-8')).hexdigest()
+        return os.path.join(digest[0:2], digest[2:4])
+
+    def path(self, filename: str) -> str | None:
+        if not filename or '/' in filename or '\\' in filename or filename in ('.', '..'):
+            return None
+        return os.path.join(self.directory, self.shard(filename), filename)
+
+    def remove(self, filename: str):
+        super(ShardedStorage, self).remove(filename)
+        # drop empty shard directories
+        shard_dir = os.path.dirname(self.path(filename))
+        with contextlib.suppress(OSError):
+            os.rmdir(shard_dir)
+            os.rmdir(os.path.dirname(shard_dir))
+
+
+def create_storage(config) -> Storage:
+    """the storage of the audio_path as configured by 'storage_layout' ('flat' or 'sharded')"""
+    directory = config.get('audio_path', 'audio')
+    layout = config.get('storage_layout', 'flat')
+    if layout == 'sharded':
+        return ShardedStorage(directory)
+    if layout == 'flat':
+        return FlatStorage(directory)
+    raise ValueError(f'unknown storage layout {layout}')
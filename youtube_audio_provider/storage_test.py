@@ -0,0 +1,81 @@
+import os
+import hashlib
+import tempfile
+import unittest
+
+from youtube_audio_provider.storage import Storage, FlatStorage, ShardedStorage, create_storage
+from youtube_audio_provider.migrate_storage import migrate
+
+
+class TestStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.directory = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _create_file(self, name):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(name)
+        return path
+
+    def test_flat_path(self):
+        storage = FlatStorage(self.directory)
+
+        self.assertEqual(storage.path('a.mp3'), os.path.join(self.directory, 'a.mp3'))
+        self.assertIsNone(storage.path('../a.mp3'))
+
+    def test_sharded_path(self):
+        storage = ShardedStorage(self.directory)
+        digest = hashlib.md5(b'dQw4w9WgXcQ').hexdigest()
+
+        self.assertEqual(storage.path('dQw4w9WgXcQ.mp3'),
+                         os.path.join(self.directory, digest[0:2], digest[2:4], 'dQw4w9WgXcQ.mp3'))
+        self.assertIsNone(storage.path('ab/cd.mp3'))
+        self.assertIsNone(storage.path('..'))
+
+    def test_sharded_put_and_remove(self):
+        storage = ShardedStorage(self.directory)
+        source = self._create_file('id1.mp3.part')
+
+        path = storage.put(source, 'id1.mp3')
+
+        self.assertTrue(storage.exists('id1.mp3'))
+        self.assertFalse(os.path.exists(source))
+        storage.remove('id1.mp3')
+        self.assertFalse(storage.exists('id1.mp3'))
+        self.assertFalse(os.path.exists(os.path.dirname(path)))  # empty shard removed
+
+    def test_create_storage(self):
+        self.assertIsInstance(create_storage({'audio_path': self.directory}), FlatStorage)
+        self.assertIsInstance(create_storage({'audio_path': self.directory, 'storage_layout': 'sharded'}),
+                              ShardedStorage)
+        with self.assertRaises(ValueError):
+            create_storage({'storage_layout': 'other'})
+
+    def test_storage_without_path_cannot_be_created(self):
+        class Incomplete(Storage):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete(self.directory)
+
+    def test_migrate_keeps_logical_filenames(self):
+        self._create_file('Some Title.mp3')
+        self._create_file('id2.mp3')
+        os.mkdir(os.path.join(self.directory, '.incomplete'))
+
+        result = migrate(self.directory)
+
+        storage = ShardedStorage(self.directory)
+        self.assertEqual(result, {'moved': 2, 'skipped': 0})
+        self.assertTrue(storage.exists('Some Title.mp3'))
+        self.assertTrue(storage.exists('id2.mp3'))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'id2.mp3')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,26 @@
 import os
 import time
+import mimetypes
 from threading import Thread
-from flask import Flask, send_from_directory, make_response, render_template
+from flask import Flask, make_response, render_template, request
 from flask.json import jsonify
 from werkzeug.serving import make_server
-from urllib.parse import quote, unquote_plus
+from werkzeug.wrappers import Response
+from urllib.parse import quote, unquote_plus, urlencode
 import logging
 
 from youtube_audio_provider.cache_db import Cache, Item
-from youtube_audio_provider.downloader import Downloader
+from youtube_audio_provider.downloader import Downloader, NoSearchResultError
 from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.singleflight import SingleFlight
+from youtube_audio_provider.scheduler import Job, QueueFullError
+from youtube_audio_provider.file_response import plan_file_response, make_wsgi_file_response
+from youtube_audio_provider.progressive import iter_growing_file
+from youtube_audio_provider.prefetch import Prefetcher, Batch
+from youtube_audio_provider.output_profiles import Profile, UnknownProfileError
+from youtube_audio_provider.metrics import Metrics
+from youtube_audio_provider.compression import CompressedPage, available_encodings, precompressed
+from youtube_audio_provider.job_events import iter_job_events, EVENT_STREAM_CONTENT_TYPE, EVENT_STREAM_HEADERS
 
 logger = logging.getLogger(__name__)
 
@@ -20,22 +31,50 @@ class Webserver(Thread):
     AUDIO_DIR = '/' + AUDIO_DIR_NAME + '/'
 
     def __init__(self, config, downloader: Downloader,
-                 cache: Cache, info: AppInfo):
-        """Create a new instance of the flask app"""
+                 cache: Cache, info: AppInfo, listen_socket=None):
+        """Create a new instance of the flask app, listen_socket is shared by pre-forked worker processes"""
         super(Webserver, self).__init__()
 
-        self.audio_path = config.get('audio_path', 'audio')
+        # audio files never change once written
+        self.audio_max_age = config.get('audio_max_age', 365 * 24 * 60 * 60)
 
         cache_export_config = config.get('cache_export_config', None)
         self.audio_search_callurl = cache_export_config.get('callurl', None)
         self.audio_search_prefix = cache_export_config.get('prefix', None)
-
-        # TODO calculate audio_path as seen by flask with it's root_path: self.app.root_path
-        info.register('audio_directory', os.path.abspath(self.audio_path))
+        self.export_file = cache_export_config.get('file', 'voice_cache.html')
+        self.export_json_file = cache_export_config.get('json_file', None)
+        # pages and their compressed variants, built on first request
+        self._index_page = None
+        self._audio_search_page = None
+        self.batch_max_phrases = config.get('searchv2_batch_max_phrases', 500)
+        # seconds between keepalive comments of idle event streams
+        self.event_keepalive = config.get('event_keepalive', 15)
+
+        # files are served from where the downloader stores them
+        self.storage = downloader.storage
+        self.profiles = downloader.profiles
+        info.register('audio_directory', self.storage.directory)
         self.downloader = downloader
         self.appinfo = info
         self.cache = cache
 
+        self.request_count = info.metrics.counter(
+            'yap_http_requests_total', 'http requests by route, method and status', ('route', 'method', 'status'))
+        self.request_duration = info.metrics.histogram(
+            'yap_http_request_duration_seconds', 'time until the response of a route started', ('route',))
+        self.search_results = info.metrics.counter(
+            'yap_search_results_total', 'results of searches by where they came from (cache, similar phrase, '
+            'cached id, download) or why there is none', ('by',))
+
+        # coalesce concurrent searches for the same phrase / downloads of the same id
+        self.phrase_flight = SingleFlight(info, 'singleflight.phrase')
+        self.id_flight = SingleFlight(info, 'singleflight.id')
+
+        self.prefetcher = Prefetcher(config.get('prefetch', {}), downloader.scheduler, cache, info,
+                                     fetch_phrase=lambda search, job: self._search_or_download(search, quote(search), job),
+                                     fetch_id=self._download_by_id,
+                                     resolve_playlist=downloader.resolve_playlist)
+
         self.app = Flask(__name__)
         self.app.config['port'] = config['webserver_port']
         self.app.config['app_name'] = "Youtube Audio Provider"
@@ -43,26 +82,57 @@ class Webserver(Thread):
         self.app.config['webserver_cors_allow'] = config.get('webserver_cors_allow', False)
 
         self.app.app_context().push()
-        self._server = make_server(host='0.0.0.0', port=self.app.config['port'], app=self.app, threaded=True)
+        # 'threaded': werkzeug server with a thread per connection,
+        # 'asgi': event loop serving cache hits and audio natively, downloads are awaited on an executor
+        self.mode = config.get('webserver_mode', 'threaded')
+        self._listen_socket = listen_socket
+        if (self.mode == 'asgi'):
+            # optional dependencies (uvicorn, a2wsgi), only needed in this mode
+            from youtube_audio_provider.asgi_app import AsgiApp
+            self._server = AsgiApp(self, config.get('asgi', {}))
+        else:
+            self._server = make_server(host='0.0.0.0', port=self.app.config['port'], app=self.app, threaded=True,
+                                       fd=listen_socket.fileno() if listen_socket is not None else None)
         logger.info("Starting %s on port %d\nPress CTRL-C to exit" % (self.app.config['app_name'], self.app.config['port']))
 
         # register some endpoints
         self.app.add_url_rule(rule="/", view_func=self.index, methods=['GET'])
         self.app.add_url_rule(rule="/audio_search", view_func=self.audio_search, methods=['GET'])
+        self.app.add_url_rule(rule="/export", view_func=self.export_html, methods=['GET'])
+        self.app.add_url_rule(rule="/export.json", view_func=self.export_json, methods=['GET'])
         self.app.add_url_rule(rule="/audio/<path:path>", view_func=self.audio_file, methods=['GET'])
         # allow GET, this is for simple browser deletion
         self.app.add_url_rule(rule="/delete_by_search/<string:search>",
                               view_func=self.delete_by_search, methods=['GET', 'POST'])
         self.app.add_url_rule(rule="/searchv2/<string:search>", view_func=self.searchv2, methods=['GET'])
+        self.app.add_url_rule(rule="/searchv2/batch", view_func=self.searchv2_batch, methods=['POST'])
+        self.app.add_url_rule(rule="/jobs/search/<string:search>", view_func=self.submit_search, methods=['GET', 'POST'])
+        self.app.add_url_rule(rule="/jobs/<string:job_id>", view_func=self.job_status, methods=['GET'])
+        self.app.add_url_rule(rule="/jobs/<string:job_id>/result", view_func=self.job_result, methods=['GET'])
+        self.app.add_url_rule(rule="/jobs/<string:job_id>/events", view_func=self.job_events, methods=['GET'])
+        self.app.add_url_rule(rule="/jobs/search/<string:search>/events", view_func=self.search_events,
+                              methods=['GET'])
+        self.app.add_url_rule(rule="/prefetch", view_func=self.prefetch, methods=['POST'])
+        self.app.add_url_rule(rule="/prefetch/<string:batch_id>", view_func=self.prefetch_status, methods=['GET'])
         self.app.add_url_rule(rule="/find_fulltext/<string:search>", view_func=self.find_fulltext, methods=['GET'])
         self.app.add_url_rule(rule="/exit", view_func=self.exit, methods=['GET', 'POST'])
         self.app.add_url_rule(rule="/info", view_func=self.info, methods=['GET'])
+        self.app.add_url_rule(rule="/metrics", view_func=self.metrics, methods=['GET'])
+        self.app.before_request(self._start_request_timer)
+        self.app.after_request(self._observe_request)
 
         # register default error handler
         self.app.register_error_handler(code_or_exception=404, f=self.not_found)
 
     def run(self):
-        self._server.serve_forever()
+        if (self.mode == 'asgi'):
+            self._server.serve('0.0.0.0', self.app.config['port'], self._listen_socket)
+        else:
+            self._server.serve_forever()
+
+    def stop(self):
+        """stop serving, run() returns"""
+        self._server.shutdown()
 
     def _add_cors_to_response(self, response):
         logger.debug('adding cors header')
@@ -80,18 +150,59 @@ class Webserver(Thread):
 
     def index(self):
         """Serve the main index page"""
-        return self._add_cors_to_response(send_from_directory('static', 'index.html'))
-    
+        if (self._index_page is None):
+            with open(os.path.join(self.app.root_path, 'static', 'index.html'), 'rb') as f:
+                self._index_page = CompressedPage(f.read(), 'text/html; charset=utf-8')
+        return self._add_cors_to_response(self._make_page_response(self._index_page))
+
     def audio_search(self):
         """Serve the audio_search page"""
-        config = {
-            "audio_search_callurl": self.audio_search_callurl,
-            "audio_search_prefix": self.audio_search_prefix
-        }
-        return self._make_response_and_add_cors(render_template('audio_search.html', **config))
+        if (self._audio_search_page is None):
+            # the page only depends on the configuration, it is rendered (and compressed) once
+            config = {
+                "audio_search_callurl": self.audio_search_callurl,
+                "audio_search_prefix": self.audio_search_prefix
+            }
+            self._audio_search_page = CompressedPage(render_template('audio_search.html', **config).encode('utf-8'),
+                                                     'text/html; charset=utf-8')
+        response = self._make_page_response(self._audio_search_page)
+        if (self.app.config['webserver_cors_allow']):
+            self._add_cors_to_response(response)
+        return response
+
+    def _make_page_response(self, page: CompressedPage):
+        (status, headers, body) = page.respond(request.headers)
+        response = Response(body, status=status, headers=headers, direct_passthrough=True)
+        if ('Content-Type' not in headers):
+            del response.headers['Content-Type']
+        return response
+
+    def export_html(self):
+        """the voice cache export, precompressed by Accept-Encoding"""
+        return self._serve_export(self.export_file, 'text/html; charset=utf-8')
+
+    def export_json(self):
+        """the phrases per file as json, if the export writes it"""
+        if (not self.export_json_file):
+            return self.not_found(None)
+        return self._serve_export(self.export_json_file, 'application/json')
+
+    def _serve_export(self, path, content_type):
+        (file_path, encoding) = precompressed(path, request.headers.get('Accept-Encoding'), available_encodings())
+        try:
+            # changes with every new phrase, clients revalidate with the ETag
+            plan = plan_file_response(file_path, request.headers, content_type, 0, 'no-cache')
+        except FileNotFoundError:
+            return self.not_found(None)
+        plan.headers['Vary'] = 'Accept-Encoding'
+        if (encoding is not None):
+            plan.headers['Content-Encoding'] = encoding
+        response = make_wsgi_file_response(plan, request.environ, request.method == 'HEAD')
+        return self._add_cors_to_response(response)
 
     def _exit_program(self):
         time.sleep(3)
+        self.cache.flush()
         logger.debug("shutting down")
         os._exit(0)
 
@@ -105,11 +216,80 @@ class Webserver(Thread):
     def info(self):
         return self.appinfo.get()
 
+    def metrics(self):
+        """counters and histograms in the prometheus text format"""
+        return Response(self.appinfo.metrics.render(), content_type=Metrics.CONTENT_TYPE)
+
+    def _start_request_timer(self):
+        request.environ['yap.request_start'] = time.perf_counter()
+
+    def _observe_request(self, response):
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        self.observe_request(route, request.method, response.status_code,
+                             time.perf_counter() - request.environ['yap.request_start'])
+        return response
+
+    def observe_request(self, route, method, status, seconds):
+        self.request_count.inc(route, method, str(status))
+        self.request_duration.observe(seconds, route)
+
     def audio_file(self, path):
-        """Serve files from the audio directory"""
+        """Serve files from the audio directory in the output profile of the client,
+        supports range and conditional requests"""
         logger.debug("serving file: %s" % path)
-        # TODO quickfix "../", won't work properly for other paths, rendering config audio_path unusable
-        return self._add_cors_to_response(send_from_directory("../" + self.audio_path, path))
+        if (self.storage.path(path) is None):
+            return self.not_found(None)
+
+        growing = self.downloader.progressive.get(path)
+        if (growing is not None):
+            # still being transcoded, stream it chunked until it is complete
+            logger.debug("serving growing file: %s" % path)
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response = Response(iter_growing_file(growing), mimetype=content_type, direct_passthrough=True)
+            response.headers['Cache-Control'] = 'no-store'
+            return self._add_cors_to_response(response)
+
+        try:
+            profile = self.profiles.select(request.args.get('profile'), request.headers.get('User-Agent'))
+        except UnknownProfileError as e:
+            return self._make_response_and_add_cors(jsonify({'error': str(e)}), 400)
+        try:
+            plan = self._plan_audio_file(path, request.headers, profile)
+        except FileNotFoundError:
+            return self.not_found(None)
+        except RuntimeError:
+            logger.exception(f"serving {path} in profile {profile.name} failed")
+            return self._make_response_and_add_cors(jsonify({'error': 'transcoding failed'}), 500)
+        response = make_wsgi_file_response(plan, request.environ, request.method == 'HEAD')
+        return self._add_cors_to_response(response)
+
+    def _plan_audio_file(self, path, headers, profile: Profile = None):
+        """plan the response for the file in the profile (None for the original), transcodes missing variants.
+        Raises FileNotFoundError if there is no such file"""
+        try:
+            if (profile is None):
+                file_path = self.storage.path(path)
+                content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            else:
+                file_path = self.profiles.variant(path, profile)
+                content_type = profile.mimetype
+            plan = plan_file_response(file_path, headers, content_type, self.audio_max_age)
+        except FileNotFoundError:
+            self.cache.file_missing(path)
+            raise
+        if (self.profiles.varies_by_user_agent):
+            plan.headers['Vary'] = 'User-Agent'
+        self._record_play(path, plan)
+        return plan
+
+    def _record_play(self, path, plan):
+        # players fetch a file in several range requests, only the one from the start counts as a play
+        if (plan.ranges and plan.ranges[0][0] == 0):
+            self.cache.record_access(path)
+
+    def _record_lookup(self, result):
+        # clients keep audio files for a year and replay them from their own cache, the lookups show they are used
+        self.cache.record_access(result['filename'])
 
     def delete_by_search(self, search):
         """insert a search string (one that was already given) an delete the resource backed by it."""
@@ -118,7 +298,8 @@ class Webserver(Thread):
         name_of_file_or_false = self.cache.remove_from_cache_by_search(quoted_search)
         if (name_of_file_or_false):
             logger.debug(f"attempting to delete file {name_of_file_or_false}")
-            os.remove(os.path.join(self.audio_path, name_of_file_or_false))
+            self.storage.remove(name_of_file_or_false)
+            self.profiles.remove_variants(name_of_file_or_false)
             return "ok"
 
         return self._make_response_and_add_cors(jsonify({'error': 'Not found'}), 404)
@@ -130,38 +311,309 @@ class Webserver(Thread):
         quoted_search = quote(search)
         logger.debug("searchingv2 for file: %s" % quoted_search)
 
+        result = self._find_in_cache(quoted_search)
+        if (result is None):
+            (status, result) = self._search_miss(search, quoted_search)
+            if (status != 200):
+                return self._make_response_and_add_cors(jsonify(result), status)
+
+        return self._make_result_response(result, request.args.get('profile'))
+
+    def searchv2_batch(self):
+        """look up many phrases at once, expects a json list of phrases or an object with the list 'phrases' and
+        'download': true to prefetch the misses. Returns a result per phrase in the order given, hits like searchv2,
+        misses with 'found': false, and the prefetch batch to poll if misses are downloaded"""
+        body = request.get_json(silent=True)
+        if (isinstance(body, list)):
+            body = {'phrases': body}
+        if (not isinstance(body, dict) or not isinstance(body.get('phrases'), list)
+                or not all(isinstance(p, str) and p for p in body['phrases'])):
+            return self._make_response_and_add_cors(jsonify({'error': 'expected a list of phrases'}), 400)
+        phrases = body['phrases']
+        if (len(phrases) > self.batch_max_phrases):
+            return self._make_response_and_add_cors(
+                jsonify({'error': f'at most {self.batch_max_phrases} phrases per request'}), 400)
+
+        profile = request.args.get('profile')
+        found = self.cache.retrieve_by_searches([quote(p) for p in phrases])
+        results = []
+        misses = []
+        for search in phrases:
+            quoted_search = quote(search)
+            result = found[quoted_search]
+            if (result is not None):
+                result['by'] = "cache"
+                self.search_results.inc(result['by'])
+                self._record_lookup(result)
+            else:
+                result = self._find_similar_in_cache(quoted_search)
+            if (result is None):
+                misses.append(search)
+                results.append({'phrase': search, 'found': False})
+                continue
+            result = self._add_path(result, profile)
+            result.update(phrase=search, found=True)
+            results.append(result)
+
+        response = {'results': results}
+        if (misses and body.get('download', False)):
+            response['prefetch'] = self.prefetcher.submit(phrases=misses).to_dict()
+        return self._make_response_and_add_cors(jsonify(response))
+
+    def _find_in_cache(self, quoted_search):
+        """the result for a cached phrase or a spelling variant of one, None if youtube has to be searched"""
         result = self.cache.retrieve_by_search(quoted_search)
         if (result is not None):
             logger.debug("searchingv2 found phrase in cache")
             result['by'] = "cache"
+            self.search_results.inc(result['by'])
+            self._record_lookup(result)
+            return result
 
-        else:
+        result = self._find_similar_in_cache(quoted_search)
+        if (result is None):
             logger.debug("searchingv2 not found in cache")
-            # download via youtube-dl
-            # TODO unclearness with quoted and unquoted search
-            with self.downloader.create_download_context(search) as dl_ctx:
-                id = dl_ctx.get_id()
-                result = self.cache.retrieve_by_id(id)
-                if (result is not None):
-                    logger.debug("searchingv2 found id for phrase in cache")
-                    self.cache.add_searchphrase_to_id(id, quoted_search)
-                    result['by'] = "cached id"
-
-                else:
-                    result = dl_ctx.download()
-                    if (len(result) < 1):
-                        return self._make_response_and_add_cors(jsonify({'error': 'internal error'}), 500)
-                    self.cache.put_to_cache(quoted_search, **result)
-                    result['by'] = "download"
-
-        # put together the result URL
+        return result
+
+    def _find_similar_in_cache(self, quoted_search):
+        result = self.cache.retrieve_by_similar_search(quoted_search)
+        if (result is not None):
+            # spelling variants of known phrases don't need a youtube search
+            logger.debug("searchingv2 found similar phrase in cache")
+            if (result.pop('exact', False)):
+                # only a variant of the same phrase becomes an exact hit, a similar one may be another song
+                self.cache.add_searchphrase_to_id(result['id'], quoted_search)
+            result['by'] = "similar phrase"
+            self.search_results.inc(result['by'])
+            self._record_lookup(result)
+        return result
+
+    def _search_miss(self, search, quoted_search):
+        """search and download a phrase that is not cached, blocks until the result is available.
+        Returns the status code and the result or error dict"""
+        try:
+            result, coalesced = self.phrase_flight.do(self.cache.simplify_quoted_search(quoted_search),
+                                                      lambda: self._download_in_job(search, quoted_search))
+        except QueueFullError:
+            self.search_results.inc('rejected')
+            return (429, {'error': 'too many downloads queued'})
+        except NoSearchResultError:
+            self.search_results.inc('not found')
+            return (404, {'error': 'Not found'})
+        if (coalesced):
+            logger.debug("searchingv2 joined a running search for the same phrase")
+        if (result is None):
+            self.search_results.inc('error')
+            return (500, {'error': 'internal error'})
+        self.search_results.inc(result.get('by', 'download'))
+        return (200, result)
+
+    def _add_path(self, result, profile: str = None):
+        # put together the result URL, an explicitly requested profile is kept for fetching the file
         result['path'] = self.AUDIO_DIR + result['filename']
-        return self._make_response_and_add_cors(result)
+        if (profile):
+            result['path'] += '?' + urlencode({'profile': profile})
+        return result
+
+    def _make_result_response(self, result, profile: str = None):
+        return self._make_response_and_add_cors(self._add_path(result, profile))
+
+    def _download_in_job(self, search, quoted_search):
+        """run the download on the scheduler and block until it is done"""
+        job = self.downloader.scheduler.submit(lambda job: self._search_and_download(search, quoted_search, job), search)
+        job.wait()
+        return job.get_result()
+
+    def _search_or_download(self, search, quoted_search, job: Job = None):
+        result = self._find_in_cache(quoted_search)
+        if (result is not None):
+            return result
+        return self._search_and_download(search, quoted_search, job)
+
+    def _search_and_download(self, search, quoted_search, job: Job = None):
+        """search youtube for the phrase and download the first hit unless its id is cached already,
+        returns the result dict or None if nothing could be downloaded"""
+        # download via youtube-dl
+        # TODO unclearness with quoted and unquoted search
+        with self.downloader.create_download_context(search) as dl_ctx:
+            if (job is not None):
+                dl_ctx.timings = job.timings
+                dl_ctx.on_event = job.emit
+            id = self._resolve_search(dl_ctx, quoted_search)
+            dl_ctx.emit('resolved', id=id, title=dl_ctx.get_info().get('title'))
+            result, coalesced = self.id_flight.do(id, lambda: self._retrieve_or_download_id(dl_ctx, id, quoted_search, job))
+            if (coalesced and result is not None):
+                # another phrase downloaded the same id meanwhile, remember this phrase as well
+                logger.debug("searchingv2 joined a running download for the same id")
+                self.cache.add_searchphrase_to_id(id, quoted_search)
+                result['by'] = "cached id"
+            return result
+
+    def _resolve_search(self, dl_ctx, quoted_search) -> str:
+        """the id of the first youtube hit for the phrase, a recent search result is reused"""
+        resolved = self.cache.retrieve_resolution(quoted_search)
+        if (resolved is not None):
+            if (resolved['id'] is not None):
+                logger.debug("searchingv2 found search result for phrase")
+                return dl_ctx.set_resolved_info(resolved)
+            if (resolved['error'] is None):
+                raise NoSearchResultError(f'nothing found for {quoted_search} recently')
+            raise RuntimeError(f"search for {quoted_search} failed recently: {resolved['error']}")
+
+        try:
+            id = self.downloader.run_stage('resolve', dl_ctx.get_id, dl_ctx.timings)
+        except NoSearchResultError:
+            self.cache.put_resolution(quoted_search, None)
+            raise
+        except Exception as e:
+            self.cache.put_resolution(quoted_search, None, str(e) or type(e).__name__)
+            raise
+        self.cache.put_resolution(quoted_search, dl_ctx.get_info())
+        return id
+
+    def _download_by_id(self, id, job: Job = None):
+        """download a known id, its title is used as search phrase"""
+        with self.downloader.create_download_context(id) as dl_ctx:
+            if (job is not None):
+                dl_ctx.timings = job.timings
+                dl_ctx.on_event = job.emit
+            self.downloader.run_stage('resolve', lambda: dl_ctx.resolve_id(id), dl_ctx.timings)
+            dl_ctx.emit('resolved', id=id, title=dl_ctx.get_info().get('title'))
+            quoted_title = quote(dl_ctx.get_info().get('title') or id)
+            result, coalesced = self.id_flight.do(id, lambda: self._retrieve_or_download_id(dl_ctx, id, quoted_title, job))
+            return result
+
+    def _retrieve_or_download_id(self, dl_ctx, id, quoted_search, job: Job = None):
+        result = self._retrieve_id(id, quoted_search)
+        if (result is not None):
+            return result
+        with self.downloader.lock_id(id):
+            # another worker process may have downloaded it while waiting for the lock
+            result = self._retrieve_id(id, quoted_search)
+            if (result is not None):
+                return result
+            return self._download_id(dl_ctx, quoted_search, job)
+
+    def _retrieve_id(self, id, quoted_search):
+        result = self.cache.retrieve_by_id(id)
+        if (result is not None):
+            logger.debug("searchingv2 found id for phrase in cache")
+            self.cache.add_searchphrase_to_id(id, quoted_search)
+            result['by'] = "cached id"
+        return result
+
+    def _download_id(self, dl_ctx, quoted_search, job: Job = None):
+        if (self.downloader.progressive_enabled and job is not None):
+            def on_ready(info):
+                # release the waiting request, the file is served while it grows
+                job.resolve(dict(info, by="download", progressive=True))
+            result = dl_ctx.download_progressive(self.downloader.progressive, on_ready,
+                                                 self.downloader.progressive_min_bytes)
+        else:
+            result = self.downloader.download(dl_ctx)
+        if (len(result) < 1):
+            return None
+        self.downloader.run_stage('register', lambda: self.cache.put_to_cache(quoted_search, **result),
+                                  dl_ctx.timings)
+        dl_ctx.emit('registered', filename=result.get('filename'))
+        result['by'] = "download"
+        return result
+
+    def submit_search(self, search):
+        """queue a search (and download) of the string, returns the job to poll"""
+        try:
+            job = self._submit_search_job(search)
+        except QueueFullError:
+            return self._make_response_and_add_cors(jsonify({'error': 'too many downloads queued'}), 429)
+        return self._make_response_and_add_cors(jsonify(job.to_dict()), 202)
+
+    def _submit_search_job(self, search) -> Job:
+        quoted_search = quote(search)
+        logger.debug("submitting search for: %s" % quoted_search)
+        return self.downloader.scheduler.submit(lambda job: self._search_or_download(search, quoted_search, job),
+                                                search)
+
+    def search_events(self, search):
+        """queue a search (and download) of the string and stream its progress as server-sent events"""
+        try:
+            job = self._submit_search_job(search)
+        except QueueFullError:
+            return self._make_response_and_add_cors(jsonify({'error': 'too many downloads queued'}), 429)
+        return self._make_event_stream_response(self.job_event_stream(job, 0))
+
+    def job_events(self, job_id):
+        """the progress of a job as server-sent events: status, resolved id, download bytes and speed, transcode,
+        cache registration and finally the result, the stream ends when the job is done"""
+        job: Job = self.downloader.scheduler.get(job_id)
+        if (job is None):
+            return self._make_response_and_add_cors(jsonify({'error': 'Not found'}), 404)
+        last_event_id = request.headers.get('Last-Event-ID', '0')
+        return self._make_event_stream_response(
+            self.job_event_stream(job, int(last_event_id) if last_event_id.isdigit() else 0))
+
+    def job_event_stream(self, job: Job, last_event_id: int):
+        return iter_job_events(job, self._job_result, last_event_id, self.event_keepalive)
+
+    def _make_event_stream_response(self, events):
+        response = Response(events, content_type=EVENT_STREAM_CONTENT_TYPE, direct_passthrough=True)
+        response.headers.update(EVENT_STREAM_HEADERS)
+        return self._add_cors_to_response(response)
+
+    def job_status(self, job_id):
+        job: Job = self.downloader.scheduler.get(job_id)
+        if (job is None):
+            return self._make_response_and_add_cors(jsonify({'error': 'Not found'}), 404)
+        return self._make_response_and_add_cors(jsonify(job.to_dict()))
+
+    def job_result(self, job_id):
+        """the result of a job, same as searchv2 returns, or the job status while it is not ready"""
+        job: Job = self.downloader.scheduler.get(job_id)
+        if (job is None):
+            return self._make_response_and_add_cors(jsonify({'error': 'Not found'}), 404)
+        if (not job.is_ready()):
+            return self._make_response_and_add_cors(jsonify(job.to_dict()), 202)
+        (status, result) = self._job_result(job)
+        return self._make_response_and_add_cors(jsonify(result), status)
+
+    def _job_result(self, job: Job):
+        """status code and result or error dict of a ready job"""
+        if (isinstance(job.error, NoSearchResultError)):
+            return (404, {'error': 'Not found'})
+        if (job.error is not None or job.result is None):
+            return (500, {'error': 'internal error'})
+        return (200, self._add_path(dict(job.result)))
+
+    def prefetch(self):
+        """warm the cache in the background, expects a json object with lists 'phrases', 'ids' and 'playlists'
+        (or just a list of phrases), returns the batch to poll"""
+        body = request.get_json(silent=True)
+        if (isinstance(body, list)):
+            body = {'phrases': body}
+        if (not isinstance(body, dict)):
+            return self._make_response_and_add_cors(jsonify({'error': 'expected a json object or list'}), 400)
+        for key in ('phrases', 'ids', 'playlists'):
+            values = body.get(key)
+            if (values is not None and (not isinstance(values, list)
+                                        or not all(isinstance(v, str) and v for v in values))):
+                return self._make_response_and_add_cors(
+                    jsonify({'error': f"expected '{key}' to be a list of non-empty strings"}), 400)
+
+        batch = self.prefetcher.submit(body.get('phrases'), body.get('ids'), body.get('playlists'))
+        return self._make_response_and_add_cors(jsonify(batch.to_dict()), 202)
+
+    def prefetch_status(self, batch_id):
+        batch: Batch = self.prefetcher.get(batch_id)
+        if (batch is None):
+            return self._make_response_and_add_cors(jsonify({'error': 'Not found'}), 404)
+        return self._make_response_and_add_cors(jsonify(batch.to_dict()))
 
     def find_fulltext(self, search):
         quoted_search = quote(search)
         results = []
-        search_result = self.cache.fulltext_search(quoted_search)
+        # sqlite takes a negative limit as no limit
+        limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+        offset = max(0, request.args.get('offset', 0, type=int))
+        search_result = self.cache.fulltext_search(quoted_search, limit, offset)
         item: Item
         for item in search_result:
             result = {}
@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from youtube_audio_provider.appinfo import AppInfo
+from youtube_audio_provider.scheduler import DownloadScheduler
+from youtube_audio_provider.storage import FlatStorage
+from youtube_audio_provider.webserver import Webserver
+
+
+class TestWebserver(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        info = AppInfo()
+        downloader = MagicMock()
+        downloader.storage = FlatStorage(self.tmpdir.name)
+        downloader.scheduler = DownloadScheduler({}, info)
+        self.webserver = Webserver({'webserver_port': 0, 'cache_export_config': {}}, downloader, MagicMock(), info)
+        self.client = self.webserver.app.test_client()
+
+    def tearDown(self):
+        self.webserver._server.server_close()
+        self.tmpdir.cleanup()
+
+    def _fake_search(self, search, quoted_search, job=None):
+        job.emit('resolved', id='abc')
+        return {'filename': 'abc.mp3', 'by': 'download'}
+
+    def test_search_events_stream_until_the_result(self):
+        self.webserver._search_or_download = self._fake_search
+
+        response = self.client.get('/jobs/search/some%20song/events')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content_type, 'text/event-stream; charset=utf-8')
+        body = response.get_data(as_text=True)
+        self.assertIn('event: resolved\ndata: {"id": "abc"}', body)
+        self.assertIn('event: result\n', body)
+        self.assertIn('"path": "/audio/abc.mp3"', body)
+
+    def test_job_events_with_last_event_id_beyond_the_events_end(self):
+        self.webserver._search_or_download = self._fake_search
+        job = self.webserver._submit_search_job('some song')
+        job.wait()
+
+        response = self.client.get(f'/jobs/{job.id}/events', headers={'Last-Event-ID': '99'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.get_data(as_text=True).startswith('event: result\n'))
+
+    def test_prefetch_rejects_lists_of_other_than_strings(self):
+        for body in (['a phrase', 3], {'ids': 'abc'}, {'playlists': ['']}, {'phrases': [None]}):
+            response = self.client.post('/prefetch', json=body)
+
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_similar_phrase_is_not_saved(self):
+        self.webserver.cache.retrieve_by_search.return_value = None
+        self.webserver.cache.retrieve_by_similar_search.return_value = \
+            {'id': '21', 'filename': '21.mp3', 'exact': False}
+
+        result = self.webserver._find_in_cache('mozart%20piano%20concerto%20no%2023')
+
+        self.assertEqual(result['by'], 'similar phrase')
+        self.assertNotIn('exact', result)
+        self.webserver.cache.add_searchphrase_to_id.assert_not_called()
+
+    def test_variant_of_the_same_phrase_is_saved(self):
+        self.webserver.cache.retrieve_by_search.return_value = None
+        self.webserver.cache.retrieve_by_similar_search.return_value = {'id': '1', 'filename': '1.mp3', 'exact': True}
+
+        self.webserver._find_in_cache('rhapsody%20bohemian')
+
+        self.webserver.cache.add_searchphrase_to_id.assert_called_once_with('1', 'rhapsody%20bohemian')
+
+    def test_cache_hits_count_as_access(self):
+        self.webserver.cache.retrieve_by_search.return_value = {'filename': 'abc.mp3'}
+
+        self.webserver._find_in_cache('some%20song')
+
+        self.webserver.cache.record_access.assert_called_once_with('abc.mp3')
+
+    def test_batch_hits_count_as_access(self):
+        self.webserver.cache.retrieve_by_searches.return_value = {'a': {'filename': 'a.mp3'}, 'b': None}
+        self.webserver.cache.retrieve_by_similar_search.return_value = None
+
+        response = self.client.post('/searchv2/batch', json=['a', 'b'])
+
+        self.assertEqual(response.status_code, 200)
+        self.webserver.cache.record_access.assert_called_once_with('a.mp3')
+
+    def test_find_fulltext_limit_is_bounded(self):
+        self.webserver.cache.fulltext_search.return_value = []
+
+        self.client.get('/find_fulltext/queen?limit=-1')
+        self.client.get('/find_fulltext/queen?limit=100000')
+
+        self.assertEqual([c.args[1] for c in self.webserver.cache.fulltext_search.call_args_list], [1, 500])
+
+    def test_find_fulltext_offset_is_not_negative(self):
+        self.webserver.cache.fulltext_search.return_value = []
+
+        self.client.get('/find_fulltext/queen?offset=-5')
+
+        self.webserver.cache.fulltext_search.assert_called_once_with('queen', 50, 0)
@@ -0,0 +1,103 @@
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+from youtube_audio_provider.appinfo import AppInfo
+
+logger = logging.getLogger(__name__)
+
+
+class PooledYoutubeDL(object):
+    """A YoutubeDL instance of a pool. Its hooks report to the current owner (the borrowing download context)."""
+
+    def __init__(self):
+        self.ydl = None
+        self.owner = None
+        self.uses = 0
+        self.created = time.monotonic()
+        self.healthy = True
+
+
+class YoutubeDLPool(object):
+    """Keeps up to size idle YoutubeDL instances for reuse, so extractor setup, cookie and cache loading
+    are not paid per request. An instance is used by one thread at a time and is recycled after
+    max_uses uses, after max_age seconds or after a use that failed."""
+
+    def __init__(self, factory, size: int, max_uses: int, max_age: float, info: AppInfo = None, name: str = None):
+        # factory(pooled) -> YoutubeDL, hooks of the instance may refer to pooled.owner
+        self.factory = factory
+        self.size = size
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self._idle = queue.LifoQueue()  # most recently used first, keeps few instances warm
+
+        self._lock = threading.Lock()
+        self.stats = {'size': size, 'idle': 0, 'created': 0, 'reused': 0, 'recycled': 0}
+        if info is not None:
+            info.register(name, self.stats)
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _create(self) -> PooledYoutubeDL:
+        pooled = PooledYoutubeDL()
+        pooled.ydl = self.factory(pooled)
+        self._count('created')
+        return pooled
+
+    def _is_usable(self, pooled: PooledYoutubeDL) -> bool:
+        return (pooled.healthy
+                and pooled.uses < self.max_uses
+                and time.monotonic() - pooled.created < self.max_age)
+
+    def _close(self, pooled: PooledYoutubeDL):
+        self._count('recycled')
+        try:
+            pooled.ydl.__exit__(None, None, None)
+        except Exception:
+            logger.exception("closing YoutubeDL instance failed")
+
+    def prewarm(self, count: int):
+        """create instances ahead of their first use"""
+        for i in range(min(count, self.size) - self._idle.qsize()):
+            self._idle.put(self._create())
+            self._count('idle')
+
+    def borrow(self, owner) -> PooledYoutubeDL:
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                pooled = self._create()
+                break
+            self._count('idle', -1)
+            if self._is_usable(pooled):
+                self._count('reused')
+                break
+            self._close(pooled)
+        pooled.owner = owner
+        return pooled
+
+    def give_back(self, pooled: PooledYoutubeDL, ok: bool = True):
+        pooled.owner = None
+        pooled.uses += 1
+        pooled.healthy = pooled.healthy and ok
+        if self._is_usable(pooled) and self._idle.qsize() < self.size:
+            self._idle.put(pooled)
+            self._count('idle')
+        else:
+            self._close(pooled)
+
+    @contextmanager
+    def lease(self, owner):
+        """borrow an instance for the with block, a raised exception marks it unhealthy"""
+        pooled = self.borrow(owner)
+        ok = False
+        try:
+            yield pooled.ydl
+            ok = True
+        finally:
+            self.give_back(pooled, ok)
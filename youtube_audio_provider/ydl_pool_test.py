@@ -0,0 +1,78 @@
+import unittest
+from unittest.mock import MagicMock
+
+from youtube_audio_provider.ydl_pool import YoutubeDLPool
+
+
+class TestYoutubeDLPool(unittest.TestCase):
+
+    def setUp(self):
+        self.factory = MagicMock(side_effect=lambda pooled: MagicMock())
+
+    def test_reuses_returned_instance(self):
+        pool = YoutubeDLPool(self.factory, 2, 10, 3600)
+
+        with pool.lease('first') as ydl1:
+            pass
+        with pool.lease('second') as ydl2:
+            pass
+
+        self.assertIs(ydl1, ydl2)
+        self.assertEqual(self.factory.call_count, 1)
+        self.assertEqual(pool.stats['reused'], 1)
+
+    def test_concurrent_borrowers_get_own_instances(self):
+        pool = YoutubeDLPool(self.factory, 2, 10, 3600)
+
+        first = pool.borrow('a')
+        second = pool.borrow('b')
+
+        self.assertIsNot(first.ydl, second.ydl)
+        self.assertEqual(first.owner, 'a')
+        self.assertEqual(second.owner, 'b')
+
+    def test_recycles_after_max_uses(self):
+        pool = YoutubeDLPool(self.factory, 1, 2, 3600)
+
+        instances = []
+        for i in range(3):
+            with pool.lease(i) as ydl:
+                instances.append(ydl)
+
+        self.assertIs(instances[0], instances[1])
+        self.assertIsNot(instances[1], instances[2])
+        instances[0].__exit__.assert_called_once()
+
+    def test_failed_use_is_not_reused(self):
+        pool = YoutubeDLPool(self.factory, 1, 10, 3600)
+
+        with self.assertRaises(ValueError):
+            with pool.lease('a'):
+                raise ValueError('broken')
+        with pool.lease('b'):
+            pass
+
+        self.assertEqual(self.factory.call_count, 2)
+        self.assertEqual(pool.stats['recycled'], 1)
+
+    def test_size_zero_never_keeps(self):
+        pool = YoutubeDLPool(self.factory, 0, 10, 3600)
+
+        pooled = pool.borrow('a')
+        pool.give_back(pooled)
+
+        self.assertIsNone(pooled.owner)
+        self.assertEqual(pool.stats['idle'], 0)
+        pooled.ydl.__exit__.assert_called_once()
+
+    def test_prewarm(self):
+        pool = YoutubeDLPool(self.factory, 2, 10, 3600)
+
+        pool.prewarm(5)
+
+        self.assertEqual(self.factory.call_count, 2)
+        self.assertEqual(pool.stats['idle'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()